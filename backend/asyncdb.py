@@ -0,0 +1,87 @@
+"""Async database mode: requests are served through an AsyncSession on aiosqlite or asyncpg.
+
+Route bodies stay plain functions over a sync Session, so both modes share one implementation.
+session_route() builds a route class that turns every endpoint depending on the sync session
+into an async endpoint running its body with AsyncSession.run_sync: statements are awaited on the
+event loop instead of holding one of Starlette's threadpool threads for the whole request.
+"""
+import functools
+import inspect
+
+from fastapi import Depends
+from fastapi.params import Depends as DependsParam
+from sqlalchemy.engine import make_url
+import observability
+import sqlitedb
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+class RunSyncSession(sqlitedb.RoutingSession):
+    """The Session run_sync hands to route bodies; its own class so session events can target it."""
+
+
+def async_url(url):
+    """The async-driver form of a sync database URL, and the connect_args it needs."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"DB_MODE=async has no driver for {backend}")
+    connect_args = {}
+    if backend == "postgresql" and "sslmode" in url.query:
+        # asyncpg takes ssl=, not libpq's sslmode=
+        connect_args["ssl"] = url.query["sslmode"]
+        url = url.difference_update_query(["sslmode"])
+    return url.set(drivername=ASYNC_DRIVERS[backend]), connect_args
+
+
+def create_session_factory(url, sqlite_pragmas=None, **engine_options):
+    """Return (async engine, async read engine, async sessionmaker) for a sync database URL.
+
+    The read engine is None unless `sqlite_pragmas` asks for sqlitedb's writer/reader split.
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    url, connect_args = async_url(url)
+    if sqlite_pragmas is not None:
+        engine, reader = sqlitedb.create_engines(create_async_engine, url, sqlite_pragmas, connect_args=connect_args, **engine_options)
+    else:
+        engine, reader = create_async_engine(url, connect_args=connect_args, **engine_options), None
+    return engine, reader, async_sessionmaker(engine, autoflush=False, sync_session_class=RunSyncSession, reader=reader and reader.sync_engine)
+
+
+def session_route(sync_dependency, async_dependency):
+    """Route class serving endpoints that depend on `sync_dependency` through `async_dependency`."""
+
+    class AsyncSessionRoute(observability.ProfiledRoute):
+        def __init__(self, path, endpoint, **kwargs):
+            name = _session_parameter(endpoint, sync_dependency)
+            if name is not None:
+                endpoint = _run_sync(observability.profiled(endpoint), name, async_dependency)
+            super().__init__(path, endpoint, **kwargs)
+
+    return AsyncSessionRoute
+
+
+def _session_parameter(endpoint, dependency):
+    if inspect.iscoroutinefunction(endpoint):
+        return None
+    for name, param in inspect.signature(endpoint).parameters.items():
+        if isinstance(param.default, DependsParam) and param.default.dependency is dependency:
+            return name
+    return None
+
+
+def _run_sync(endpoint, name, async_dependency):
+    signature = inspect.signature(endpoint)
+
+    @functools.wraps(endpoint)
+    async def run(**kwargs):
+        db = kwargs.pop(name)
+        return await db.run_sync(lambda session: endpoint(**kwargs, **{name: session}))
+
+    run.__signature__ = signature.replace(parameters=[
+        param.replace(default=Depends(async_dependency)) if param.name == name else param
+        for param in signature.parameters.values()
+    ])
+    return run
@@ -0,0 +1 @@
+"""Benchmarks and data generation for the backend; run the modules with python -m from backend/."""
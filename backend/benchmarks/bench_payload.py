@@ -0,0 +1,77 @@
+"""Compare dashboard payload size and encode time across response paths.
+
+"jsonable_encoder" is FastAPI's default for a returned dict (jsonable_encoder, then JSONResponse);
+"json" and "orjson" are FastJSONResponse's encoders; "columns" is the layout=columns form of the lists.
+Compressed sizes and times are measured on top of each encoded body.
+
+Usage (from backend/):
+    python -m benchmarks.bench_payload [--scale medium] [--groups 1] [--repeat 20]
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks import datagen
+
+
+def timed(fn, repeat):
+    """(result, median milliseconds) of calling fn() `repeat` times."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_payload")
+    datagen.add_arguments(parser)
+    parser.set_defaults(scale="medium", groups=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="hisab-payload-"), "payload.db")
+    import main as app_main
+    import payload
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    data = datagen.generate(app_main, datagen.config_from_args(args))
+    db = app_main.SessionLocal()
+    try:
+        gid = data.groups[0]
+        version = db.query(app_main.DBGroupLedger.version).filter(app_main.DBGroupLedger.group_id == gid).scalar()
+        dashboard = app_main.build_dashboard(db, (gid, version, None, True))
+    finally:
+        db.close()
+    columns = {**dashboard, **{name: payload.columnar(dashboard[name], app_main.EXPORT_FIELDS[kind]) for name, kind in app_main.DASHBOARD_LISTS.items()}}
+    print(f"dashboard of {len(dashboard['users'])} members: {len(dashboard['raw_expenses'])} expenses, {len(dashboard['meals'])} meals, {len(dashboard['funds'])} funds")
+
+    stdlib = lambda content: json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+    encoders = [("jsonable_encoder", lambda content: JSONResponse(jsonable_encoder(content)).body), ("json", stdlib)]
+    if payload.orjson is not None:
+        encoders.append(("orjson", payload.orjson.dumps))
+    codings = [("gzip", lambda body: gzip.compress(body, payload.GZIP_LEVEL, mtime=0))]
+    if payload.brotli is not None:
+        codings.append(("br", lambda body: payload.brotli.compress(body, quality=payload.BROTLI_QUALITY)))
+
+    print(f"{'encoder':<18}{'layout':<9}{'bytes':>11}{'encode ms':>11}" + "".join(f"{name + ' bytes':>13}{name + ' ms':>10}" for name, _ in codings))
+    for layout, content in [("rows", dashboard), ("columns", columns)]:
+        for name, encode in encoders:
+            body, encode_ms = timed(lambda: encode(content), args.repeat)
+            line = f"{name:<18}{layout:<9}{len(body):>11,}{encode_ms:>11.2f}"
+            for _, compress in codings:
+                compressed, compress_ms = timed(lambda: compress(body), args.repeat)
+                line += f"{len(compressed):>13,}{compress_ms:>10.2f}"
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
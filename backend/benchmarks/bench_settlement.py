@@ -0,0 +1,87 @@
+"""Property checks and micro-benchmarks for settlement.settle().
+
+Both modes are checked and timed on the same balances; cancel_exact must never need more transfers.
+
+Usage (from backend/):
+    python -m benchmarks.bench_settlement [--sizes 10 1000 100000] [--checks 500] [--seed 1]
+"""
+import argparse
+import random
+import sys
+import time
+
+from settlement import settle, to_cents, unsettled
+
+
+def random_balances(rng, size, zero_sum=True):
+    balances = {f"u{i}": rng.randint(-500_000, 500_000) for i in range(size)}
+    if zero_sum and balances:
+        balances["u0"] -= sum(balances.values())
+    return balances
+
+
+def check(balances, cancel_exact):
+    transfers = settle(balances, cancel_exact)
+    remaining = dict(balances)
+    for debtor, creditor, cents in transfers:
+        assert isinstance(cents, int) and cents > 0, (debtor, creditor, cents)
+        assert balances[debtor] < 0 < balances[creditor], (debtor, creditor)
+        remaining[debtor] += cents
+        remaining[creditor] -= cents
+    assert sum(remaining.values()) == unsettled(balances)
+    nonzero = [uid for uid, cents in remaining.items() if cents]
+    if unsettled(balances) == 0:
+        assert not nonzero, "zero-sum balances must settle completely"
+    else:
+        # What can't be settled stays on one side only
+        assert len({remaining[uid] > 0 for uid in nonzero}) <= 1
+    assert len(transfers) <= max(len([b for b in balances.values() if b]) - 1, 0)
+    return len(transfers)
+
+
+def run_checks(rng, count):
+    for _ in range(count):
+        size = rng.randint(0, 40)
+        balances = random_balances(rng, size, zero_sum=rng.random() < 0.8)
+        if size and rng.random() < 0.3:
+            # Exact opposite pairs and tiny balances are the edge cases of the matching
+            for i in range(0, size - 1, 2):
+                balances[f"u{i + 1}"] = -balances[f"u{i}"]
+            balances[f"u{size - 1}"] = rng.choice([1, -1, 0])
+        plain = check(balances, cancel_exact=False)
+        exact = check(balances, cancel_exact=True)
+        assert exact <= plain, f"cancel_exact made {exact} transfers where greedy made {plain}: {balances}"
+    assert to_cents(0.1 + 0.2) == 30 and to_cents(-1.005) == -101 and to_cents(2.675) == 268
+    print(f"property checks: {count * 2} settlements ok")
+
+
+def bench(balances, cancel_exact):
+    size = len(balances)
+    repeat = max(1, 20_000 // max(size, 1))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        transfers = settle(balances, cancel_exact)
+    elapsed = (time.perf_counter() - start) / repeat
+    mode = "cancel_exact" if cancel_exact else "greedy"
+    print(f"{size:>8} members  {mode:<12} {elapsed * 1000:10.3f} ms  {len(transfers):>8} transfers")
+    return len(transfers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_settlement")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--checks", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    run_checks(rng, args.checks)
+    for size in args.sizes:
+        balances = random_balances(rng, size)
+        counts = [bench(balances, cancel_exact) for cancel_exact in (False, True)]
+        assert counts[1] <= counts[0], f"cancel_exact made {counts[1]} transfers where greedy made {counts[0]}"
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
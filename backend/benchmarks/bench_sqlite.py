@@ -0,0 +1,128 @@
+"""Concurrent read/write load against a SQLite file, with and without the tuned profile (SQLITE_TUNED).
+
+Reader threads fetch dashboards and expense pages while writer threads add meals and expenses, all for
+the same fixed time. Every write moves the group's ledger version, so the dashboards are really
+recomputed instead of served from the cache. Each profile gets its own copy of the same generated
+database and runs in a fresh interpreter, since the profile is chosen when the app is imported.
+Errors are 5xx responses, which is how "database is locked" shows up.
+
+Usage (from backend/):
+    python -m benchmarks.bench_sqlite [--readers 8] [--writers 4] [--seconds 10] [--scale small]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import datagen
+from benchmarks.run import percentile
+
+
+def child(readers, writers, seconds):
+    import main
+    from fastapi.testclient import TestClient
+
+    data = datagen.load(main)
+    day = itertools.count(1)
+    samples = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def read(client, rng):
+        gid = rng.choice(data.groups)
+        if rng.random() < 0.5:
+            return client.get(f"/api/groups/{gid}/dashboard")
+        return client.get(f"/api/groups/{gid}/expenses?limit=50")
+
+    def write(client, rng):
+        gid = rng.choice(data.groups)
+        uid = rng.choice(data.members[gid])
+        # After the generated history, so no write lands in a closed period
+        date = (data.last_date + datetime.timedelta(days=next(day))).isoformat()
+        if rng.random() < 0.5:
+            return client.post(f"/api/groups/{gid}/meals", json={"group_id": gid, "user_id": uid, "date": date, "lunch": 1, "dinner": 1})
+        return client.post(f"/api/groups/{gid}/expenses", json={"group_id": gid, "user_id": uid, "amount": round(rng.uniform(50, 2000), 2), "category": "Bazar", "date": date, "items": "load"})
+
+    def worker(kind, call, seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            status = call(client, rng).status_code
+            elapsed = time.perf_counter() - began
+            with lock:
+                samples[kind].append(elapsed)
+                if status >= 500:
+                    errors[kind] += 1
+
+    with TestClient(main.app, raise_server_exceptions=False) as client:
+        threads = [threading.Thread(target=worker, args=("read", read, i)) for i in range(readers)]
+        threads += [threading.Thread(target=worker, args=("write", write, readers + i)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    result = {}
+    for kind in ["read", "write"]:
+        latencies = samples[kind] or [0.0]
+        result[kind] = {
+            "per_second": round(len(samples[kind]) / seconds, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "errors": errors[kind],
+        }
+    print(json.dumps(result))
+
+
+def run_once(source, tuned, args):
+    database = os.path.join(os.path.dirname(source), f"tuned{tuned}.db")
+    shutil.copy(source, database)
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + database, SQLITE_TUNED=tuned)
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, "-m", "benchmarks.bench_sqlite", "--child", "--readers", str(args.readers), "--writers", str(args.writers), "--seconds", str(args.seconds)]
+    out = subprocess.run(command, cwd=backend, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_sqlite")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--readers", type=int, default=8, help="Reader threads")
+    parser.add_argument("--writers", type=int, default=4, help="Writer threads")
+    parser.add_argument("--seconds", type=float, default=10)
+    datagen.add_arguments(parser)
+    parser.set_defaults(scale="small")
+    args = parser.parse_args(argv)
+    if args.child:
+        child(args.readers, args.writers, args.seconds)
+        return 0
+
+    # Generated with the plain profile, so the untuned run starts from a rollback-journal file
+    source = os.path.join(tempfile.mkdtemp(prefix="hisab-sqlite-"), "source.db")
+    os.environ.update(DATABASE_URL="sqlite:///" + source, SQLITE_TUNED="0")
+    import main as app_main
+    datagen.generate(app_main, datagen.config_from_args(args))
+    app_main.engine.dispose()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile")
+    print(f"{'SQLITE_TUNED':<14}{'op':<7}{'per sec':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for tuned in ["0", "1"]:
+        result = run_once(source, tuned, args)
+        for kind in ["read", "write"]:
+            r = result[kind]
+            print(f"{tuned:<14}{kind:<7}{r['per_second']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['errors']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
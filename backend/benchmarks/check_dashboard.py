@@ -0,0 +1,194 @@
+"""Compare the dashboard with the original, pre-ledger computation on generated data.
+
+baseline_dashboard() is the dashboard as the app first computed it: every expense, meal and fund of
+the group loaded and summed in Python with floats. The current endpoint reads materialized totals,
+keeps money as Decimal and settles balances in whole cents, so the payload is no longer byte-identical.
+What changed on purpose, and is checked as such:
+
+- summary money totals are rounded to cents (the baseline could send 6748.149999999999);
+- settlements come from settlement.settle (user-011), computed in whole cents, and may pair members
+  differently; they must clear the same balances with no more transfers than the baseline's greedy pass;
+- "users" and the detail lists (raw_expenses, meals, funds) may come in a different order, and detail
+  amounts are cents-exact Decimals rendered as floats.
+
+Everything else must match: meal rate, meals per member, each member's balance, status, role and
+title, and the set of rows in the detail lists.
+
+Usage (from backend/):
+    python -m benchmarks.check_dashboard [--scale tiny]
+
+Exits with 1 on any difference not listed above.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from collections import defaultdict
+
+from benchmarks import datagen
+
+CENT = 0.011  # float sums of the baseline against cents-exact Decimals
+
+
+def baseline_transfer_count(balances):
+    """How many transfers the original greedy settlement made for `balances`."""
+    debtors = sorted((-amt for amt in balances.values() if amt < -0.01), reverse=True)
+    creditors = sorted((amt for amt in balances.values() if amt > 0.01), reverse=True)
+    count, i, j = 0, 0, 0
+    while i < len(debtors) and j < len(creditors):
+        amount = min(debtors[i], creditors[j])
+        count += 1
+        debtors[i] -= amount
+        creditors[j] -= amount
+        if debtors[i] < 0.01: i += 1
+        if creditors[j] < 0.01: j += 1
+    return count
+
+
+def baseline_dashboard(group):
+    """The original calculate_dashboard_metrics over ORM collections, with the settlement list reduced to its length."""
+    members = group.members
+    expenses = group.expenses
+    meals = group.meals
+    amount = lambda row: float(row.amount)
+
+    total_bazar = sum(amount(e) for e in expenses if e.category.startswith('Bazar'))
+    total_meals = sum(m.breakfast + m.lunch + m.dinner + m.guest_meal_count for m in meals)
+    meal_rate = round(total_bazar / total_meals, 2) if total_meals > 0 else 0.0
+    fixed_expenses = sum(amount(e) for e in expenses if e.category in ['Rent', 'Utilities'])
+
+    balances = defaultdict(float)
+    for e in expenses:
+        balances[e.user_id] += amount(e)
+    if group.group_type == "monthly_avg":
+        total_expenses = sum(amount(e) for e in expenses)
+        if members:
+            for m in members:
+                balances[m.id] -= total_expenses / len(members)
+    else:
+        for m in meals:
+            balances[m.user_id] -= (m.breakfast + m.lunch + m.dinner + m.guest_meal_count) * meal_rate
+        if members:
+            for m in members:
+                balances[m.id] -= fixed_expenses / len(members)
+    for f in group.funds:
+        balances[f.user_id] += amount(f)
+        if group.manager_id:
+            balances[group.manager_id] -= amount(f)
+
+    balances_rounded = {uid: round(amt, 2) for uid, amt in balances.items()}
+    for member in members:
+        balances_rounded.setdefault(member.id, 0.0)
+
+    roles = {r.user_id: r for r in group.roles}
+    names = {m.id: m.username for m in members}
+    users = []
+    for uid, bal in balances_rounded.items():
+        if uid in names:
+            r = roles.get(uid)
+            users.append({
+                "user_id": uid, "name": names[uid], "balance": bal, "status": "Owes" if bal < 0 else "Gets Back",
+                "is_manager": r.is_manager if r else group.manager_id == uid,
+                "title": r.title if r else ("Manager" if group.manager_id == uid else "Member"),
+            })
+    return {
+        "manager_id": group.manager_id,
+        "group_type": group.group_type,
+        "total_user_meals": {uid: sum(m.breakfast + m.lunch + m.dinner + m.guest_meal_count for m in meals if m.user_id == uid) for uid in names},
+        "summary": {"meal_rate": meal_rate, "total_bazar": total_bazar, "total_meals": total_meals, "total_fixed_expenses": fixed_expenses},
+        "users": users,
+        "transfers": baseline_transfer_count(balances_rounded),
+        "raw_expenses": {e.id: (amount(e), e.category, str(e.date), e.user_id) for e in expenses},
+        "meals": {m.id: (str(m.date), m.user_id, m.breakfast, m.lunch, m.dinner, m.guest_meal_count) for m in meals},
+        "funds": {f.id: (amount(f), str(f.date), f.user_id) for f in group.funds},
+    }
+
+
+def compare(expected, actual):
+    """Differences between the baseline and the current payload, beyond the intended ones."""
+    problems = []
+    for key in ["manager_id", "group_type", "total_user_meals"]:
+        if expected[key] != actual[key]:
+            problems.append(f"{key}: {expected[key]!r} != {actual[key]!r}")
+    if expected["summary"]["meal_rate"] != actual["summary"]["meal_rate"]:
+        problems.append(f"meal_rate: {expected['summary']['meal_rate']} != {actual['summary']['meal_rate']}")
+    for key in ["total_bazar", "total_meals", "total_fixed_expenses"]:
+        if abs(expected["summary"][key] - actual["summary"][key]) > CENT:
+            problems.append(f"summary.{key}: {expected['summary'][key]} != {actual['summary'][key]}")
+
+    users = {u["user_id"]: u for u in actual["users"]}
+    if set(users) != {u["user_id"] for u in expected["users"]}:
+        problems.append("users: different members")
+    for u in expected["users"]:
+        got = users.get(u["user_id"])
+        if got is None:
+            continue
+        if abs(u["balance"] - got["balance"]) > CENT:
+            problems.append(f"{u['name']}.balance: {u['balance']} != {got['balance']}")
+        for field in ["name", "is_manager", "title"]:
+            if u[field] != got[field]:
+                problems.append(f"{u['name']}.{field}: {u[field]!r} != {got[field]!r}")
+        # A balance within a cent of zero may land on either side
+        if u["status"] != got["status"] and abs(u["balance"]) > CENT:
+            problems.append(f"{u['name']}.status: {u['status']} != {got['status']}")
+
+    # Balances rounded to cents need not sum to zero; as in the baseline, the difference stays unsettled
+    names = {u["name"]: u["user_id"] for u in actual["users"]}
+    left = {u["user_id"]: u["balance"] for u in actual["users"]}
+    for t in actual["settlements"]:
+        left[names[t["from_name"]]] += t["amount"]
+        left[names[t["to_name"]]] -= t["amount"]
+    if sum(abs(bal) for bal in left.values()) > abs(sum(left.values())) + CENT:
+        problems.append(f"settlements leave {sum(abs(bal) > CENT for bal in left.values())} member(s) unsettled")
+    if len(actual["settlements"]) > expected["transfers"]:
+        problems.append(f"settlements: {len(actual['settlements'])} transfers, the baseline needed {expected['transfers']}")
+
+    rows = {
+        "raw_expenses": {e["id"]: (e["amount"], e["category"], e["date"], e["user_id"]) for e in actual["raw_expenses"]},
+        "meals": {m["id"]: (m["date"], m["user_id"], m["breakfast"], m["lunch"], m["dinner"], m["guest_meal_count"]) for m in actual["meals"]},
+        "funds": {f["id"]: (f["amount"], f["date"], f["user_id"]) for f in actual["funds"]},
+    }
+    for key, got in rows.items():
+        if set(got) != set(expected[key]):
+            problems.append(f"{key}: {len(set(got) ^ set(expected[key]))} row(s) in only one payload")
+            continue
+        for row_id, values in expected[key].items():
+            if any(abs(a - b) > CENT if isinstance(a, float) else a != b for a, b in zip(values, got[row_id])):
+                problems.append(f"{key}[{row_id}]: {values} != {got[row_id]}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.check_dashboard")
+    datagen.add_arguments(parser)
+    parser.set_defaults(scale="tiny")
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="hisab-check-"), "check.db")
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    data = datagen.generate(app_main, datagen.config_from_args(args))
+    failed = 0
+    with TestClient(app_main.app) as client:
+        db = app_main.SessionLocal()
+        try:
+            for gid in data.groups:
+                expected = baseline_dashboard(db.query(app_main.DBGroup).filter(app_main.DBGroup.id == gid).first())
+                problems = compare(expected, client.get(f"/api/groups/{gid}/dashboard").json())
+                if problems:
+                    failed += 1
+                    print(f"{gid} ({expected['group_type']}): {len(problems)} difference(s)")
+                    for line in problems[:20]:
+                        print(f"    {line}")
+        finally:
+            db.close()
+    if failed:
+        print(f"{failed} of {len(data.groups)} dashboard(s) differ from the baseline computation")
+        return 1
+    print(f"All {len(data.groups)} dashboards match the baseline computation")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Post overlapping meal batches at the same time and check nothing is logged twice.
+
+Each round, every thread posts a batch for the same members and the same new day, some with upsert and
+some without, released together by a barrier. Afterwards each member and day must have exactly one meal
+row, and the stored ledger must match the totals recomputed from the raw rows (verify_ledger).
+
+Usage (from backend/):
+    python -m benchmarks.check_meal_batches [--threads 4] [--rounds 20] [--scale tiny]
+
+Exits with 1 on duplicate rows or ledger drift.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+
+from benchmarks import datagen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.check_meal_batches")
+    parser.add_argument("--threads", type=int, default=4, help="Batches posted at once")
+    parser.add_argument("--rounds", type=int, default=20)
+    datagen.add_arguments(parser)
+    parser.set_defaults(scale="tiny")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="hisab-batches-"), "check.db"))
+    import main as app_main
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+
+    data = datagen.generate(app_main, datagen.config_from_args(args))
+    gid = data.groups[0]
+    members = data.members[gid]
+    failures = []
+
+    def post(client, barrier, date, seed):
+        rng = random.Random(seed)
+        entries = [{"group_id": gid, "user_id": uid, "date": date, "lunch": rng.randint(0, 2), "dinner": rng.randint(0, 2)} for uid in members]
+        barrier.wait()
+        response = client.post(f"/api/groups/{gid}/meals/batch", json={"entries": entries, "upsert": seed % 2 == 0})
+        if response.status_code != 200:
+            failures.append(f"{date}: {response.status_code} {response.text[:200]}")
+
+    with TestClient(app_main.app, raise_server_exceptions=False) as client:
+        for round_no in range(args.rounds):
+            # After the generated history, so no batch lands in a closed period
+            date = (data.last_date + datetime.timedelta(days=round_no + 1)).isoformat()
+            barrier = threading.Barrier(args.threads)
+            threads = [threading.Thread(target=post, args=(client, barrier, date, round_no * args.threads + i)) for i in range(args.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    db = app_main.SessionLocal()
+    try:
+        Meal = app_main.DBMeal
+        duplicates = db.query(Meal.user_id, Meal.date, func.count()).filter(Meal.group_id == gid, Meal.date > data.last_date) \
+            .group_by(Meal.user_id, Meal.date).having(func.count() > 1).all()
+        drift = app_main.verify_ledger(db, gid)
+    finally:
+        db.close()
+
+    for line in failures[:10]:
+        print(f"request failed: {line}")
+    for uid, date, count in duplicates[:10]:
+        print(f"{uid} on {date}: {count} meal rows")
+    for line in drift[:10]:
+        print(f"ledger drift: {line}")
+    if failures or duplicates or drift:
+        print(f"{len(failures)} failed request(s), {len(duplicates)} duplicated member-day(s), {len(drift)} drifted value(s)")
+        return 1
+    print(f"{args.rounds} rounds of {args.threads} overlapping batches: one row per member and day, ledger matches raw rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Synthetic mess data for benchmarks.
+
+Fills users, groups, user_groups, roles, expenses, meals, funds, notifications and meal
+requests straight through bulk inserts, then builds each group's ledger. The same config and
+seed always produce the same rows.
+
+Usage (from backend/):
+    python -m benchmarks.datagen --database-url sqlite:///bench.db --scale large
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import func
+
+SCALES = {
+    "tiny": {"groups": 5, "members": 6, "days": 30},
+    "small": {"groups": 20, "members": 10, "days": 90},
+    "medium": {"groups": 100, "members": 20, "days": 365},
+    "large": {"groups": 500, "members": 40, "days": 730},
+}
+
+
+class Config:
+    def __init__(self, groups=20, members=10, days=90, notifications=50, meal_requests=20,
+                 expenses_per_day=2, multi_group=0.1, start=datetime.date(2024, 1, 1), seed=1, chunk_size=5000):
+        self.groups = groups
+        self.members = members
+        self.days = days
+        self.notifications = notifications  # per user
+        self.meal_requests = meal_requests  # per group
+        self.expenses_per_day = expenses_per_day  # bazar runs per group and day
+        self.multi_group = multi_group  # share of users who also join a second group
+        self.start = start
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    @property
+    def end(self):
+        return self.start + datetime.timedelta(days=self.days - 1)
+
+    def as_dict(self):
+        return {k: (v.isoformat() if isinstance(v, datetime.date) else v) for k, v in vars(self).items()}
+
+
+class Dataset:
+    """Ids of what was generated, for picking benchmark targets."""
+
+    def __init__(self):
+        self.users = []
+        self.groups = []
+        self.members = {}  # group id -> member ids
+        self.counts = {}
+        self.last_date = None  # newest dated row
+
+
+def generate(main, config):
+    # Data goes in before the app starts, which is when it would create the schema
+    main.migrations.migrate(main.engine, main.Base.metadata)
+    rng = random.Random(config.seed)
+    new_id = lambda: str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    data = Dataset()
+    data.last_date = config.end
+    started = time.perf_counter()
+
+    with main.engine.begin() as conn:
+        writer = _Writer(conn, config.chunk_size)
+
+        for i in range(config.groups * config.members):
+            uid = new_id()
+            data.users.append(uid)
+            writer.add(main.DBUser, {"id": uid, "username": f"user{i}", "email": f"user{i}@bench.test", "password": "bench"})
+
+        for g in range(config.groups):
+            gid = new_id()
+            data.groups.append(gid)
+            data.members[gid] = data.users[g * config.members:(g + 1) * config.members]
+            group_type = "monthly_avg" if g % 4 == 3 else "smart_meal"
+            writer.add(main.DBGroup, {"id": gid, "unique_name": f"group{g}", "display_name": f"Mess {g}", "group_type": group_type, "manager_id": data.members[gid][0]})
+        if config.groups > 1:
+            for i, uid in enumerate(data.users):
+                if rng.random() < config.multi_group:
+                    other = (i // config.members + rng.randrange(1, config.groups)) % config.groups
+                    data.members[data.groups[other]].append(uid)
+        # Parents first so foreign keys hold on Postgres
+        writer.flush()
+
+        for gid in data.groups:
+            members = data.members[gid]
+            writer.add(main.DBGroupRole, {"id": new_id(), "group_id": gid, "user_id": members[0], "is_manager": True, "title": "Manager"})
+            for uid in members:
+                writer.add(main.user_groups, {"user_id": uid, "group_id": gid})
+            _fill_group(writer, main, rng, new_id, config, gid, members)
+
+        for uid in data.users:
+            created = datetime.datetime.combine(config.start, datetime.time(8))
+            for n in range(config.notifications):
+                created += datetime.timedelta(minutes=rng.randint(30, 60 * 24))
+                writer.add(main.DBNotification, {"id": new_id(), "user_id": uid, "message": f"Benchmark notification {n}", "is_read": rng.random() < 0.7, "created_at": created.isoformat()})
+        writer.flush()
+        data.counts = dict(writer.counts)
+
+    db = main.SessionLocal()
+    try:
+        for gid in data.groups:
+            main.rebuild_ledger(db, gid)
+        db.commit()
+    finally:
+        db.close()
+    data.counts["seconds"] = round(time.perf_counter() - started, 2)
+    return data
+
+
+def load(main):
+    """Read the ids of an existing database, e.g. one generated earlier with this module."""
+    data = Dataset()
+    db = main.SessionLocal()
+    try:
+        data.users = [uid for (uid,) in db.query(main.DBUser.id).order_by(main.DBUser.id)]
+        for uid, gid in db.query(main.user_groups.c.user_id, main.user_groups.c.group_id).order_by(main.user_groups.c.group_id, main.user_groups.c.user_id):
+            data.members.setdefault(gid, []).append(uid)
+        data.groups = sorted(data.members)
+        for model in [main.DBUser, main.DBGroup, main.DBExpense, main.DBMeal, main.DBFund, main.DBNotification, main.DBMealRequest]:
+            data.counts[model.__tablename__] = db.query(func.count()).select_from(model).scalar()
+        data.last_date = db.query(func.max(main.DBMeal.date)).scalar() or datetime.date.today()
+    finally:
+        db.close()
+    return data
+
+
+def _fill_group(writer, main, rng, new_id, config, gid, members):
+    money = lambda low, high: Decimal(rng.randint(low * 100, high * 100)) / 100
+    for day in range(config.days):
+        date = config.start + datetime.timedelta(days=day)
+        for uid in members:
+            if rng.random() < 0.9:
+                writer.add(main.DBMeal, {"id": new_id(), "group_id": gid, "user_id": uid, "date": date, "breakfast": rng.choice([0, 0.5, 1]), "lunch": rng.choice([0, 1]), "dinner": rng.choice([0, 1, 1, 2]), "guest_meal_count": 1 if rng.random() < 0.02 else 0})
+        for _ in range(config.expenses_per_day):
+            writer.add(main.DBExpense, {"id": new_id(), "group_id": gid, "user_id": rng.choice(members), "amount": money(100, 3000), "category": "Bazar", "date": date, "items": "rice, fish, vegetables"})
+        if date.day == 1:
+            writer.add(main.DBExpense, {"id": new_id(), "group_id": gid, "user_id": members[0], "amount": money(10000, 30000), "category": "Rent", "date": date, "items": ""})
+            writer.add(main.DBExpense, {"id": new_id(), "group_id": gid, "user_id": members[0], "amount": money(1000, 5000), "category": "Utilities", "date": date, "items": ""})
+            for uid in members:
+                writer.add(main.DBFund, {"id": new_id(), "group_id": gid, "user_id": uid, "amount": money(2000, 6000), "date": date})
+    for _ in range(config.meal_requests):
+        date = config.start + datetime.timedelta(days=rng.randrange(config.days))
+        writer.add(main.DBMealRequest, {"id": new_id(), "group_id": gid, "user_id": rng.choice(members), "date": date, "status": rng.choice(["pending", "approved", "rejected"]), "message": "Off for lunch"})
+
+
+class _Writer:
+    """Buffers rows per table and inserts them in executemany chunks."""
+
+    def __init__(self, conn, chunk_size):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.pending = {}
+        self.counts = {}
+
+    def add(self, model, row):
+        table = getattr(model, "__table__", model)
+        rows = self.pending.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.chunk_size:
+            self._insert(table)
+
+    def flush(self):
+        for table in list(self.pending):
+            self._insert(table)
+
+    def _insert(self, table):
+        rows = self.pending.pop(table, [])
+        if rows:
+            self.conn.execute(table.insert(), rows)
+            self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+
+
+def config_from_args(args):
+    values = dict(SCALES[args.scale])
+    for key in ["groups", "members", "days", "notifications", "meal_requests", "seed"]:
+        if getattr(args, key) is not None:
+            values[key] = getattr(args, key)
+    return Config(**values)
+
+
+def add_arguments(parser):
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--groups", type=int)
+    parser.add_argument("--members", type=int, help="Members per group")
+    parser.add_argument("--days", type=int, help="Days of history")
+    parser.add_argument("--notifications", type=int, help="Notifications per user")
+    parser.add_argument("--meal-requests", type=int, help="Meal requests per group")
+    parser.add_argument("--seed", type=int)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.datagen")
+    parser.add_argument("--database-url", required=True)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.database_url
+    import main as app_main
+
+    config = config_from_args(args)
+    data = generate(app_main, config)
+    print(data.counts)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
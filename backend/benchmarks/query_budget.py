@@ -0,0 +1,127 @@
+"""Check the number of SQL statements each endpoint issues against a fixed budget.
+
+Budgets don't depend on how many rows are involved, so an N+1 lazy load shows up as a
+violation as soon as the generated data has more than a handful of rows. Statements are
+counted per request by the metrics middleware and read from its Server-Timing header.
+
+Usage (from backend/):
+    python -m benchmarks.query_budget [--scale tiny] [--verbose]
+
+Exits with 1 if any endpoint goes over its budget.
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+import tempfile
+
+from benchmarks import datagen
+
+# The most SQL statements each request may issue
+BUDGETS = {
+    "dashboard": 9,
+    "dashboard_cached": 1,
+    "dashboard_summary": 6,
+    "settlements": 7,
+    "list_expenses": 1,
+    "get_meal_requests": 1,
+    "changes": 7,
+    "timeseries": 2,
+    "get_user_groups": 2,
+    "user_balances": 9,
+    "update_user": 8,
+    "join_group": 9,
+    "remove_member": 8,
+    "add_expense": 10,
+    "add_fund": 10,
+    "add_meal": 8,
+    "add_meals_batch": 13,
+    "update_meal": 11,
+    "get_inbox": 1,
+    "get_unread_count": 1,
+    "get_notifications": 1,
+    "close_period": 19,
+    "delete_group": 5,
+}
+
+
+def statements(response):
+    match = re.search(r'desc="(\d+) statements"', response.headers.get("server-timing", ""))
+    if response.status_code >= 400 or not match:
+        raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text[:200]}")
+    return int(match.group(1))
+
+
+def run(main, client, data):
+    """Issue one request per budgeted endpoint and return {name: statements}."""
+    gid = data.groups[0]
+    members = data.members[gid]
+    uid = members[1]
+    outsider = next(u for u in data.users if u not in members)
+    after = lambda days: (data.last_date + datetime.timedelta(days=days)).isoformat()
+    counts = {}
+
+    def call(name, method, url, **kwargs):
+        response = client.request(method, url, headers={"X-Debug-Timing": "1"}, **kwargs)
+        counts[name] = statements(response)
+        return response
+
+    main.dashboard_cache.clear()
+    call("dashboard", "GET", f"/api/groups/{gid}/dashboard")
+    call("dashboard_cached", "GET", f"/api/groups/{gid}/dashboard")
+    call("dashboard_summary", "GET", f"/api/groups/{gid}/dashboard?details=false")
+    call("settlements", "GET", f"/api/groups/{gid}/settlements")
+    call("list_expenses", "GET", f"/api/groups/{gid}/expenses?limit=100")
+    call("get_meal_requests", "GET", f"/api/groups/{gid}/meal_requests")
+    call("changes", "GET", f"/api/groups/{gid}/changes?since=0")
+    call("timeseries", "GET", f"/api/groups/{gid}/timeseries?bucket=week")
+    call("get_user_groups", "GET", f"/api/users/{uid}/groups")
+    call("user_balances", "GET", f"/api/users/{uid}/balances")
+    call("update_user", "PUT", f"/api/users/{uid}", json={"username": "renamed", "email": "renamed@bench.test"})
+    call("join_group", "POST", "/api/groups/join", json={"group_unique_name": "group0", "user_id": outsider})
+    call("remove_member", "DELETE", f"/api/groups/{gid}/members/{outsider}")
+    call("add_expense", "POST", f"/api/groups/{gid}/expenses", json={"group_id": gid, "user_id": uid, "amount": 120.5, "category": "Bazar", "date": after(1), "items": "fish"})
+    call("add_fund", "POST", f"/api/groups/{gid}/funds", json={"group_id": gid, "user_id": uid, "amount": 500, "date": after(1)})
+    call("add_meal", "POST", f"/api/groups/{gid}/meals", json={"group_id": gid, "user_id": uid, "date": after(1), "lunch": 1})
+    entries = [{"group_id": gid, "user_id": member, "date": after(2), "lunch": 1, "dinner": 1} for member in members]
+    call("add_meals_batch", "POST", f"/api/groups/{gid}/meals/batch", json={"entries": entries})
+    meal_id = client.get(f"/api/groups/{gid}/meals?from={after(1)}&limit=1").json()["items"][0]["id"]
+    call("update_meal", "PUT", f"/api/groups/{gid}/meals/{meal_id}", json={"dinner": 2})
+    call("get_inbox", "GET", f"/api/users/{uid}/inbox")
+    call("get_unread_count", "GET", f"/api/users/{uid}/notifications/unread_count")
+    call("get_notifications", "GET", f"/api/users/{uid}/notifications")
+    call("close_period", "POST", f"/api/groups/{gid}/periods/close", json={"end_date": after(2)})
+    call("delete_group", "DELETE", f"/api/groups/{data.groups[-1]}")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.query_budget")
+    datagen.add_arguments(parser)
+    parser.set_defaults(scale="tiny")
+    parser.add_argument("--verbose", action="store_true", help="List every endpoint, not only violations")
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="hisab-budget-"), "budget.db")
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    data = datagen.generate(app_main, datagen.config_from_args(args))
+    with TestClient(app_main.app) as client:
+        counts = run(app_main, client, data)
+
+    over = {name: n for name, n in counts.items() if n > BUDGETS[name]}
+    for name, n in counts.items():
+        if args.verbose or name in over:
+            flag = "  OVER BUDGET" if name in over else ""
+            print(f"{name:<20}{n:>4} / {BUDGETS[name]:<4}{flag}")
+    if over:
+        print(f"{len(over)} endpoint(s) over their statement budget")
+        return 1
+    print(f"All {len(counts)} endpoints within their statement budgets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Benchmark the API end to end.
+
+Drives the real FastAPI app through an in-process TestClient (needs httpx) against SQLite, or
+Postgres with --database-url, and reports p50/p95 latency and throughput per scenario.
+--db-mode picks the sync or async database stack and --concurrency issues requests from that
+many threads at once, so both stacks can be compared under load.
+
+Usage (from backend/):
+    python -m benchmarks.run --scale small --output results.json
+    python -m benchmarks.run --baseline results.json          # exits 1 on a regression
+    python -m benchmarks.run --database-url postgresql://localhost/bench --reuse
+    python -m benchmarks.run --db-mode async --concurrency 16 --baseline sync16.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import datagen
+
+SCENARIOS = ["dashboard", "dashboard_cached", "add_meal", "add_expense", "get_notifications", "get_user_groups"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(call, requests, warmup, concurrency=1):
+    for _ in range(warmup):
+        call()
+
+    def timed(_):
+        t0 = time.perf_counter()
+        response = call()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text[:200]}")
+        return time.perf_counter() - t0
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(timed, range(requests)))
+    else:
+        latencies = [timed(i) for i in range(requests)]
+    elapsed = time.perf_counter() - started
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": requests,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "mean_ms": ms(statistics.fmean(latencies)),
+        "throughput_rps": round(requests / elapsed, 1),
+    }
+
+
+def scenarios(main, client, data, rng):
+    """Map scenario names to zero-argument callables issuing one request."""
+    day = iter(range(1, 10 ** 9))
+    # Writes go after the generated history so they never land in a closed period
+    next_date = lambda: (data.last_date + datetime.timedelta(days=next(day))).isoformat()
+
+    def member():
+        gid = rng.choice(data.groups)
+        return gid, rng.choice(data.members[gid])
+
+    def dashboard():
+        # Cold path: nothing reused from earlier requests
+        main.dashboard_cache.clear()
+        main.settlement_cache.clear()
+        return client.get(f"/api/groups/{rng.choice(data.groups)}/dashboard")
+
+    hot_group = data.groups[0]
+
+    def add_meal():
+        gid, uid = member()
+        return client.post(f"/api/groups/{gid}/meals", json={"group_id": gid, "user_id": uid, "date": next_date(), "breakfast": 1, "lunch": 1, "dinner": 1})
+
+    def add_expense():
+        gid, uid = member()
+        return client.post(f"/api/groups/{gid}/expenses", json={"group_id": gid, "user_id": uid, "amount": round(rng.uniform(50, 2000), 2), "category": "Bazar", "date": next_date(), "items": "benchmark"})
+
+    return {
+        "dashboard": dashboard,
+        "dashboard_cached": lambda: client.get(f"/api/groups/{hot_group}/dashboard"),
+        "add_meal": add_meal,
+        "add_expense": add_expense,
+        "get_notifications": lambda: client.get(f"/api/users/{rng.choice(data.users)}/notifications"),
+        "get_user_groups": lambda: client.get(f"/api/users/{rng.choice(data.users)}/groups"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline run. Returns the scenarios that regressed."""
+    regressions = []
+    print(f"\n{'scenario':<20}{'p50 ms':>12}{'base':>10}{'p95 ms':>12}{'base':>10}  change")
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            print(f"{name:<20}{current['p50_ms']:>12}{'-':>10}{current['p95_ms']:>12}{'-':>10}  new")
+            continue
+        change = (current["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<20}{current['p50_ms']:>12}{before['p50_ms']:>10}{current['p95_ms']:>12}{before['p95_ms']:>10}  {change:+.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--reuse", action="store_true", help="Benchmark the data already in --database-url instead of generating it")
+    parser.add_argument("--db-mode", choices=["sync", "async"], default="sync", help="Database stack the app serves requests with")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight at once")
+    datagen.add_arguments(parser)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, help="Run only these scenarios")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p95 slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="hisab-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["DB_MODE"] = args.db_mode
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    config = datagen.config_from_args(args)
+    if args.reuse:
+        data = datagen.load(app_main)
+    else:
+        data = datagen.generate(app_main, config)
+        print(f"generated {data.counts}")
+
+    rng = random.Random(config.seed)
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "database": app_main.engine.dialect.name,
+            "dashboard_engine": app_main.DASHBOARD_ENGINE,
+            "db_mode": app_main.DB_MODE,
+            "concurrency": args.concurrency,
+            "config": config.as_dict(),
+            "rows": data.counts,
+        },
+        "scenarios": {},
+    }
+    with TestClient(app_main.app) as client:
+        calls = scenarios(app_main, client, data, rng)
+        for name in args.only or SCENARIOS:
+            results["scenarios"][name] = stats = measure(calls[name], args.requests, args.warmup, args.concurrency)
+            print(f"{name:<20} p50 {stats['p50_ms']:>9} ms  p95 {stats['p95_ms']:>9} ms  {stats['throughput_rps']:>8} req/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) slower than the baseline by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
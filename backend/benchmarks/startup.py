@@ -0,0 +1,88 @@
+"""Measure cold-start latency: importing the app, its lifespan startup and the first request.
+
+Each run is a fresh interpreter, as after an instance wakes up. Startup is split into the schema
+check (AUTO_MIGRATE=1 only) and the rest, which is mostly opening the first database connection.
+
+Usage (from backend/):
+    python -m benchmarks.startup [--runs 5] [--database-url URL] [--scale tiny]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import datagen
+
+PHASES = ["import_ms", "schema_ms", "connect_ms", "first_request_ms", "second_request_ms"]
+
+
+def child(group_id):
+    start = time.perf_counter()
+    import main
+    timings = {"import_ms": (time.perf_counter() - start) * 1000, "schema_ms": 0.0}
+    from fastapi.testclient import TestClient  # not part of the app's startup, so left out of the timings
+    migrate = main.migrations.migrate
+
+    def timed_migrate(*args, **kwargs):
+        began = time.perf_counter()
+        try:
+            return migrate(*args, **kwargs)
+        finally:
+            timings["schema_ms"] = (time.perf_counter() - began) * 1000
+
+    main.migrations.migrate = timed_migrate
+    start = time.perf_counter()
+    with TestClient(main.app) as client:
+        timings["connect_ms"] = (time.perf_counter() - start) * 1000 - timings["schema_ms"]
+        for phase in ["first_request_ms", "second_request_ms"]:
+            began = time.perf_counter()
+            response = client.get(f"/api/groups/{group_id}/dashboard")
+            response.raise_for_status()
+            timings[phase] = (time.perf_counter() - began) * 1000
+    print(json.dumps(timings))
+
+
+def run_once(database_url, group_id, auto_migrate):
+    env = dict(os.environ, DATABASE_URL=database_url, AUTO_MIGRATE=auto_migrate)
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", group_id], cwd=backend, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--child", metavar="GROUP_ID", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", help="Existing database to start against (default: a generated SQLite file)")
+    datagen.add_arguments(parser)
+    parser.set_defaults(scale="tiny")
+    args = parser.parse_args(argv)
+    if args.child:
+        child(args.child)
+        return 0
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="hisab-startup-"), "startup.db")
+    os.environ["DATABASE_URL"] = database_url
+    import main as app_main
+
+    if args.database_url:
+        data = datagen.load(app_main)
+    else:
+        data = datagen.generate(app_main, datagen.config_from_args(args))
+    app_main.engine.dispose()
+
+    print(f"{'AUTO_MIGRATE':<14}" + "".join(f"{phase[:-3]:>16}" for phase in PHASES) + f"{'total':>10}   (median ms of {args.runs} runs)")
+    for auto_migrate in ["1", "0"]:
+        runs = [run_once(database_url, data.groups[0], auto_migrate) for _ in range(args.runs)]
+        medians = {phase: statistics.median(run[phase] for run in runs) for phase in PHASES}
+        total = statistics.median(sum(run[phase] for phase in PHASES[:-1]) for run in runs)
+        print(f"{auto_migrate:<14}" + "".join(f"{medians[phase]:>16.1f}" for phase in PHASES) + f"{total:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+
+
+class LRUCache:
+    """A small thread-safe LRU cache with hit/miss counters."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """Look up `key` without counting a hit or miss or refreshing its place in the LRU order."""
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.futures = []
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one computation per key at a time; callers arriving meanwhile share its outcome.
+
+    Followers in a threadpool thread block on an Event. Followers running inside AsyncSession.run_sync
+    are greenlets on the event loop, where blocking would stall the leader too, so they await a
+    future on their loop instead.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Return fn(), or the result of the call already in flight for `key`."""
+        waiter = None
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.computed += 1
+            else:
+                self.coalesced += 1
+                if in_greenlet():
+                    loop = asyncio.get_running_loop()
+                    waiter = loop.create_future()
+                    call.futures.append((loop, waiter))
+        if not leader:
+            if waiter is not None:
+                await_only(waiter)
+            else:
+                call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                call.event.set()
+            for loop, future in call.futures:
+                loop.call_soon_threadsafe(_resolve, future)
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "computed": self.computed, "coalesced": self.coalesced}
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
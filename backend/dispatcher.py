@@ -0,0 +1,111 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BatchDispatcher:
+    """Runs a handler over queued jobs on a background thread, in batches.
+
+    A failing batch is retried with exponential backoff before it is dropped.
+    stop() drains everything that was submitted before it.
+    """
+
+    def __init__(self, handler, name="dispatcher", batch_size=500, max_retries=3, retry_delay=0.5):
+        self.handler = handler
+        self.name = name
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.retries = 0
+
+    def submit(self, job):
+        self.start()
+        self.submitted += 1
+        self._queue.put(job)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10.0):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("%s did not drain within %ss; %s job(s) left", self.name, timeout, self._queue.qsize())
+
+    def flush(self, timeout=None):
+        """Block until every submitted job has been handled. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                self._queue.task_done()
+                return
+            batch = [job]
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            self._handle(batch)
+            for _ in range(len(batch) + stopping):
+                self._queue.task_done()
+            if stopping:
+                return
+
+    def _handle(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.handler(batch)
+                self.processed += len(batch)
+                return
+            except Exception:
+                if attempt == self.max_retries:
+                    logger.exception("%s dropped %s job(s) after %s attempts", self.name, len(batch), attempt + 1)
+                    self.failed += len(batch)
+                    return
+                self.retries += 1
+                logger.warning("%s batch failed, retrying (attempt %s)", self.name, attempt + 1, exc_info=True)
+                time.sleep(self.retry_delay * 2 ** attempt)
@@ -0,0 +1,42 @@
+"""Streaming encoders for exports: an iterator of row dicts in, CSV or NDJSON bytes out.
+
+Rows are written in chunks as they arrive, so memory stays flat however many rows there are.
+"""
+import csv
+import io
+import json
+import zlib
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def encode(rows, fields, fmt, chunk_rows=500):
+    """Yield `rows` encoded as `fmt` ("csv" with a `fields` header, or "ndjson"), chunk_rows at a time."""
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unknown export format: {fmt}")
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, fields, extrasaction="ignore")
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        write = lambda row: buffer.write(json.dumps(row) + "\n")
+
+    for count, row in enumerate(rows, 1):
+        write(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzipped(chunks, level=6):
+    """Gzip a stream of byte chunks on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
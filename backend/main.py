@@ -1,12 +1,35 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 from collections import defaultdict
+from contextlib import asynccontextmanager
+import asyncio
+import datetime
+import json
+from decimal import Decimal, ROUND_HALF_UP
 import uuid
-from sqlalchemy import create_engine, Column, String, Float, ForeignKey, Table, Boolean
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session
+import base64
+import calendar
+import csv
+import io
+import tempfile
+import threading
+from sqlalchemy import create_engine, event, Column, String, Text, Float, Numeric, Date, ForeignKey, Table, Boolean, Integer, Index, func, and_, or_, insert, update, delete, select, literal, bindparam, tuple_
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session, joinedload, selectinload, with_loader_criteria
 import os
+from cache import LRUCache, SingleFlight
+from dispatcher import BatchDispatcher
+from pubsub import Broker
+import migrations
+import settlement
+import observability
+import asyncdb
+import sqlitedb
+import export
+import payload
 
 # ----- DATABASE SETUP -----
 DATABASE_URL = os.environ.get("DATABASE_URL", "").strip()
@@ -18,15 +41,41 @@ if DATABASE_URL.startswith("postgres://"):
 
 SQLALCHEMY_DATABASE_URL = DATABASE_URL
 connect_args = {"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Unset variables keep SQLAlchemy's defaults
+POOL_SETTINGS = {"pool_size": ("DB_POOL_SIZE", int), "max_overflow": ("DB_MAX_OVERFLOW", int), "pool_timeout": ("DB_POOL_TIMEOUT", float), "pool_recycle": ("DB_POOL_RECYCLE", int)}
+pool_options = {key: cast(os.environ[var]) for key, (var, cast) in POOL_SETTINGS.items() if os.environ.get(var)}
+if os.environ.get("DB_POOL_PRE_PING") == "1":
+    pool_options["pool_pre_ping"] = True
+
+# A SQLite file runs in WAL mode with one serialized writer connection and a pool of readers (see sqlitedb);
+# SQLITE_TUNED=0 keeps the single default pool and rollback journal
+SQLITE_TUNED = sqlitedb.is_file_database(SQLALCHEMY_DATABASE_URL) and os.environ.get("SQLITE_TUNED", "1") != "0"
+sqlite_pragmas = sqlitedb.pragmas(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"), os.environ.get("SQLITE_CACHE_MB", "64")) if SQLITE_TUNED else None
+
+if SQLITE_TUNED:
+    engine, read_engine = sqlitedb.create_engines(create_engine, SQLALCHEMY_DATABASE_URL, sqlite_pragmas, connect_args=connect_args, **pool_options)
+else:
+    engine, read_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args, **pool_options), None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=sqlitedb.RoutingSession, reader=read_engine)
+
+# "sync" runs routes in the threadpool on a blocking Session; "async" serves them on the event loop
+# through an AsyncSession (aiosqlite / asyncpg). Migrations and background jobs always use the sync engine.
+DB_MODE = os.environ.get("DB_MODE", "sync")
+if DB_MODE not in ("sync", "async"):
+    raise ValueError(f"Unknown DB_MODE: {DB_MODE}")
+if DB_MODE == "async":
+    async_engine, async_read_engine, AsyncSessionLocal = asyncdb.create_session_factory(SQLALCHEMY_DATABASE_URL, sqlite_pragmas, **pool_options)
 Base = declarative_base()
 
 # Many-to-Many Association Table between Users and Groups
 user_groups = Table('user_groups', Base.metadata,
     Column('user_id', String, ForeignKey('users.id')),
-    Column('group_id', String, ForeignKey('groups.id'))
+    Column('group_id', String, ForeignKey('groups.id')),
     # Optional: Column('role', String, default='member')
+    Index('ix_user_groups_group_user', 'group_id', 'user_id'),
+    # One membership per user and group; an index rather than a constraint, so migrations can add it to SQLite files
+    Index('uq_user_groups_user_group', 'user_id', 'group_id', unique=True),
 )
 
 class DBUser(Base):
@@ -44,11 +93,14 @@ class DBGroup(Base):
     display_name = Column(String)
     group_type = Column(String, default="smart_meal")
     manager_id = Column(String, ForeignKey("users.id"))
+    deleted_at = Column(String, nullable=True)  # set when deletion is requested; the row goes once its data is purged
     members = relationship("DBUser", secondary=user_groups, back_populates="groups")
     expenses = relationship("DBExpense", back_populates="group")
     meals = relationship("DBMeal", back_populates="group")
     funds = relationship("DBFund", back_populates="group")
     roles = relationship("DBGroupRole", back_populates="group")
+    ledger = relationship("DBGroupLedger", uselist=False, viewonly=True)
+    member_ledgers = relationship("DBMemberLedger", viewonly=True, order_by="DBMemberLedger.user_id")
 
 class DBGroupRole(Base):
     __tablename__ = "group_roles"
@@ -57,42 +109,62 @@ class DBGroupRole(Base):
     user_id = Column(String, ForeignKey("users.id"))
     is_manager = Column(Boolean, default=False)
     title = Column(String, default="Member")
+    change_seq = Column(Integer)  # the group's ledger version when the row last changed, for delta sync
     group = relationship("DBGroup", back_populates="roles")
+    __table_args__ = (Index("ix_group_roles_group_seq", "group_id", "change_seq"),)
 
 class DBExpense(Base):
     __tablename__ = "expenses"
     id = Column(String, primary_key=True, index=True)
     group_id = Column(String, ForeignKey("groups.id"))
     user_id = Column(String, ForeignKey("users.id"))
-    amount = Column(Float)
+    amount = Column(Numeric(12, 2))
     category = Column(String)
-    date = Column(String)
+    date = Column(Date)
     items = Column(String, default="")
+    change_seq = Column(Integer)
     group = relationship("DBGroup", back_populates="expenses")
     user = relationship("DBUser")
+    __table_args__ = (
+        Index("ix_expenses_group_date", "group_id", "date"),
+        Index("ix_expenses_group_user", "group_id", "user_id"),
+        Index("ix_expenses_group_seq", "group_id", "change_seq"),
+    )
 
 class DBMeal(Base):
     __tablename__ = "meals"
     id = Column(String, primary_key=True, index=True)
     group_id = Column(String, ForeignKey("groups.id"))
     user_id = Column(String, ForeignKey("users.id"))
-    date = Column(String)
+    date = Column(Date)
     breakfast = Column(Float, default=0)
     lunch = Column(Float, default=0)
     dinner = Column(Float, default=0)
     guest_meal_count = Column(Float, default=0)
+    change_seq = Column(Integer)
     group = relationship("DBGroup", back_populates="meals")
     user = relationship("DBUser")
+    __table_args__ = (
+        Index("ix_meals_group_date", "group_id", "date"),
+        Index("ix_meals_group_user", "group_id", "user_id"),
+        Index("ix_meals_group_seq", "group_id", "change_seq"),
+    )
 
 class DBFund(Base):
     __tablename__ = "funds"
     id = Column(String, primary_key=True, index=True)
     group_id = Column(String, ForeignKey("groups.id"))
     user_id = Column(String, ForeignKey("users.id"))
-    amount = Column(Float)
-    date = Column(String)
+    amount = Column(Numeric(12, 2))
+    date = Column(Date)
+    change_seq = Column(Integer)
     group = relationship("DBGroup", back_populates="funds")
     user = relationship("DBUser")
+    __table_args__ = (
+        Index("ix_funds_group_date", "group_id", "date"),
+        Index("ix_funds_group_user", "group_id", "user_id"),
+        Index("ix_funds_group_seq", "group_id", "change_seq"),
+    )
 
 class DBPersonalCash(Base):
     __tablename__ = "personal_cash"
@@ -110,19 +182,159 @@ class DBNotification(Base):
     message = Column(String)
     is_read = Column(Boolean, default=False)
     created_at = Column(String)
+    group_id = Column(String, nullable=True)  # the group the notification is about, purged with it
+    __table_args__ = (
+        # Inbox pages, unread counts and retention sweeps stay index-only
+        Index("ix_notifications_user_created", "user_id", "created_at", "id"),
+        Index("ix_notifications_user_read", "user_id", "is_read"),
+        Index("ix_notifications_read_created", "is_read", "created_at"),
+        Index("ix_notifications_group", "group_id"),
+    )
+
+class DBNotificationArchive(Base):
+    __tablename__ = "notifications_archive"
+    id = Column(String, primary_key=True)
+    user_id = Column(String, index=True)
+    message = Column(String)
+    is_read = Column(Boolean, default=True)
+    created_at = Column(String)
+    archived_at = Column(String)
 
 class DBMealRequest(Base):
     __tablename__ = "meal_requests"
     id = Column(String, primary_key=True, index=True)
     group_id = Column(String, ForeignKey("groups.id"))
     user_id = Column(String, ForeignKey("users.id"))
-    date = Column(String)
+    date = Column(Date)
     status = Column(String, default="pending") 
     message = Column(String)
+    change_seq = Column(Integer)
     group = relationship("DBGroup")
     user = relationship("DBUser")
+    __table_args__ = (
+        Index("ix_meal_requests_group_date", "group_id", "date"),
+        Index("ix_meal_requests_group_user", "group_id", "user_id"),
+        Index("ix_meal_requests_group_seq", "group_id", "change_seq"),
+    )
+
+# Materialized running totals, kept in step with the raw rows by the write endpoints
+class DBGroupLedger(Base):
+    __tablename__ = "group_ledgers"
+    group_id = Column(String, ForeignKey("groups.id"), primary_key=True)
+    total_bazar = Column(Numeric(14, 2), default=0)
+    total_meals = Column(Float, default=0.0)
+    total_fixed = Column(Numeric(14, 2), default=0)
+    total_expenses = Column(Numeric(14, 2), default=0)
+    total_funds = Column(Numeric(14, 2), default=0)
+    member_count = Column(Integer, default=0)
+    version = Column(Integer, default=0)  # bumped by every write touching the group
+    pruned_seq = Column(Integer, default=0)  # tombstones up to this version are gone; older sync cursors get a full sync
+
+class DBMemberLedger(Base):
+    __tablename__ = "member_ledgers"
+    group_id = Column(String, ForeignKey("groups.id"), primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    meals = Column(Float, default=0.0)
+    expense_credit = Column(Numeric(14, 2), default=0)
+    funds = Column(Numeric(14, 2), default=0)
+
+# Per-day totals for time series, kept in step with the ledger by the same writes
+class DBGroupDaily(Base):
+    __tablename__ = "group_daily"
+    group_id = Column(String, ForeignKey("groups.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    breakfast = Column(Float, default=0.0)
+    lunch = Column(Float, default=0.0)
+    dinner = Column(Float, default=0.0)
+    guest_meals = Column(Float, default=0.0)
+    bazar = Column(Numeric(14, 2), default=0)
+    fixed = Column(Numeric(14, 2), default=0)
+    expenses = Column(Numeric(14, 2), default=0)  # every category, bazar and fixed included
+    funds = Column(Numeric(14, 2), default=0)
+
+class DBMemberDaily(Base):
+    __tablename__ = "member_daily"
+    group_id = Column(String, ForeignKey("groups.id"), primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    breakfast = Column(Float, default=0.0)
+    lunch = Column(Float, default=0.0)
+    dinner = Column(Float, default=0.0)
+    guest_meals = Column(Float, default=0.0)
+    bazar = Column(Numeric(14, 2), default=0)
+    fixed = Column(Numeric(14, 2), default=0)
+    expenses = Column(Numeric(14, 2), default=0)
+    funds = Column(Numeric(14, 2), default=0)
+
+# Rows deleted from a group, so delta sync can tell clients to drop their copies
+class DBTombstone(Base):
+    __tablename__ = "tombstones"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    group_id = Column(String, ForeignKey("groups.id"))
+    kind = Column(String)  # a CHANGE_KINDS key
+    row_id = Column(String)
+    change_seq = Column(Integer)
+    created_at = Column(String)
+    __table_args__ = (
+        Index("ix_tombstones_group_seq", "group_id", "change_seq"),
+        Index("ix_tombstones_created", "created_at"),
+    )
+
+# Frozen totals of a closed period; rows dated up to end_date can no longer change
+class DBPeriodClose(Base):
+    __tablename__ = "period_closes"
+    id = Column(String, primary_key=True, index=True)
+    group_id = Column(String, ForeignKey("groups.id"))
+    start_date = Column(Date, nullable=True)  # None for a group's first close
+    end_date = Column(Date)
+    closed_at = Column(String)
+    meal_rate = Column(Float, default=0.0)
+    total_bazar = Column(Numeric(14, 2), default=0)
+    total_meals = Column(Float, default=0.0)
+    total_fixed = Column(Numeric(14, 2), default=0)
+    total_expenses = Column(Numeric(14, 2), default=0)
+    total_funds = Column(Numeric(14, 2), default=0)
+    member_count = Column(Integer, default=0)
+    report = Column(Text)  # the dashboard as it stood at close, as JSON
+    members = relationship("DBPeriodCloseMember", viewonly=True, order_by="DBPeriodCloseMember.user_id")
+    __table_args__ = (Index("ix_period_closes_group_end", "group_id", "end_date"),)
+
+class DBPeriodCloseMember(Base):
+    __tablename__ = "period_close_members"
+    close_id = Column(String, ForeignKey("period_closes.id"), primary_key=True)
+    user_id = Column(String, primary_key=True)
+    meals = Column(Float, default=0.0)
+    expense_credit = Column(Numeric(14, 2), default=0)
+    funds = Column(Numeric(14, 2), default=0)
+    balance = Column(Numeric(14, 2), default=0)  # closing balance, carried into the next period
+
+# A deleted group's rows, purged in the background a chunk at a time; the job row outlives the group
+class DBPurgeJob(Base):
+    __tablename__ = "purge_jobs"
+    id = Column(String, primary_key=True, index=True)
+    group_id = Column(String, index=True)
+    status = Column(String, default="pending")  # pending, running, done
+    phase = Column(String)  # the table being purged
+    purged = Column(Integer, default=0)  # rows deleted so far
+    created_at = Column(String)
+    updated_at = Column(String)
+    finished_at = Column(String)
+
+@event.listens_for(Session, "do_orm_execute")
+def hide_deleted_groups(state):
+    """Leave groups awaiting their purge out of every ORM query, unless it runs with include_deleted=True."""
+    if state.is_select and not state.is_column_load and not state.is_relationship_load and not state.execution_options.get("include_deleted", False):
+        state.statement = state.statement.options(with_loader_criteria(DBGroup, lambda cls: cls.deleted_at.is_(None), include_aliases=True))
+
+# Set AUTO_MIGRATE=0 to skip the schema check at startup once "python manage.py migrate" runs as a deploy step
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "1") != "0"
 
-Base.metadata.create_all(bind=engine)
+def setup_database():
+    """Bring the schema up to date (unless AUTO_MIGRATE=0) and open the first pooled connection."""
+    if AUTO_MIGRATE:
+        migrations.migrate(engine, Base.metadata)
+    with engine.connect():
+        pass
 
 def get_db():
     db = SessionLocal()
@@ -131,15 +343,228 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# "ledger" reads the materialized totals, "aggregate" recomputes them with GROUP BY queries
+DASHBOARD_ENGINE = os.environ.get("DASHBOARD_ENGINE", "ledger")
+dashboard_cache = LRUCache(maxsize=int(os.environ.get("DASHBOARD_CACHE_SIZE", "256")))
+# Concurrent misses for the same dashboard key wait for one computation instead of each running it
+dashboard_flights = SingleFlight()
+# Settlements are keyed by the balances themselves, so each distinct set is computed once
+settlement_cache = LRUCache(maxsize=int(os.environ.get("SETTLEMENT_CACHE_SIZE", "256")))
+SETTLEMENT_CANCEL_EXACT = os.environ.get("SETTLEMENT_CANCEL_EXACT", "0") == "1"
+# Large JSON responses (dashboard, changes) are brotli/gzip-compressed from this size; 0 turns it off
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+
+# ----- NOTIFICATIONS -----
+notification_broker = Broker()
+SSE_KEEPALIVE_SECONDS = float(os.environ.get("SSE_KEEPALIVE_SECONDS", "15"))
+
+def serialize_notification(n):
+    return {"id": n.id, "message": n.message, "is_read": n.is_read, "created_at": n.created_at}
+
+def write_notifications(jobs):
+    """Fan queued notifications out to their recipients with one multi-row insert."""
+    db = SessionLocal()
+    try:
+        group_ids = {job["group_id"] for job in jobs if job.get("user_ids") is None}
+        group_members = defaultdict(list)
+        if group_ids:
+            for gid, uid in db.query(user_groups.c.group_id, user_groups.c.user_id).filter(user_groups.c.group_id.in_(group_ids)):
+                group_members[gid].append(uid)
+
+        rows = []
+        for job in jobs:
+            if job.get("user_ids") is None:
+                recipients = [uid for uid in group_members[job["group_id"]] if uid != job.get("exclude_user_id")]
+            else:
+                recipients = job["user_ids"]
+            rows.extend({"id": str(uuid.uuid4()), "user_id": uid, "message": job["message"], "is_read": False, "created_at": job["created_at"], "group_id": job.get("group_id")} for uid in recipients)
+        if rows:
+            db.execute(insert(DBNotification), rows)
+            db.commit()
+    finally:
+        db.close()
+
+    for row in rows:
+        notification_broker.publish(row["user_id"], {k: row[k] for k in ["id", "message", "is_read", "created_at"]})
+
+notification_dispatcher = BatchDispatcher(write_notifications, name="notification-dispatcher")
+
+def notify_users(user_ids, message: str, group_id: Optional[str] = None):
+    """Notify the given users, about `group_id` if there is one (so the notifications go when the group is deleted)."""
+    notification_dispatcher.submit({"user_ids": list(user_ids), "group_id": group_id, "message": message, "created_at": datetime.datetime.now().isoformat()})
+
+def notify_group(group_id: str, message: str, exclude_user_id: Optional[str] = None):
+    """Notify every member of a group; recipients are resolved by the dispatcher."""
+    notification_dispatcher.submit({"group_id": group_id, "exclude_user_id": exclude_user_id, "message": message, "created_at": datetime.datetime.now().isoformat()})
+
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get("NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_RETENTION_MODE = os.environ.get("NOTIFICATION_RETENTION_MODE", "purge")  # or "archive"
+
+def compact_notifications(days: int = NOTIFICATION_RETENTION_DAYS, mode: str = NOTIFICATION_RETENTION_MODE, chunk_size: int = 1000):
+    """Purge (or move to notifications_archive) read notifications older than `days`, one chunk per transaction."""
+    if mode not in ("purge", "archive"):
+        raise ValueError(f"Unknown retention mode: {mode}")
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+    removed = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = [nid for (nid,) in db.query(DBNotification.id).filter(DBNotification.is_read == True, DBNotification.created_at < cutoff).limit(chunk_size)]
+            if not ids:
+                break
+            if mode == "archive":
+                archived = select(DBNotification.id, DBNotification.user_id, DBNotification.message, DBNotification.is_read, DBNotification.created_at, literal(datetime.datetime.now().isoformat())).where(DBNotification.id.in_(ids))
+                db.execute(insert(DBNotificationArchive).from_select(["id", "user_id", "message", "is_read", "created_at", "archived_at"], archived))
+            db.execute(delete(DBNotification).where(DBNotification.id.in_(ids)))
+            db.commit()
+            removed += len(ids)
+    finally:
+        db.close()
+    return removed
+
+# ----- GROUP DELETION -----
+PURGE_CHUNK_ROWS = int(os.environ.get("PURGE_CHUNK_ROWS", "1000"))
+
+def purge_steps(group_id: str):
+    """(name, table, criterion) for each table holding the group's rows, children before the rows they reference."""
+    close_ids = select(DBPeriodClose.id).where(DBPeriodClose.group_id == group_id)
+    steps = [(model.__tablename__, model.__table__, model.group_id == group_id) for model in [
+        DBNotification, DBMealRequest, DBExpense, DBMeal, DBFund, DBGroupRole, DBTombstone, DBMemberDaily, DBGroupDaily, DBMemberLedger,
+    ]]
+    steps.append(("period_close_members", DBPeriodCloseMember.__table__, DBPeriodCloseMember.close_id.in_(close_ids)))
+    steps += [(model.__tablename__, model.__table__, model.group_id == group_id) for model in [DBPeriodClose, DBGroupLedger]]
+    steps.append(("user_groups", user_groups, user_groups.c.group_id == group_id))
+    return steps
+
+def purge_chunk(db: Session, table, criterion, chunk_size: int):
+    """Delete up to `chunk_size` rows of `table` matching `criterion`. Returns how many went."""
+    key = list(table.primary_key.columns)
+    if not key:
+        # user_groups has no key to page by, and only one row per member
+        return db.execute(delete(table).where(criterion)).rowcount
+    batch = select(*key).where(criterion).limit(chunk_size)
+    return db.execute(delete(table).where((tuple_(*key) if len(key) > 1 else key[0]).in_(batch))).rowcount
+
+def purge_group(job_id: str, chunk_size: int = PURGE_CHUNK_ROWS):
+    """Run a purge job to the end: the group's rows table by table, one chunk per transaction, then the group itself.
+
+    Progress is committed with each chunk, so a job cut short by a restart picks up where it stopped.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(DBPurgeJob).filter(DBPurgeJob.id == job_id).first()
+        if job is None or job.status == "done":
+            return
+        # A write already in flight at deletion can land rows behind the sweep; go again until a pass finds nothing
+        swept = None
+        while swept != 0:
+            swept = 0
+            for name, table, criterion in purge_steps(job.group_id):
+                while True:
+                    removed = purge_chunk(db, table, criterion, chunk_size)
+                    if removed:
+                        job.status, job.phase, job.purged = "running", name, job.purged + removed
+                        job.updated_at = datetime.datetime.now().isoformat()
+                        db.commit()
+                        swept += removed
+                    if removed < chunk_size:
+                        break
+        db.execute(delete(DBGroup).where(DBGroup.id == job.group_id))
+        job.status, job.phase = "done", None
+        job.updated_at = job.finished_at = datetime.datetime.now().isoformat()
+        db.commit()
+    finally:
+        db.close()
+
+def run_purge_jobs(job_ids):
+    for job_id in job_ids:
+        purge_group(job_id)
+
+purge_dispatcher = BatchDispatcher(run_purge_jobs, name="purge-dispatcher", batch_size=1)
+
+def unfinished_purge_jobs():
+    db = SessionLocal()
+    try:
+        return [job_id for (job_id,) in db.query(DBPurgeJob.id).filter(DBPurgeJob.status != "done").order_by(DBPurgeJob.created_at)]
+    finally:
+        db.close()
+
+def serialize_purge_job(job):
+    return {"id": job.id, "group_id": job.group_id, "status": job.status, "phase": job.phase, "purged": job.purged,
+            "created_at": job.created_at, "updated_at": job.updated_at, "finished_at": job.finished_at}
+
 # ----- APP INITIALIZATION -----
-app = FastAPI(title="Mess Management API")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Apps running in this process; the shared background workers stop with the last one
+_running_apps = 0
+_running_apps_lock = threading.Lock()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _running_apps
+    # Importing the app does no I/O; the database is first reached here, before the first request
+    setup_database()
+    if DB_MODE == "async":
+        async with async_engine.connect():
+            pass
+    with _running_apps_lock:
+        _running_apps += 1
+        first = _running_apps == 1
+    if first:
+        notification_dispatcher.start()
+        # Deletions interrupted by a restart carry on from their last committed chunk
+        for job_id in unfinished_purge_jobs():
+            purge_dispatcher.submit(job_id)
+    try:
+        yield
+    finally:
+        with _running_apps_lock:
+            _running_apps -= 1
+            last = _running_apps == 0
+        if last:
+            # Drain queued notifications before the process exits
+            notification_dispatcher.stop()
+            # An unfinished purge resumes at the next start
+            purge_dispatcher.stop()
+            if DB_MODE == "async":
+                await async_engine.dispose()
+                if async_read_engine is not None:
+                    await async_read_engine.dispose()
+
+# Routes are declared on this router; create_app() builds the app that serves them
+router = APIRouter(route_class=asyncdb.session_route(get_db, get_async_db) if DB_MODE == "async" else observability.ProfiledRoute)
+
+# ----- METRICS -----
+metrics = observability.MetricsRegistry()
+observability.instrument(engine, SessionLocal)
+if read_engine is not None:
+    observability.instrument(read_engine)
+if DB_MODE == "async":
+    observability.instrument(async_engine.sync_engine, asyncdb.RunSyncSession)
+    if async_read_engine is not None:
+        observability.instrument(async_read_engine.sync_engine)
+
+def cache_metric(field):
+    return lambda: [({"cache": name}, cache.stats()[field]) for name, cache in [("dashboard", dashboard_cache), ("settlement", settlement_cache)]]
+
+metrics.add_gauge("cache_entries", "Entries held per cache.", cache_metric("size"))
+metrics.add_gauge("cache_hits", "Cache hits since start.", cache_metric("hits"))
+metrics.add_gauge("cache_misses", "Cache misses since start.", cache_metric("misses"))
+metrics.add_gauge("dashboard_computations", "Dashboard computations run on a cache miss.", lambda: dashboard_flights.stats()["computed"])
+metrics.add_gauge("dashboard_coalesced", "Dashboard requests that waited for a computation already in flight.", lambda: dashboard_flights.stats()["coalesced"])
+metrics.add_gauge("dashboard_in_flight", "Dashboard computations running now.", lambda: dashboard_flights.stats()["in_flight"])
+metrics.add_gauge("notification_queue_pending", "Notification jobs waiting for the dispatcher.", lambda: notification_dispatcher.stats()["pending"])
+metrics.add_gauge("notification_jobs_failed", "Notification jobs dropped after retries.", lambda: notification_dispatcher.stats()["failed"])
+metrics.add_gauge("purge_queue_pending", "Group purge jobs waiting for the dispatcher.", lambda: purge_dispatcher.stats()["pending"])
+metrics.add_gauge("purge_jobs_failed", "Group purge jobs dropped after retries; they resume at the next start.", lambda: purge_dispatcher.stats()["failed"])
+metrics.add_gauge("sse_subscribers", "Open notification streams.", notification_broker.subscriber_count)
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # ----- PYDANTIC SCHEMAS -----
 class UserCreate(BaseModel):
@@ -170,28 +595,32 @@ class ExpenseCreate(BaseModel):
     user_id: str
     amount: float
     category: str
-    date: str
+    date: datetime.date
     items: str = ""
 
 class MealCreate(BaseModel):
     group_id: str
     user_id: str
-    date: str
+    date: datetime.date
     breakfast: float = 0.0
     lunch: float = 0.0
     dinner: float = 0.0
     dinner: float = 0.0
     guest_meal_count: float = 0.0
 
+class MealBatch(BaseModel):
+    entries: List[MealCreate]
+    upsert: bool = True  # replace an existing entry for the same member and date
+
 class FundCreate(BaseModel):
     group_id: str
     user_id: str
     amount: float
-    date: str
+    date: datetime.date
 
 class FundUpdate(BaseModel):
     amount: float
-    date: str
+    date: datetime.date
 
 class MealUpdate(BaseModel):
     breakfast: Optional[float] = None
@@ -217,14 +646,21 @@ class RoleUpdate(BaseModel):
 class MealRequestCreate(BaseModel):
     group_id: str
     user_id: str
-    date: str
+    date: datetime.date
     message: str
 
 class MealRequestUpdate(BaseModel):
     status: str
 
+class PeriodCloseCreate(BaseModel):
+    end_date: Optional[datetime.date] = None  # defaults to today
+
+class NotificationsRead(BaseModel):
+    ids: List[str] = []
+    all: bool = False  # mark every unread notification of the user instead
+
 # ----- ROUTES -----
-@app.post("/api/signup")
+@router.post("/api/signup")
 def signup(user: UserCreate, db: Session = Depends(get_db)):
     if db.query(DBUser).filter(DBUser.username == user.username).first():
         raise HTTPException(status_code=400, detail="Username already exists")
@@ -236,14 +672,14 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
     db.commit()
     return {"id": new_user.id, "username": new_user.username, "email": new_user.email}
 
-@app.post("/api/login")
+@router.post("/api/login")
 def login(user: UserLogin, db: Session = Depends(get_db)):
     db_user = db.query(DBUser).filter(DBUser.email == user.email, DBUser.password == user.password).first()
     if not db_user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
     return {"id": db_user.id, "username": db_user.username, "email": db_user.email}
 
-@app.put("/api/users/{user_id}")
+@router.put("/api/users/{user_id}")
 def update_user(user_id: str, data: UserUpdate, db: Session = Depends(get_db)):
     user = db.query(DBUser).filter(DBUser.id == user_id).first()
     if not user:
@@ -258,24 +694,25 @@ def update_user(user_id: str, data: UserUpdate, db: Session = Depends(get_db)):
         if db.query(DBUser).filter(DBUser.email == data.email).first():
             raise HTTPException(status_code=400, detail="Email already taken")
         user.email = data.email
-        
+
+    bump_group_versions(db, [gid for (gid,) in db.query(user_groups.c.group_id).filter(user_groups.c.user_id == user_id)])
     db.commit()
     return {"id": user.id, "username": user.username, "email": user.email}
 
-@app.get("/api/users/{user_id}/groups")
+@router.get("/api/users/{user_id}/groups")
 def get_user_groups(user_id: str, db: Session = Depends(get_db)):
-    db_user = db.query(DBUser).filter(DBUser.id == user_id).first()
-    if not db_user:
+    if not db.query(DBUser.id).filter(DBUser.id == user_id).first():
         raise HTTPException(status_code=404, detail="User not found")
-    
+    groups = db.query(DBGroup).join(user_groups, user_groups.c.group_id == DBGroup.id).filter(user_groups.c.user_id == user_id)
     return [
         {"id": g.id, "unique_name": g.unique_name, "display_name": g.display_name, "group_type": g.group_type, "manager_id": g.manager_id} 
-        for g in db_user.groups
+        for g in groups
     ]
 
-@app.post("/api/groups")
+@router.post("/api/groups")
 def create_group(group: GroupCreate, db: Session = Depends(get_db)):
-    if db.query(DBGroup).filter(DBGroup.unique_name == group.unique_name).first():
+    # A group being deleted keeps its name until the purge is done
+    if db.query(DBGroup).filter(DBGroup.unique_name == group.unique_name).execution_options(include_deleted=True).first():
         raise HTTPException(status_code=400, detail="Group username matches an existing group. Try another.")
     
     db_user = db.query(DBUser).filter(DBUser.id == group.user_id).first()
@@ -286,14 +723,15 @@ def create_group(group: GroupCreate, db: Session = Depends(get_db)):
     new_group.members.append(db_user) # Auto-add creator
     
     # Add creator as Manager role
-    creator_role = DBGroupRole(id=str(uuid.uuid4()), group_id=new_group.id, user_id=group.user_id, is_manager=True, title="Manager")
+    creator_role = DBGroupRole(id=str(uuid.uuid4()), group_id=new_group.id, user_id=group.user_id, is_manager=True, title="Manager", change_seq=0)
     db.add(creator_role)
+    db.add(DBGroupLedger(group_id=new_group.id, total_bazar=ZERO, total_meals=0.0, total_fixed=ZERO, total_expenses=ZERO, total_funds=ZERO, member_count=1, version=0))
     
     db.add(new_group)
     db.commit()
     return {"id": new_group.id, "unique_name": new_group.unique_name, "display_name": new_group.display_name, "group_type": new_group.group_type, "manager_id": new_group.manager_id}
 
-@app.post("/api/groups/join")
+@router.post("/api/groups/join")
 def join_group(data: JoinGroup, db: Session = Depends(get_db)):
     group = db.query(DBGroup).filter(DBGroup.unique_name == data.group_unique_name).first()
     if not group:
@@ -303,116 +741,559 @@ def join_group(data: JoinGroup, db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if user in group.members:
+    # Checked under the ledger lock, so a concurrent join of the same user sees this one's row
+    bump_group_version(db, group.id)
+    if is_member(db, group.id, user.id):
         raise HTTPException(status_code=400, detail="You are already in this group!")
         
-    group.members.append(user)
+    seq = bump_ledger(db, group.id, {DBGroupLedger.member_count: DBGroupLedger.member_count + 1})
+    db.execute(insert(user_groups).values(user_id=user.id, group_id=group.id))
     
     # Add as Member role
-    member_role = DBGroupRole(id=str(uuid.uuid4()), group_id=group.id, user_id=user.id, is_manager=False, title="Member")
+    member_role = DBGroupRole(id=str(uuid.uuid4()), group_id=group.id, user_id=user.id, is_manager=False, title="Member", change_seq=seq)
     db.add(member_role)
     
     db.commit()
     return {"id": group.id, "unique_name": group.unique_name, "display_name": group.display_name, "group_type": group.group_type, "manager_id": group.manager_id}
 
-@app.delete("/api/groups/{group_id}")
+@router.delete("/api/groups/{group_id}", status_code=202)
 def delete_group(group_id: str, db: Session = Depends(get_db)):
-    group = db.query(DBGroup).filter(DBGroup.id == group_id).first()
+    """Hide the group at once and purge its rows in the background; GET .../deletion reports the progress."""
+    group = db.query(DBGroup).filter(DBGroup.id == group_id).execution_options(include_deleted=True).first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
-        
-    db.query(DBGroupRole).filter(DBGroupRole.group_id == group_id).delete()
-    db.query(DBExpense).filter(DBExpense.group_id == group_id).delete()
-    db.query(DBMeal).filter(DBMeal.group_id == group_id).delete()
-    db.query(DBFund).filter(DBFund.group_id == group_id).delete()
-    group.members.clear()
-    
-    db.delete(group)
-    db.commit()
-    return {"message": "Group deleted successfully"}
 
-@app.delete("/api/groups/{group_id}/members/{user_id}")
+    job = db.query(DBPurgeJob).filter(DBPurgeJob.group_id == group_id).first()
+    if job is None:
+        now = datetime.datetime.now().isoformat()
+        group.deleted_at = now
+        job = DBPurgeJob(id=str(uuid.uuid4()), group_id=group_id, status="pending", purged=0, created_at=now, updated_at=now)
+        db.add(job)
+        db.commit()
+    # Submitted again on a repeated DELETE, in case an earlier run was dropped; a finished job does nothing
+    purge_dispatcher.submit(job.id)
+    return {"message": "Group deleted", "deletion": serialize_purge_job(job)}
+
+@router.get("/api/groups/{group_id}/deletion")
+def get_group_deletion(group_id: str, db: Session = Depends(get_db)):
+    job = db.query(DBPurgeJob).filter(DBPurgeJob.group_id == group_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Group is not being deleted")
+    return serialize_purge_job(job)
+
+@router.delete("/api/groups/{group_id}/members/{user_id}")
 def remove_member(group_id: str, user_id: str, db: Session = Depends(get_db)):
-    group = db.query(DBGroup).filter(DBGroup.id == group_id).first()
-    user = db.query(DBUser).filter(DBUser.id == user_id).first()
-    if not group or not user:
-        raise HTTPException(status_code=404, detail="Not found")
+    get_live_group(db, group_id)
+    if not db.query(DBUser.id).filter(DBUser.id == user_id).first():
+        raise HTTPException(status_code=404, detail="User not found")
     
-    if user in group.members:
-        group.members.remove(user)
-    db.query(DBGroupRole).filter(DBGroupRole.group_id == group_id, DBGroupRole.user_id == user_id).delete()
+    # Under the ledger lock a concurrent removal of the same member deletes nothing, and so takes nothing off the count
+    seq = bump_group_version(db, group_id)
+    removed_members = db.execute(delete(user_groups).where(user_groups.c.group_id == group_id, user_groups.c.user_id == user_id)).rowcount
+    if removed_members:
+        seq = bump_ledger(db, group_id, {DBGroupLedger.member_count: DBGroupLedger.member_count - removed_members})
+    removed = db.execute(delete(DBGroupRole).where(DBGroupRole.group_id == group_id, DBGroupRole.user_id == user_id).returning(DBGroupRole.id)).scalars().all()
+    add_tombstones(db, group_id, "roles", removed, seq)
     db.commit()
     return {"message": "Member removed"}
 
+# ----- QUERIES -----
+# Relationships the dashboard reads; eager-loaded so their cost doesn't depend on access order
+DASHBOARD_LOADS = (selectinload(DBGroup.members), selectinload(DBGroup.roles), selectinload(DBGroup.member_ledgers))
+
+def is_member(db: Session, group_id: str, user_id: str) -> bool:
+    return db.query(user_groups.c.user_id).filter(user_groups.c.group_id == group_id, user_groups.c.user_id == user_id).first() is not None
+
+def load_dashboard_group(db: Session, group_id: str):
+    """The group with everything the dashboard needs, in one statement per relationship."""
+    return db.query(DBGroup).options(*DASHBOARD_LOADS).filter(DBGroup.id == group_id).first()
+
+# ----- LEDGER -----
+FIXED_CATEGORIES = ['Rent', 'Utilities']
+ZERO = Decimal("0")
+
+def meal_count(m):
+    return m.breakfast + m.lunch + m.dinner + m.guest_meal_count
+
+def to_money(amount) -> Decimal:
+    """Amounts arrive as JSON floats; go through str so 0.1 stays 0.1.
+
+    Rounded half up to cents, the scale of the money columns, so the stored row, the ledger delta and any
+    aggregate agree on every backend (SQLite would otherwise keep the extra digits that PostgreSQL rounds).
+    """
+    return Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+def iso_date(d):
+    return d.isoformat() if d else None
+
+def aggregate_group_totals(db: Session, group_id: str, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None, undated: bool = False):
+    """Compute group and per-member totals from raw rows with GROUP BY queries.
+
+    Money totals are Decimals, meal counts floats. The optional date window is inclusive; rows without a
+    date (legacy data) fall outside any upper bound unless `undated` is set.
+    """
+    def windowed(query, model):
+        query = query.filter(model.group_id == group_id)
+        if date_from:
+            query = query.filter(model.date >= date_from)
+        if date_to:
+            query = query.filter(or_(model.date <= date_to, model.date.is_(None)) if undated else model.date <= date_to)
+        return query
+
+    totals = {"total_bazar": ZERO, "total_meals": 0.0, "total_fixed": ZERO, "total_expenses": ZERO, "total_funds": ZERO}
+    members = defaultdict(lambda: {"meals": 0.0, "expense_credit": ZERO, "funds": ZERO})
+
+    expense_rows = windowed(db.query(DBExpense.user_id, DBExpense.category, func.sum(DBExpense.amount)), DBExpense) \
+        .group_by(DBExpense.user_id, DBExpense.category)
+    for uid, category, amount in expense_rows:
+        totals["total_expenses"] += amount
+        if category.startswith('Bazar'):
+            totals["total_bazar"] += amount
+        if category in FIXED_CATEGORIES:
+            totals["total_fixed"] += amount
+        members[uid]["expense_credit"] += amount
+
+    meal_total = DBMeal.breakfast + DBMeal.lunch + DBMeal.dinner + DBMeal.guest_meal_count
+    for uid, count in windowed(db.query(DBMeal.user_id, func.sum(meal_total)), DBMeal).group_by(DBMeal.user_id):
+        totals["total_meals"] += count
+        members[uid]["meals"] += count
+
+    for uid, amount in windowed(db.query(DBFund.user_id, func.sum(DBFund.amount)), DBFund).group_by(DBFund.user_id):
+        totals["total_funds"] += amount
+        members[uid]["funds"] += amount
+
+    totals["member_count"] = db.query(func.count()).select_from(user_groups).filter(user_groups.c.group_id == group_id).scalar()
+    totals["members"] = dict(members)
+    return totals
+
+def ledger_totals(group: DBGroup):
+    """The stored ledger of a group in the same shape as aggregate_group_totals."""
+    ledger = group.ledger
+    totals = {field: getattr(ledger, field) for field in ["total_bazar", "total_meals", "total_fixed", "total_expenses", "total_funds", "member_count"]}
+    totals["members"] = {ml.user_id: {"meals": ml.meals, "expense_credit": ml.expense_credit, "funds": ml.funds} for ml in group.member_ledgers}
+    return totals
+
+def claim_ledger(db: Session, group_id: str):
+    """Insert an empty ledger row for the group unless it has one. True if this transaction created it.
+
+    A concurrent claim waits for the transaction holding the new row and then inserts nothing.
+    """
+    values = dict(group_id=group_id, total_bazar=ZERO, total_meals=0.0, total_fixed=ZERO, total_expenses=ZERO, total_funds=ZERO, member_count=0, version=0)
+    return db.execute(dialect_insert(db, DBGroupLedger.__table__).values(**values).on_conflict_do_nothing(index_elements=["group_id"])).rowcount == 1
+
+def rebuild_ledger(db: Session, group_id: str):
+    """Replace the stored ledger of a group, and its daily rollups, with totals recomputed from raw rows.
+
+    The ledger row is created or bumped before the raw rows are read, and its lock is held until commit:
+    writers wait for the rebuild instead of committing deltas that it would overwrite.
+    """
+    if not claim_ledger(db, group_id):
+        # Keep the version moving forward so cached dashboards of the old totals are never served again
+        bump_ledger(db, group_id, {})
+    totals = aggregate_group_totals(db, group_id)
+    db.query(DBGroupLedger).filter(DBGroupLedger.group_id == group_id).update({k: v for k, v in totals.items() if k != "members"}, synchronize_session=False)
+    db.query(DBMemberLedger).filter(DBMemberLedger.group_id == group_id).delete()
+    if totals["members"]:
+        db.execute(insert(DBMemberLedger), [{"group_id": group_id, "user_id": uid, **vals} for uid, vals in totals["members"].items()])
+    rebuild_rollups(db, group_id)
+    return db.query(DBGroupLedger).populate_existing().filter(DBGroupLedger.group_id == group_id).first()
+
+def verify_ledger(db: Session, group_id: str, tolerance: float = 0.005):
+    """Compare the stored ledger with the raw rows. Returns a list of drift descriptions."""
+    totals = aggregate_group_totals(db, group_id)
+    ledger = db.query(DBGroupLedger).filter(DBGroupLedger.group_id == group_id).first()
+    if not ledger:
+        return ["ledger missing"]
+
+    drift = []
+    for field, expected in totals.items():
+        if field == "members":
+            continue
+        stored = getattr(ledger, field) or 0
+        if abs(stored - expected) > tolerance:
+            drift.append(f"{field}: stored {stored}, expected {expected}")
+
+    stored_members = {ml.user_id: ml for ml in db.query(DBMemberLedger).filter(DBMemberLedger.group_id == group_id)}
+    for uid in set(stored_members) | set(totals["members"]):
+        expected = totals["members"].get(uid, {})
+        for field in ["meals", "expense_credit", "funds"]:
+            stored = (getattr(stored_members[uid], field) or 0) if uid in stored_members else 0
+            if abs(stored - expected.get(field, 0)) > tolerance:
+                drift.append(f"{uid}.{field}: stored {stored}, expected {expected.get(field, 0)}")
+    return drift
+
+def ensure_ledger(db: Session, group_id: str):
+    """Return the group's ledger, building it from raw rows for groups that predate it. None for a deleted group.
+
+    Write endpoints must call this before adding their own rows so the rebuild doesn't count them twice.
+    """
+    ledger = db.query(DBGroupLedger).filter(DBGroupLedger.group_id == group_id).first()
+    if ledger:
+        return ledger
+    # The purge may already have removed the ledger of a deleted group; don't bring it back
+    if db.query(DBGroup.id).filter(DBGroup.id == group_id, DBGroup.deleted_at != None).execution_options(include_deleted=True).first():
+        return None
+    if claim_ledger(db, group_id):
+        return rebuild_ledger(db, group_id)
+    # Another request built it first
+    return db.query(DBGroupLedger).filter(DBGroupLedger.group_id == group_id).first()
+
+def bump_group_version(db: Session, group_id: str):
+    """Mark the group's data as changed for writes that don't move any totals. Returns the new version."""
+    return apply_ledger_delta(db, group_id, None)
+
+def bump_group_versions(db: Session, group_ids):
+    """bump_group_version for many groups with a single UPDATE."""
+    group_ids = list(group_ids)
+    if not group_ids:
+        return
+    have_ledger = {gid for (gid,) in db.query(DBGroupLedger.group_id).filter(DBGroupLedger.group_id.in_(group_ids))}
+    for gid in group_ids:
+        if gid not in have_ledger:
+            ensure_ledger(db, gid)
+    db.query(DBGroupLedger).filter(DBGroupLedger.group_id.in_(group_ids)).update({DBGroupLedger.version: DBGroupLedger.version + 1}, synchronize_session=False)
+
+def bump_ledger(db: Session, group_id: str, group_delta):
+    """Apply {column: expression} to the group ledger along with a version bump; returns the new version.
+
+    Rows written in the same transaction are stamped with it as their change_seq. The UPDATE locks the
+    ledger row until commit, so a group's writes commit in the order of the versions they were given.
+    """
+    stmt = update(DBGroupLedger).where(DBGroupLedger.group_id == group_id).values({DBGroupLedger.version: DBGroupLedger.version + 1, **group_delta})
+    return db.execute(stmt.returning(DBGroupLedger.version).execution_options(synchronize_session=False)).scalar()
+
+def apply_ledger_delta(db: Session, group_id: str, user_id: Optional[str], meals=0.0, expense=ZERO, category=None, funds=ZERO, members=0):
+    """Add one write's deltas to the group and member ledgers. Returns the group's new version."""
+    ensure_ledger(db, group_id)
+
+    group_delta = {}
+    if meals:
+        group_delta[DBGroupLedger.total_meals] = DBGroupLedger.total_meals + meals
+    if expense:
+        group_delta[DBGroupLedger.total_expenses] = DBGroupLedger.total_expenses + expense
+        if category and category.startswith('Bazar'):
+            group_delta[DBGroupLedger.total_bazar] = DBGroupLedger.total_bazar + expense
+        if category in FIXED_CATEGORIES:
+            group_delta[DBGroupLedger.total_fixed] = DBGroupLedger.total_fixed + expense
+    if funds:
+        group_delta[DBGroupLedger.total_funds] = DBGroupLedger.total_funds + funds
+    if members:
+        group_delta[DBGroupLedger.member_count] = DBGroupLedger.member_count + members
+    version = bump_ledger(db, group_id, group_delta)
+
+    if not (meals or expense or funds):
+        return version
+    updated = db.query(DBMemberLedger).filter(DBMemberLedger.group_id == group_id, DBMemberLedger.user_id == user_id).update({
+        DBMemberLedger.meals: DBMemberLedger.meals + meals,
+        DBMemberLedger.expense_credit: DBMemberLedger.expense_credit + expense,
+        DBMemberLedger.funds: DBMemberLedger.funds + funds,
+    }, synchronize_session=False)
+    if not updated:
+        # First entry of this member; flushed so a later delta in the same session finds the row
+        db.add(DBMemberLedger(group_id=group_id, user_id=user_id, meals=meals, expense_credit=expense, funds=funds))
+        db.flush()
+    return version
+
+def apply_ledger_deltas(db: Session, group_id: str, member_deltas, totals):
+    """apply_ledger_delta for many members at once, in a fixed number of statements.
+
+    `member_deltas` maps user ids to increments of "meals", "expense_credit" and "funds"; `totals` maps group ledger fields to theirs.
+    Returns the group's new version, or None when there was nothing to apply.
+    """
+    if not member_deltas and not any(totals.values()):
+        return None
+    ensure_ledger(db, group_id)
+    group_delta = {}
+    for field, delta in totals.items():
+        if delta:
+            column = getattr(DBGroupLedger, field)
+            group_delta[column] = column + delta
+    version = bump_ledger(db, group_id, group_delta)
+
+    deltas = {uid: {"meals": d.get("meals", 0.0), "expense_credit": d.get("expense_credit", ZERO), "funds": d.get("funds", ZERO)} for uid, d in member_deltas.items()}
+    existing = {uid for (uid,) in db.query(DBMemberLedger.user_id).filter(DBMemberLedger.group_id == group_id, DBMemberLedger.user_id.in_(deltas))} if deltas else set()
+    missing = [{"group_id": group_id, "user_id": uid, **d} for uid, d in deltas.items() if uid not in existing]
+    if missing:
+        db.execute(insert(DBMemberLedger), missing)
+    ledger = DBMemberLedger.__table__
+    increments = [{"b_group": group_id, "b_user": uid, "b_meals": d["meals"], "b_expense": d["expense_credit"], "b_funds": d["funds"]} for uid, d in deltas.items() if uid in existing]
+    if increments:
+        db.execute(
+            ledger.update().where(ledger.c.group_id == bindparam("b_group"), ledger.c.user_id == bindparam("b_user")).values(
+                meals=ledger.c.meals + bindparam("b_meals"), expense_credit=ledger.c.expense_credit + bindparam("b_expense"), funds=ledger.c.funds + bindparam("b_funds")),
+            increments,
+        )
+    return version
+
+# ----- DAILY ROLLUPS -----
+ROLLUP_MEALS = ["breakfast", "lunch", "dinner", "guest_meals"]
+ROLLUP_MONEY = ["bazar", "fixed", "expenses", "funds"]
+
+def empty_rollup():
+    return {**dict.fromkeys(ROLLUP_MEALS, 0.0), **dict.fromkeys(ROLLUP_MONEY, ZERO)}
+
+def meal_rollup(breakfast, lunch, dinner, guest_meal_count, sign=1):
+    return {"breakfast": sign * breakfast, "lunch": sign * lunch, "dinner": sign * dinner, "guest_meals": sign * guest_meal_count}
+
+def expense_rollup(amount, category):
+    values = {"expenses": amount}
+    if category.startswith('Bazar'):
+        values["bazar"] = amount
+    if category in FIXED_CATEGORIES:
+        values["fixed"] = amount
+    return values
+
+def fund_rollup(amount):
+    return {"funds": amount}
+
+def add_rollup(deltas, user_id: str, date: datetime.date, values):
+    """Add one write's rollup values to `deltas`, a {(user_id, date): values} map. Returns `deltas`.
+
+    Undated legacy rows have no day to roll up into, as in rebuild_rollups.
+    """
+    if date is None:
+        return deltas
+    row = deltas.setdefault((user_id, date), empty_rollup())
+    for field, value in values.items():
+        row[field] += value
+    return deltas
+
+def dialect_insert(db: Session, table):
+    """An INSERT that takes ON CONFLICT clauses; PostgreSQL and SQLite share the syntax."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_for
+    else:
+        from sqlalchemy.dialects.sqlite import insert as insert_for
+    return insert_for(table)
+
+def upsert_increments(db: Session, table, keys, rows):
+    """Insert rows, or add their values to the rows already there, in one statement."""
+    stmt = dialect_insert(db, table)
+    db.execute(stmt.on_conflict_do_update(index_elements=keys, set_={f: table.c[f] + stmt.excluded[f] for f in ROLLUP_MEALS + ROLLUP_MONEY}), rows)
+
+def apply_rollup_deltas(db: Session, group_id: str, deltas):
+    """Add {(user_id, date): values} to the member and group daily rollups, one statement per table."""
+    if not deltas:
+        return
+    days = {}
+    for (_, date), values in deltas.items():
+        add_rollup(days, None, date, values)
+    upsert_increments(db, DBGroupDaily.__table__, ["group_id", "date"], [{"group_id": group_id, "date": date, **v} for (_, date), v in days.items()])
+    upsert_increments(db, DBMemberDaily.__table__, ["group_id", "user_id", "date"], [{"group_id": group_id, "user_id": uid, "date": date, **v} for (uid, date), v in deltas.items()])
+
+def rebuild_rollups(db: Session, group_id: str):
+    """Replace a group's daily rollups with totals recomputed from raw rows (undated legacy rows have no day to go in)."""
+    db.query(DBMemberDaily).filter(DBMemberDaily.group_id == group_id).delete()
+    db.query(DBGroupDaily).filter(DBGroupDaily.group_id == group_id).delete()
+    deltas = {}
+    meal_sums = [func.sum(DBMeal.breakfast), func.sum(DBMeal.lunch), func.sum(DBMeal.dinner), func.sum(DBMeal.guest_meal_count)]
+    for uid, date, *counts in db.query(DBMeal.user_id, DBMeal.date, *meal_sums).filter(DBMeal.group_id == group_id, DBMeal.date != None).group_by(DBMeal.user_id, DBMeal.date):
+        add_rollup(deltas, uid, date, meal_rollup(*[c or 0.0 for c in counts]))
+    expense_rows = db.query(DBExpense.user_id, DBExpense.date, DBExpense.category, func.sum(DBExpense.amount)).filter(DBExpense.group_id == group_id, DBExpense.date != None) \
+        .group_by(DBExpense.user_id, DBExpense.date, DBExpense.category)
+    for uid, date, category, amount in expense_rows:
+        add_rollup(deltas, uid, date, expense_rollup(amount, category))
+    for uid, date, amount in db.query(DBFund.user_id, DBFund.date, func.sum(DBFund.amount)).filter(DBFund.group_id == group_id, DBFund.date != None).group_by(DBFund.user_id, DBFund.date):
+        add_rollup(deltas, uid, date, fund_rollup(amount))
+    apply_rollup_deltas(db, group_id, deltas)
+
+TOTAL_FIELDS = ["total_bazar", "total_meals", "total_fixed", "total_expenses", "total_funds"]
+
+def latest_close(db: Session, group_id: str):
+    return db.query(DBPeriodClose).filter(DBPeriodClose.group_id == group_id).order_by(DBPeriodClose.end_date.desc()).first()
+
+def get_live_group(db: Session, group_id: str):
+    """The group a write goes to. 404 if there is none, including a deleted group, purged or not (hide_deleted_groups).
+
+    Every group-scoped write goes through this, so nothing is ever written for a group the purge won't visit again.
+    """
+    group = db.query(DBGroup).filter(DBGroup.id == group_id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return group
+
+def check_period_open(db: Session, group_id: str, *dates):
+    """Reject writes dated inside a closed period; their totals are frozen in its snapshot.
+
+    Undated rows belong to the group's first close (close_period), so once there is one they are frozen too.
+    """
+    closed_through = db.query(func.max(DBPeriodClose.end_date)).filter(DBPeriodClose.group_id == group_id).scalar()
+    if closed_through and any(d is None or d <= closed_through for d in dates):
+        raise HTTPException(status_code=409, detail=f"Entries up to {closed_through} are in a closed period")
+
+def closed_totals(db: Session, group_id: str):
+    """Sum of every closed period of a group, in the shape of aggregate_group_totals."""
+    return closed_totals_by_group(db, [group_id])[group_id]
+
+def closed_totals_by_group(db: Session, group_ids):
+    """closed_totals for many groups in two grouped queries; groups without closes sum to zero."""
+    result = {gid: {**{f: 0.0 if f == "total_meals" else ZERO for f in TOTAL_FIELDS}, "members": {}} for gid in group_ids}
+    rows = db.query(DBPeriodClose.group_id, *[func.sum(getattr(DBPeriodClose, f)) for f in TOTAL_FIELDS]).filter(DBPeriodClose.group_id.in_(group_ids)).group_by(DBPeriodClose.group_id)
+    for gid, *sums in rows:
+        result[gid].update({field: value or (0.0 if field == "total_meals" else ZERO) for field, value in zip(TOTAL_FIELDS, sums)})
+    member_rows = db.query(DBPeriodClose.group_id, DBPeriodCloseMember.user_id, func.sum(DBPeriodCloseMember.meals), func.sum(DBPeriodCloseMember.expense_credit), func.sum(DBPeriodCloseMember.funds)) \
+        .join(DBPeriodClose, DBPeriodClose.id == DBPeriodCloseMember.close_id) \
+        .filter(DBPeriodClose.group_id.in_(group_ids)).group_by(DBPeriodClose.group_id, DBPeriodCloseMember.user_id)
+    for gid, uid, meals, credit, funds in member_rows:
+        result[gid]["members"][uid] = {"meals": meals or 0.0, "expense_credit": credit or ZERO, "funds": funds or ZERO}
+    return result
+
+def latest_closes(db: Session, group_ids):
+    """The latest close of each group that has one, with its member snapshots loaded."""
+    latest = db.query(DBPeriodClose.group_id, func.max(DBPeriodClose.end_date).label("end_date")).filter(DBPeriodClose.group_id.in_(group_ids)).group_by(DBPeriodClose.group_id).subquery()
+    closes = db.query(DBPeriodClose).options(selectinload(DBPeriodClose.members)) \
+        .join(latest, and_(DBPeriodClose.group_id == latest.c.group_id, DBPeriodClose.end_date == latest.c.end_date))
+    return {close.group_id: close for close in closes}
+
+def open_period_totals(totals, closed):
+    """All-time totals minus the closed periods: what happened since the last close."""
+    result = {field: totals[field] - closed[field] for field in TOTAL_FIELDS}
+    result["member_count"] = totals["member_count"]
+    result["members"] = {}
+    for uid in set(totals["members"]) | set(closed["members"]):
+        now = totals["members"].get(uid, {"meals": 0.0, "expense_credit": ZERO, "funds": ZERO})
+        before = closed["members"].get(uid, {"meals": 0.0, "expense_credit": ZERO, "funds": ZERO})
+        result["members"][uid] = {field: now[field] - before[field] for field in ["meals", "expense_credit", "funds"]}
+    return result
+
+def opening_balances(close):
+    return {m.user_id: float(m.balance) for m in close.members} if close else {}
+
+def serialize_close(close):
+    return {
+        "id": close.id, "start_date": iso_date(close.start_date), "end_date": iso_date(close.end_date), "closed_at": close.closed_at,
+        "meal_rate": close.meal_rate, "total_bazar": float(close.total_bazar), "total_meals": close.total_meals,
+        "total_fixed_expenses": float(close.total_fixed), "total_expenses": float(close.total_expenses), "total_funds": float(close.total_funds),
+    }
+
 # Core Logic Engine (same as before but adapted for SQLAlchemy models)
-def calculate_dashboard_metrics(group: DBGroup):
+def serialize_expense(e, user_name):
+    return {"id": e.id, "amount": float(e.amount), "category": e.category, "date": iso_date(e.date), "items": e.items, "user": user_name, "user_id": e.user_id}
+
+def serialize_meal(m, user_name):
+    return {"id": m.id, "date": iso_date(m.date), "user": user_name, "user_id": m.user_id, "breakfast": m.breakfast, "lunch": m.lunch, "dinner": m.dinner, "guest_meal_count": m.guest_meal_count}
+
+def serialize_fund(f, user_name):
+    return {"id": f.id, "amount": float(f.amount), "date": iso_date(f.date), "user": user_name, "user_id": f.user_id}
+
+def serialize_meal_request(r, user_name):
+    return {"id": r.id, "user_id": r.user_id, "user_name": user_name or "Unknown", "date": iso_date(r.date), "status": r.status, "message": r.message}
+
+def serialize_role(r, user_name):
+    return {"id": r.id, "user_id": r.user_id, "user": user_name, "is_manager": r.is_manager, "title": r.title}
+
+LEDGER_LISTS = {
+    "expenses": (DBExpense, [DBExpense.id, DBExpense.amount, DBExpense.category, DBExpense.date, DBExpense.items, DBExpense.user_id], serialize_expense),
+    "meals": (DBMeal, [DBMeal.id, DBMeal.date, DBMeal.user_id, DBMeal.breakfast, DBMeal.lunch, DBMeal.dinner, DBMeal.guest_meal_count], serialize_meal),
+    "funds": (DBFund, [DBFund.id, DBFund.amount, DBFund.date, DBFund.user_id], serialize_fund),
+}
+
+# Dashboard detail lists and the LEDGER_LISTS kind each one holds
+DASHBOARD_LISTS = {"raw_expenses": "expenses", "meals": "meals", "funds": "funds"}
+
+def ledger_rows(db: Session, kind: str, group_id: str, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None):
+    model, columns, _ = LEDGER_LISTS[kind]
+    query = db.query(*columns).filter(model.group_id == group_id)
+    if date_from:
+        query = query.filter(model.date >= date_from)
+    if date_to:
+        query = query.filter(model.date <= date_to)
+    return query
+
+def period_window(period: Optional[str]):
+    """Turn a "YYYY" or "YYYY-MM" period into an inclusive (from, to) date window."""
+    if not period:
+        return None, None
+    try:
+        parts = [int(p) for p in period.split("-")]
+        if len(parts) == 1 and len(period) == 4:
+            return datetime.date(parts[0], 1, 1), datetime.date(parts[0], 12, 31)
+        if len(parts) == 2 and 1 <= parts[1] <= 12:
+            last_day = calendar.monthrange(parts[0], parts[1])[1]
+            return datetime.date(parts[0], parts[1], 1), datetime.date(parts[0], parts[1], last_day)
+    except ValueError:
+        pass
+    raise HTTPException(status_code=400, detail="Invalid period. Use YYYY or YYYY-MM.")
+
+def compute_balances(group: DBGroup, totals, opening=None):
+    """Return (meal_rate, balances rounded to cents) for the given totals.
+
+    `opening` maps user ids to balances carried over from the last closed period.
+    """
     members = group.members
-    expenses = group.expenses
-    meals = group.meals
+    member_totals = sorted(totals["members"].items())
 
-    total_bazar = sum(e.amount for e in expenses if e.category.startswith('Bazar'))
-    total_meals = sum(m.breakfast + m.lunch + m.dinner + m.guest_meal_count for m in meals)
+    # Money is stored exactly; the balance arithmetic below works in floats as it always has
+    total_bazar = float(totals["total_bazar"])
+    total_meals = totals["total_meals"]
     meal_rate = round(total_bazar / total_meals, 2) if total_meals > 0 else 0.0
-    fixed_expenses = sum(e.amount for e in expenses if e.category in ['Rent', 'Utilities'])
+    fixed_expenses = float(totals["total_fixed"])
+    member_count = totals["member_count"]
 
-    balances = defaultdict(float)
+    # Members first so the users list keeps a stable order
+    balances = defaultdict(float, {m.id: 0.0 for m in members})
+    for uid, amount in (opening or {}).items():
+        balances[uid] += amount
     # Credits
-    for e in expenses:
-        balances[e.user_id] += e.amount
+    for uid, t in member_totals:
+        balances[uid] += float(t["expense_credit"])
 
     if group.group_type == "monthly_avg":
-        total_expenses = sum(e.amount for e in expenses)
-        if members:
-            per_person_cost = total_expenses / len(members)
+        if member_count:
+            per_person_cost = float(totals["total_expenses"]) / member_count
             for m in members:
                 balances[m.id] -= per_person_cost
     else:
         # Debits for meals
-        for m in meals:
-            total_user_meals = m.breakfast + m.lunch + m.dinner + m.guest_meal_count
-            balances[m.user_id] -= (total_user_meals * meal_rate)
+        for uid, t in member_totals:
+            balances[uid] -= (t["meals"] * meal_rate)
 
         # Fixed Expenses
-        if members:
-            per_person_fixed = fixed_expenses / len(members)
+        if member_count:
+            per_person_fixed = fixed_expenses / member_count
             for m in members:
                 balances[m.id] -= per_person_fixed
 
     # Funds / Deposits
-    funds = group.funds
-    for f in funds:
-        balances[f.user_id] += f.amount
-        if group.manager_id:
-            balances[group.manager_id] -= f.amount
+    for uid, t in member_totals:
+        balances[uid] += float(t["funds"])
+    if group.manager_id and totals["total_funds"]:
+        balances[group.manager_id] -= float(totals["total_funds"])
+
+    return meal_rate, {uid: round(amt, 2) for uid, amt in balances.items()}
+
+def settle_balances(balances, cancel_exact: Optional[bool] = None):
+    """Settlement transfers [(debtor, creditor, cents)] for balances rounded to cents."""
+    if cancel_exact is None:
+        cancel_exact = SETTLEMENT_CANCEL_EXACT
+    cents = {uid: settlement.to_cents(amount) for uid, amount in balances.items()}
+    key = (frozenset(cents.items()), cancel_exact)
+    transfers = settlement_cache.get(key)
+    if transfers is None:
+        transfers = settlement.settle(cents, cancel_exact)
+        settlement_cache.set(key, transfers)
+    return transfers
+
+def calculate_dashboard_metrics(db: Session, group: DBGroup, totals=None, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None, details: bool = True, opening=None):
+    """Build the dashboard payload from group totals (the stored ledger unless given).
+
+    With a date window the detail lists are limited to it; pass the matching windowed totals.
+    """
+    if totals is None:
+        totals = ledger_totals(group)
+    members = group.members
+    member_totals = sorted(totals["members"].items())
+    meal_rate, balances_rounded = compute_balances(group, totals, opening)
+    total_bazar = float(totals["total_bazar"])
+    fixed_expenses = float(totals["total_fixed"])
 
-    balances_rounded = {uid: round(amt, 2) for uid, amt in balances.items()}
-    
     # Missing members shouldn't break the dict
     for member in members:
         if member.id not in balances_rounded:
             balances_rounded[member.id] = 0.0
 
     # Smart Settlement
-    debtors = [{'user': uid, 'amount': -amt} for uid, amt in balances_rounded.items() if amt < -0.01]
-    creditors = [{'user': uid, 'amount': amt} for uid, amt in balances_rounded.items() if amt > 0.01]
-    debtors.sort(key=lambda x: x['amount'], reverse=True)
-    creditors.sort(key=lambda x: x['amount'], reverse=True)
-
-    transactions = []
-    i, j = 0, 0
-    while i < len(debtors) and j < len(creditors):
-        debtor = debtors[i]
-        creditor = creditors[j]
-        settle_amount = min(debtor['amount'], creditor['amount'])
-        transactions.append({
-            "from_id": debtor['user'],
-            "to_id": creditor['user'],
-            "amount": round(settle_amount, 2)
-        })
-        debtor['amount'] -= settle_amount
-        creditor['amount'] -= settle_amount
-        if debtor['amount'] < 0.01: i += 1
-        if creditor['amount'] < 0.01: j += 1
+    transactions = settle_balances(balances_rounded)
 
     roles_dict = {r.user_id: r for r in group.roles}
     user_names = {m.id: m.username for m in members}
@@ -432,36 +1313,651 @@ def calculate_dashboard_metrics(group: DBGroup):
                 "title": title
             })
 
+    meals_by_user = {uid: t["meals"] for uid, t in member_totals}
     settlements = [
-        {"from_name": user_names.get(t['from_id']), "to_name": user_names.get(t['to_id']), "amount": t['amount']}
-        for t in transactions
+        {"from_id": debtor, "from_name": user_names.get(debtor), "to_id": creditor, "to_name": user_names.get(creditor), "amount": settlement.from_cents(cents)}
+        for debtor, creditor, cents in transactions
     ]
-    return {
+    result = {
         "manager_id": group.manager_id,
         "group_type": group.group_type,
-        "total_user_meals": {uid: sum(m.breakfast + m.lunch + m.dinner + m.guest_meal_count for m in meals if m.user_id == uid) for uid in user_names.keys()},
+        "total_user_meals": {uid: meals_by_user.get(uid, 0) for uid in user_names.keys()},
+        # Totals are rounded to cents so both engines agree regardless of float summation order
         "summary": {
             "meal_rate": meal_rate,
-            "total_bazar": total_bazar,
-            "total_meals": total_meals,
-            "total_fixed_expenses": fixed_expenses
+            "total_bazar": round(total_bazar, 2),
+            "total_meals": totals["total_meals"],
+            "total_fixed_expenses": round(fixed_expenses, 2)
         },
         "users": user_details,
         "settlements": settlements,
-        "raw_expenses": [{"id": e.id, "amount": e.amount, "category": e.category, "date": e.date, "items": e.items, "user": user_names.get(e.user_id), "user_id": e.user_id} for e in expenses],
-        "meals": [{"id": m.id, "date": m.date, "user": user_names.get(m.user_id), "user_id": m.user_id, "breakfast": m.breakfast, "lunch": m.lunch, "dinner": m.dinner, "guest_meal_count": m.guest_meal_count} for m in meals],
-        "funds": [{"id": f.id, "amount": f.amount, "date": f.date, "user": user_names.get(f.user_id), "user_id": f.user_id} for f in funds]
     }
+    if details:
+        for key, kind in DASHBOARD_LISTS.items():
+            serialize = LEDGER_LISTS[kind][2]
+            result[key] = [serialize(row, user_names.get(row.user_id)) for row in ledger_rows(db, kind, group.id, date_from, date_to)]
+    if date_from or date_to:
+        result["period"] = {"from": iso_date(date_from), "to": iso_date(date_to)}
+    return result
+
+def dashboard_totals(db: Session, group: DBGroup, period: Optional[str]):
+    """Return (totals, date_from, date_to, last close) for a period, or for the open one if none is given.
+
+    The open period covers what happened since the last close, starting from the balances it carried over.
+    """
+    date_from, date_to = period_window(period)
+    close = None if period else latest_close(db, group.id)
+    if close:
+        date_from = close.end_date + datetime.timedelta(days=1)
+    # The stored ledger only covers all-time totals; windows are always aggregated
+    if period or DASHBOARD_ENGINE == "aggregate":
+        totals = aggregate_group_totals(db, group.id, date_from, date_to)
+    else:
+        totals = ledger_totals(group)
+        if close:
+            totals = open_period_totals(totals, closed_totals(db, group.id))
+    return totals, date_from, date_to, close
+
+def build_dashboard(db, key):
+    group_id, _, period, details = key
+    group = load_dashboard_group(db, group_id)
+    totals, date_from, date_to, close = dashboard_totals(db, group, period)
+    data = calculate_dashboard_metrics(db, group, totals, date_from, date_to, details, opening_balances(close))
+    if close:
+        data["last_close"] = serialize_close(close)
+    dashboard_cache.set(key, data)
+    return data
+
+def json_response(request: Request, content, headers=None):
+    return payload.FastJSONResponse(content, headers=headers, accept_encoding=request.headers.get("accept-encoding", ""), min_size=RESPONSE_COMPRESS_MIN_BYTES)
+
+def response_etag(request: Request, etag: str):
+    """`etag` for the body json_response sends this request."""
+    return payload.coded_etag(etag, request.headers.get("accept-encoding", ""), RESPONSE_COMPRESS_MIN_BYTES)
+
+@router.get("/api/groups/{group_id}/dashboard")
+def get_dashboard(group_id: str, request: Request, period: Optional[str] = None, details: bool = True, layout: str = "rows", db: Session = Depends(get_db)):
+    """The group's dashboard. layout=columns sends the detail lists as {field: [values]} instead of a list of rows.
+
+    Built from SQL aggregates, the payload is not byte-identical to the original in-Python computation:
+    summary money totals are rounded to cents, "users" lists members in membership order, and "settlements"
+    come from settlement.settle in whole cents, so members may be paired differently (each transfer also
+    carries from_id and to_id). benchmarks/check_dashboard checks everything else against the old computation.
+    """
+    group = db.query(DBGroup).options(joinedload(DBGroup.ledger)).filter(DBGroup.id == group_id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    if layout not in ("rows", "columns"):
+        raise HTTPException(status_code=400, detail="Invalid layout. Use rows or columns.")
+    period_window(period)  # reject a malformed period before anything else
+    if group.ledger is None:
+        ensure_ledger(db, group_id)
+        db.commit()
+
+    version = group.ledger.version
+    etag = response_etag(request, f'"{group_id}-{version}-{period or "all"}-{int(details)}{"-columns" if layout == "columns" else ""}"')
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (group_id, version, period, details)
+    data = dashboard_cache.get(key)
+    if data is None:
+        data = dashboard_flights.do(key, lambda: build_dashboard(db, key))
+    if layout == "columns":
+        data = {**data, **{name: payload.columnar(data[name], EXPORT_FIELDS[kind]) for name, kind in DASHBOARD_LISTS.items() if name in data}}
+    return json_response(request, data, headers)
+
+@router.get("/api/users/{user_id}/balances")
+def get_user_balances(user_id: str, db: Session = Depends(get_db)):
+    """The user's open-period balance, meals and settlements in every group, without building each dashboard.
+
+    Groups with a cached dashboard are answered from it; the rest are computed together from their ledgers.
+    """
+    user = db.query(DBUser).filter(DBUser.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    groups = db.query(DBGroup).options(joinedload(DBGroup.ledger)).join(user_groups, user_groups.c.group_id == DBGroup.id) \
+        .filter(user_groups.c.user_id == user_id).order_by(DBGroup.display_name, DBGroup.id).all()
+    if any(g.ledger is None for g in groups):
+        for g in groups:
+            if g.ledger is None:
+                ensure_ledger(db, g.id)
+        db.commit()
+
+    entries = {}
+    for g in groups:
+        # Peeked, so this fan-out doesn't count as dashboard hits and misses
+        data = dashboard_cache.peek((g.id, g.ledger.version, None, True)) or dashboard_cache.peek((g.id, g.ledger.version, None, False))
+        if data is not None:
+            me = next((u for u in data["users"] if u["user_id"] == user_id), None)
+            entries[g.id] = {
+                "balance": me["balance"] if me else 0.0,
+                "meals": data["total_user_meals"].get(user_id, 0),
+                "since": data.get("period", {}).get("from"),
+                "settlements": [s for s in data["settlements"] if user_id in (s["from_id"], s["to_id"])],
+            }
+
+    pending = [g.id for g in groups if g.id not in entries]
+    if pending:
+        db.query(DBGroup).options(selectinload(DBGroup.members), selectinload(DBGroup.member_ledgers)).filter(DBGroup.id.in_(pending)).all()
+        closes = latest_closes(db, pending)
+        closed = closed_totals_by_group(db, list(closes)) if closes else {}
+        for g in groups:
+            if g.id not in pending:
+                continue
+            close = closes.get(g.id)
+            totals = ledger_totals(g)
+            if close:
+                totals = open_period_totals(totals, closed[g.id])
+            _, balances = compute_balances(g, totals, opening_balances(close))
+            names = {m.id: m.username for m in g.members}
+            entries[g.id] = {
+                "balance": balances.get(user_id, 0.0),
+                "meals": totals["members"].get(user_id, {}).get("meals", 0.0),
+                "since": iso_date(close.end_date + datetime.timedelta(days=1)) if close else None,
+                "settlements": [
+                    {"from_id": debtor, "from_name": names.get(debtor), "to_id": creditor, "to_name": names.get(creditor), "amount": settlement.from_cents(cents)}
+                    for debtor, creditor, cents in settle_balances(balances) if user_id in (debtor, creditor)
+                ],
+            }
+
+    result = [{"group_id": g.id, "unique_name": g.unique_name, "display_name": g.display_name, "group_type": g.group_type, **entries[g.id]} for g in groups]
+    for entry in result:
+        entry["status"] = "Owes" if entry["balance"] < 0 else "Gets Back"
+    return {"user_id": user_id, "total_balance": round(sum(e["balance"] for e in result), 2), "groups": result}
+
+def etag_matches(if_none_match: Optional[str], etag: str):
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+@router.get("/api/groups/{group_id}/settlements")
+def get_settlements(group_id: str, period: Optional[str] = None, cancel_exact: Optional[bool] = None, db: Session = Depends(get_db)):
+    group = load_dashboard_group(db, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    ensure_ledger(db, group_id)
+    totals, _, _, close = dashboard_totals(db, group, period)
+    _, balances = compute_balances(group, totals, opening_balances(close))
+    user_names = {m.id: m.username for m in group.members}
+    transfers = settle_balances(balances, cancel_exact)
+    return {
+        "transfers": [
+            {"from_id": debtor, "from_name": user_names.get(debtor), "to_id": creditor, "to_name": user_names.get(creditor), "amount": settlement.from_cents(cents)}
+            for debtor, creditor, cents in transfers
+        ],
+        "unsettled": settlement.from_cents(settlement.unsettled({uid: settlement.to_cents(b) for uid, b in balances.items()})),
+    }
+
+@router.get("/api/stats/cache")
+def get_cache_stats():
+    return {"dashboard": dashboard_cache.stats(), "settlement": settlement_cache.stats(), "dashboard_flights": dashboard_flights.stats()}
+
+@router.post("/api/groups/{group_id}/periods/close")
+def close_period(group_id: str, payload: PeriodCloseCreate, db: Session = Depends(get_db)):
+    get_live_group(db, group_id)
+    # Everything below is read under the ledger lock: a write either committed before the snapshot or waits for it,
+    # and then lands in the open period (check_period_open)
+    bump_group_version(db, group_id)
+    group = load_dashboard_group(db, group_id)
+    end_date = payload.end_date or datetime.date.today()
+    last = latest_close(db, group_id)
+    if last and end_date <= last.end_date:
+        raise HTTPException(status_code=400, detail=f"Already closed through {last.end_date}")
+
+    # Only the rows of the period itself are scanned; earlier ones are summed up in the last close.
+    # Undated legacy rows go into the first close, so every row is covered by exactly one close.
+    start_date = last.end_date + datetime.timedelta(days=1) if last else None
+    totals = aggregate_group_totals(db, group_id, start_date, end_date, undated=last is None)
+    opening = opening_balances(last)
+    meal_rate, balances = compute_balances(group, totals, opening)
+    report = calculate_dashboard_metrics(db, group, totals, start_date, end_date, False, opening)
+
+    close = DBPeriodClose(
+        id=str(uuid.uuid4()), group_id=group_id, start_date=start_date, end_date=end_date,
+        closed_at=datetime.datetime.now().isoformat(), meal_rate=meal_rate, member_count=totals["member_count"],
+        report=json.dumps(report), **{field: totals[field] for field in TOTAL_FIELDS}
+    )
+    db.add(close)
+    for uid in set(balances) | set(totals["members"]):
+        t = totals["members"].get(uid, {"meals": 0.0, "expense_credit": ZERO, "funds": ZERO})
+        db.add(DBPeriodCloseMember(close_id=close.id, user_id=uid, balance=to_money(balances.get(uid, 0.0)), **t))
+    db.commit()
+
+    notify_group(group_id, f"{group.display_name}: the period through {end_date} was closed. Meal rate {meal_rate}.")
+    return serialize_close(close)
+
+@router.get("/api/groups/{group_id}/periods")
+def list_periods(group_id: str, db: Session = Depends(get_db)):
+    closes = db.query(DBPeriodClose).filter(DBPeriodClose.group_id == group_id).order_by(DBPeriodClose.end_date.desc())
+    return [serialize_close(c) for c in closes]
+
+@router.get("/api/groups/{group_id}/periods/{close_id}")
+def get_period_report(group_id: str, close_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    close = db.query(DBPeriodClose).filter(DBPeriodClose.id == close_id, DBPeriodClose.group_id == group_id).first()
+    if not close:
+        raise HTTPException(status_code=404, detail="Period not found")
+    # Closed periods never change, so the snapshot id is a permanent validator
+    etag = f'"{close.id}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return {**json.loads(close.report), "close": serialize_close(close)}
+
+# ----- TIME SERIES -----
+TIMESERIES_BUCKETS = ["day", "week", "month"]
+MAX_TIMESERIES_BUCKETS = 3660
+
+def bucket_start(date: datetime.date, bucket: str):
+    if bucket == "week":
+        return date - datetime.timedelta(days=date.weekday())
+    if bucket == "month":
+        return date.replace(day=1)
+    return date
+
+def next_bucket(start: datetime.date, bucket: str):
+    if bucket == "month":
+        return (start + datetime.timedelta(days=31)).replace(day=1)
+    return start + datetime.timedelta(days=7 if bucket == "week" else 1)
+
+def bucket_column(db: Session, column, bucket: str):
+    """SQL truncating a date column to the start of its day, week (Monday) or month."""
+    if bucket == "day":
+        return column
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date(func.date_trunc(bucket, column))
+    return func.date(column, "weekday 0", "-6 days") if bucket == "week" else func.date(column, "start of month")
+
+@router.get("/api/groups/{group_id}/timeseries")
+def get_timeseries(group_id: str, bucket: str = "day", date_from: Optional[datetime.date] = Query(None, alias="from"), date_to: Optional[datetime.date] = Query(None, alias="to"), user_id: Optional[str] = None, db: Session = Depends(get_db)):
+    """Daily, weekly or monthly meals by type, spending, fund inflow and meal rate, for the group or one member.
+
+    Summed from the daily rollups in SQL, so the work follows the number of buckets rather than of raw rows.
+    """
+    if bucket not in TIMESERIES_BUCKETS:
+        raise HTTPException(status_code=400, detail="Invalid bucket. Use day, week or month.")
+    if not db.query(DBGroup.id).filter(DBGroup.id == group_id).first():
+        raise HTTPException(status_code=404, detail="Group not found")
+    model = DBMemberDaily if user_id else DBGroupDaily
+    start = bucket_column(db, model.date, bucket).label("start")
+    query = db.query(start, *[func.sum(getattr(model, f)) for f in ROLLUP_MEALS + ROLLUP_MONEY]).filter(model.group_id == group_id)
+    if user_id:
+        query = query.filter(model.user_id == user_id)
+    if date_from:
+        query = query.filter(model.date >= date_from)
+    if date_to:
+        query = query.filter(model.date <= date_to)
+    rows = {}
+    for row in query.group_by(start).order_by(start):
+        day = datetime.date.fromisoformat(row[0]) if isinstance(row[0], str) else row[0]
+        rows[day] = dict(zip(ROLLUP_MEALS + ROLLUP_MONEY, row[1:]))
+
+    first = bucket_start(date_from, bucket) if date_from else min(rows, default=None)
+    last = bucket_start(date_to, bucket) if date_to else max(rows, default=None)
+    series = []
+    current = first
+    while first and last and current <= last:
+        if len(series) >= MAX_TIMESERIES_BUCKETS:
+            raise HTTPException(status_code=400, detail=f"More than {MAX_TIMESERIES_BUCKETS} buckets. Use a larger bucket or a shorter range.")
+        values = rows.get(current, {})
+        point = {"start": current.isoformat(), **{f: values.get(f) or 0.0 for f in ROLLUP_MEALS}, **{f: round(float(values.get(f) or 0), 2) for f in ROLLUP_MONEY}}
+        point["meals"] = sum(point[f] for f in ROLLUP_MEALS)
+        point["meal_rate"] = round(point["bazar"] / point["meals"], 2) if point["meals"] > 0 else 0.0
+        series.append(point)
+        current = next_bucket(current, bucket)
+    return {"bucket": bucket, "from": iso_date(date_from), "to": iso_date(date_to), "user_id": user_id, "series": series}
+
+def encode_cursor(date: Optional[str], row_id: str):
+    # An empty date stands for a row without one
+    return base64.urlsafe_b64encode(f"{date or ''}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        date, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return date, row_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def list_ledger_page(db: Session, kind: str, group_id: str, date_from: Optional[datetime.date], date_to: Optional[datetime.date], cursor: Optional[str], limit: int):
+    """One page of a group's rows, newest first and undated rows last, using a (date, id) keyset cursor."""
+    model, _, serialize = LEDGER_LISTS[kind]
+    query = ledger_rows(db, kind, group_id, date_from, date_to).add_columns(DBUser.username).outerjoin(DBUser, DBUser.id == model.user_id)
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        try:
+            cursor_date = datetime.date.fromisoformat(cursor_date) if cursor_date else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if cursor_date is None:
+            query = query.filter(model.date.is_(None), model.id < cursor_id)
+        else:
+            query = query.filter(or_(model.date < cursor_date, and_(model.date == cursor_date, model.id < cursor_id), model.date.is_(None)))
+    rows = query.order_by(model.date.desc().nulls_last(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(iso_date(rows[limit - 1].date), rows[limit - 1].id) if len(rows) > limit else None
+    return {"items": [serialize(row, row.username) for row in rows[:limit]], "next_cursor": next_cursor}
+
+@router.get("/api/groups/{group_id}/expenses")
+def list_expenses(group_id: str, date_from: Optional[datetime.date] = Query(None, alias="from"), date_to: Optional[datetime.date] = Query(None, alias="to"), cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
+    return list_ledger_page(db, "expenses", group_id, date_from, date_to, cursor, limit)
+
+@router.get("/api/groups/{group_id}/meals")
+def list_meals(group_id: str, date_from: Optional[datetime.date] = Query(None, alias="from"), date_to: Optional[datetime.date] = Query(None, alias="to"), cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
+    return list_ledger_page(db, "meals", group_id, date_from, date_to, cursor, limit)
+
+@router.get("/api/groups/{group_id}/funds")
+def list_funds(group_id: str, date_from: Optional[datetime.date] = Query(None, alias="from"), date_to: Optional[datetime.date] = Query(None, alias="to"), cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
+    return list_ledger_page(db, "funds", group_id, date_from, date_to, cursor, limit)
+
+# ----- DELTA SYNC -----
+CHANGE_KINDS = {
+    "expenses": (DBExpense, serialize_expense),
+    "meals": (DBMeal, serialize_meal),
+    "funds": (DBFund, serialize_fund),
+    "meal_requests": (DBMealRequest, serialize_meal_request),
+    "roles": (DBGroupRole, serialize_role),
+}
+
+def add_tombstones(db: Session, group_id: str, kind: str, row_ids, seq: Optional[int]):
+    """Record deleted rows so clients syncing from before `seq` drop them too."""
+    if row_ids:
+        created_at = datetime.datetime.now().isoformat()
+        db.execute(insert(DBTombstone), [{"group_id": group_id, "kind": kind, "row_id": row_id, "change_seq": seq, "created_at": created_at} for row_id in row_ids])
+
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get("TOMBSTONE_RETENTION_DAYS", "90"))
+
+def prune_tombstones(days: int = TOMBSTONE_RETENTION_DAYS, chunk_size: int = 1000):
+    """Delete tombstones older than `days`, one chunk per transaction.
+
+    Clients don't report their sync cursors, so each group's ledger keeps the newest sequence pruned instead;
+    get_changes answers anything older with a full sync.
+    """
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+    removed = 0
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.query(DBTombstone.id, DBTombstone.group_id, DBTombstone.change_seq).filter(DBTombstone.created_at < cutoff).limit(chunk_size).all()
+            if not rows:
+                break
+            pruned = defaultdict(int)
+            for _, group_id, seq in rows:
+                pruned[group_id] = max(pruned[group_id], seq or 0)
+            for group_id, seq in pruned.items():
+                db.query(DBGroupLedger).filter(DBGroupLedger.group_id == group_id, or_(DBGroupLedger.pruned_seq == None, DBGroupLedger.pruned_seq < seq)) \
+                    .update({DBGroupLedger.pruned_seq: seq}, synchronize_session=False)
+            db.execute(delete(DBTombstone).where(DBTombstone.id.in_([row.id for row in rows])))
+            db.commit()
+            removed += len(rows)
+    finally:
+        db.close()
+    return removed
+
+@router.get("/api/groups/{group_id}/changes")
+def get_changes(group_id: str, request: Request, since: Optional[int] = Query(None, ge=0), db: Session = Depends(get_db)):
+    """The group's rows inserted, updated or deleted after change sequence `since`, plus the sequence to ask from next.
+
+    The sequence is the group's ledger version. Without `since`, or with a sequence the group never reached, every
+    row is returned with "full": true and the client replaces its copy instead of merging. So is every row for a
+    sequence older than the group's pruned tombstones, which can no longer tell the client what was deleted.
+    """
+    group = db.query(DBGroup).options(joinedload(DBGroup.ledger)).filter(DBGroup.id == group_id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    if group.ledger is None:
+        ensure_ledger(db, group_id)
+        db.commit()
+
+    # Read before the rows: anything committed in between comes again next time, nothing is skipped
+    seq = group.ledger.version
+    full = since is None or since > seq or since < (group.ledger.pruned_seq or 0)
+    result = {"group_id": group_id, "since": since, "seq": seq, "full": full}
+    for kind, (model, serialize) in CHANGE_KINDS.items():
+        query = db.query(model, DBUser.username).outerjoin(DBUser, DBUser.id == model.user_id).filter(model.group_id == group_id)
+        if not full:
+            query = query.filter(model.change_seq > since)
+        result[kind] = [serialize(row, username) for row, username in query]
+    result["deleted"] = {}
+    if not full:
+        for kind, row_id in db.query(DBTombstone.kind, DBTombstone.row_id).filter(DBTombstone.group_id == group_id, DBTombstone.change_seq > since):
+            result["deleted"].setdefault(kind, []).append(row_id)
+    return json_response(request, result)
+
+# ----- EXPORT -----
+EXPORT_FIELDS = {
+    "expenses": ["id", "date", "user_id", "user", "category", "amount", "items"],
+    "meals": ["id", "date", "user_id", "user", "breakfast", "lunch", "dinner", "guest_meal_count"],
+    "funds": ["id", "date", "user_id", "user", "amount"],
+    "balances": ["period_start", "period_end", "status", "user_id", "user", "meals", "expense_credit", "funds", "balance"],
+}
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "1000"))
+
+def period_balance_rows(db: Session, group_id: str, date_from: Optional[datetime.date], date_to: Optional[datetime.date]):
+    """Each member's totals and closing balance per closed period overlapping the window, then the open period so far."""
+    query = db.query(DBPeriodClose.start_date, DBPeriodClose.end_date, DBPeriodCloseMember.user_id, DBPeriodCloseMember.meals, DBPeriodCloseMember.expense_credit,
+                     DBPeriodCloseMember.funds, DBPeriodCloseMember.balance, DBUser.username).join(DBPeriodCloseMember, DBPeriodCloseMember.close_id == DBPeriodClose.id) \
+        .outerjoin(DBUser, DBUser.id == DBPeriodCloseMember.user_id).filter(DBPeriodClose.group_id == group_id)
+    if date_from:
+        query = query.filter(DBPeriodClose.end_date >= date_from)
+    if date_to:
+        query = query.filter(or_(DBPeriodClose.start_date == None, DBPeriodClose.start_date <= date_to))
+    for row in query.order_by(DBPeriodClose.end_date, DBPeriodCloseMember.user_id).yield_per(EXPORT_CHUNK_ROWS):
+        yield {"period_start": iso_date(row.start_date), "period_end": iso_date(row.end_date), "status": "closed", "user_id": row.user_id, "user": row.username,
+               "meals": row.meals, "expense_credit": float(row.expense_credit), "funds": float(row.funds), "balance": float(row.balance)}
+
+    group = load_dashboard_group(db, group_id)
+    totals, open_from, _, close = dashboard_totals(db, group, None)
+    if date_to and open_from and date_to < open_from:
+        return
+    _, balances = compute_balances(group, totals, opening_balances(close))
+    names = {m.id: m.username for m in group.members}
+    for uid, balance in sorted(balances.items()):
+        t = totals["members"].get(uid, {})
+        yield {"period_start": iso_date(open_from), "period_end": None, "status": "open", "user_id": uid, "user": names.get(uid),
+               "meals": t.get("meals", 0.0), "expense_credit": float(t.get("expense_credit", ZERO)), "funds": float(t.get("funds", ZERO)), "balance": balance}
+
+def export_rows(kind: str, group_id: str, date_from: Optional[datetime.date], date_to: Optional[datetime.date]):
+    """Yield a group's rows oldest first, fetched in chunks.
+
+    Uses a session of its own: the response streams after the request's session is gone.
+    """
+    db = SessionLocal()
+    try:
+        if kind == "balances":
+            yield from period_balance_rows(db, group_id, date_from, date_to)
+            return
+        model, _, serialize = LEDGER_LISTS[kind]
+        query = ledger_rows(db, kind, group_id, date_from, date_to).add_columns(DBUser.username).outerjoin(DBUser, DBUser.id == model.user_id)
+        for row in query.order_by(model.date, model.id).yield_per(EXPORT_CHUNK_ROWS):
+            yield serialize(row, row.username)
+    finally:
+        db.close()
 
-@app.get("/api/groups/{group_id}/dashboard")
-def get_dashboard(group_id: str, db: Session = Depends(get_db)):
+@router.get("/api/groups/{group_id}/export/{kind}")
+def export_group(group_id: str, kind: str, fmt: str = Query("csv", alias="format"), date_from: Optional[datetime.date] = Query(None, alias="from"), date_to: Optional[datetime.date] = Query(None, alias="to"), gzip: bool = False, db: Session = Depends(get_db)):
+    """Stream expenses, meals, funds or per-period balances as CSV or NDJSON, gzipped on request."""
+    if kind not in EXPORT_FIELDS:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    if fmt not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid format. Use csv or ndjson.")
     group = db.query(DBGroup).filter(DBGroup.id == group_id).first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
-    return calculate_dashboard_metrics(group)
+    if kind == "balances" and group.ledger is None:
+        ensure_ledger(db, group_id)
+        db.commit()
+
+    body = export.encode(export_rows(kind, group_id, date_from, date_to), EXPORT_FIELDS[kind], fmt, EXPORT_CHUNK_ROWS)
+    filename = f"{group.unique_name}-{kind}.{fmt}"
+    media_type = export.MEDIA_TYPES[fmt]
+    if gzip:
+        body, filename, media_type = export.gzipped(body), filename + ".gz", "application/gzip"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# ----- IMPORT -----
+IMPORT_COLUMNS = {
+    "expenses": (DBExpense, ["date", "amount", "category"]),
+    "meals": (DBMeal, ["date"]),
+    "funds": (DBFund, ["date", "amount"]),
+}
+IMPORT_CHUNK_ROWS = int(os.environ.get("IMPORT_CHUNK_ROWS", "1000"))
+IMPORT_MAX_ERRORS = 1000  # rows listed in the report; the error count is always complete
+IMPORT_SPOOL_BYTES = 4 * 1024 * 1024
+
+def parse_import_row(kind: str, row, group_id: str):
+    """Turn one CSV row into insert values, raising ValueError with the reason it is invalid."""
+    try:
+        date = datetime.date.fromisoformat((row.get("date") or "").strip())
+    except ValueError:
+        raise ValueError(f"Invalid date: {row.get('date')!r}. Use YYYY-MM-DD")
+    values = {"id": str(uuid.uuid4()), "group_id": group_id, "date": date}
+    if kind == "meals":
+        for field in ["breakfast", "lunch", "dinner", "guest_meal_count"]:
+            try:
+                values[field] = float((row.get(field) or "0").strip())
+            except ValueError:
+                raise ValueError(f"Invalid {field}: {row.get(field)!r}")
+            if not 0 <= values[field] < float("inf"):
+                raise ValueError(f"Invalid {field}: {row.get(field)!r}")
+        return values
+    try:
+        values["amount"] = Decimal((row.get("amount") or "").strip())
+    except ArithmeticError:
+        raise ValueError(f"Invalid amount: {row.get('amount')!r}")
+    if not values["amount"].is_finite():
+        raise ValueError(f"Invalid amount: {row.get('amount')!r}")
+    values["amount"] = to_money(values["amount"])
+    if kind == "expenses":
+        values["category"] = (row.get("category") or "").strip()
+        if not values["category"]:
+            raise ValueError("Missing category")
+        values["items"] = row.get("items") or ""
+    return values
+
+def import_rows(db: Session, group_id: str, kind: str, lines, user_id: Optional[str] = None, dry_run: bool = False, chunk_size: int = IMPORT_CHUNK_ROWS):
+    """Bulk insert expenses, meals or funds from CSV text lines into a group, in one transaction.
+
+    The file is read row by row and inserted in chunks, so its size doesn't matter. Members are matched by a
+    user_id column or else by username in a user column. Invalid rows are reported by line and skipped; the
+    group gets one summary notification instead of one per row.
+    """
+    if kind not in IMPORT_COLUMNS:
+        raise HTTPException(status_code=404, detail="Unknown import")
+    model, required = IMPORT_COLUMNS[kind]
+    get_live_group(db, group_id)
+    reader = csv.DictReader(lines)
+    fields = [f.strip() for f in reader.fieldnames or []]
+    reader.fieldnames = fields
+    missing = [f for f in required if f not in fields]
+    if "user_id" not in fields and "user" not in fields:
+        missing.append("user_id or user")
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing column(s): {', '.join(missing)}")
+
+    # Chunks are inserted before the totals are known; they carry a version taken up front
+    seq = bump_group_version(db, group_id)
+    members = dict(db.query(DBUser.id, DBUser.username).join(user_groups, user_groups.c.user_id == DBUser.id).filter(user_groups.c.group_id == group_id))
+    by_name = defaultdict(list)
+    for uid, name in members.items():
+        by_name[name].append(uid)
+    closed_through = db.query(func.max(DBPeriodClose.end_date)).filter(DBPeriodClose.group_id == group_id).scalar()
+    # Meals are one row per member and day, like the batch endpoint enforces
+    logged = {(uid, date) for uid, date in db.query(DBMeal.user_id, DBMeal.date).filter(DBMeal.group_id == group_id)} if kind == "meals" else set()
+
+    member_deltas = defaultdict(lambda: {"meals": 0.0, "expense_credit": ZERO, "funds": ZERO})
+    totals = {"total_meals": 0.0, "total_expenses": ZERO, "total_bazar": ZERO, "total_fixed": ZERO, "total_funds": ZERO}
+    rollups = {}
+    chunk, imported, errors, error_rows = [], 0, 0, []
+    for row in reader:
+        try:
+            values = parse_import_row(kind, row, group_id)
+            uid = (row.get("user_id") or "").strip()
+            if not uid:
+                matches = by_name.get((row.get("user") or "").strip(), [])
+                if len(matches) > 1:
+                    raise ValueError(f"More than one member is called {row.get('user')!r}; use user_id")
+                uid = matches[0] if matches else ""
+            if uid not in members:
+                raise ValueError("User is not a member of this group")
+            if closed_through and values["date"] <= closed_through:
+                raise ValueError(f"Entries up to {closed_through} are in a closed period")
+            if kind == "meals":
+                if (uid, values["date"]) in logged:
+                    raise ValueError(f"Meals for {values['date']} already logged")
+                logged.add((uid, values["date"]))
+        except ValueError as e:
+            errors += 1
+            if len(error_rows) < IMPORT_MAX_ERRORS:
+                error_rows.append({"line": reader.line_num, "detail": str(e)})
+            continue
+
+        values["user_id"] = uid
+        values["change_seq"] = seq
+        if kind == "meals":
+            count = values["breakfast"] + values["lunch"] + values["dinner"] + values["guest_meal_count"]
+            member_deltas[uid]["meals"] += count
+            totals["total_meals"] += count
+            add_rollup(rollups, uid, values["date"], meal_rollup(values["breakfast"], values["lunch"], values["dinner"], values["guest_meal_count"]))
+        elif kind == "expenses":
+            member_deltas[uid]["expense_credit"] += values["amount"]
+            totals["total_expenses"] += values["amount"]
+            if values["category"].startswith("Bazar"):
+                totals["total_bazar"] += values["amount"]
+            if values["category"] in FIXED_CATEGORIES:
+                totals["total_fixed"] += values["amount"]
+            add_rollup(rollups, uid, values["date"], expense_rollup(values["amount"], values["category"]))
+        else:
+            member_deltas[uid]["funds"] += values["amount"]
+            totals["total_funds"] += values["amount"]
+            add_rollup(rollups, uid, values["date"], fund_rollup(values["amount"]))
+        chunk.append(values)
+        imported += 1
+        if len(chunk) >= chunk_size:
+            if not dry_run:
+                db.execute(insert(model), chunk)
+            chunk = []
+
+    if dry_run:
+        db.rollback()
+    else:
+        if chunk:
+            db.execute(insert(model), chunk)
+        apply_ledger_deltas(db, group_id, member_deltas, totals)
+        apply_rollup_deltas(db, group_id, rollups)
+        db.commit()
+        if imported:
+            actor = members.get(user_id)
+            notify_group(group_id, f"{actor or 'A manager'} imported {imported} {kind} from a spreadsheet.", exclude_user_id=user_id if actor else None)
+    return {"kind": kind, "imported": imported, "errors": errors, "error_rows": error_rows, "dry_run": dry_run}
 
-@app.put("/api/groups/{group_id}/roles")
+def import_upload(group_id: str, kind: str, upload, user_id: Optional[str], dry_run: bool):
+    db = SessionLocal()
+    try:
+        upload.seek(0)
+        return import_rows(db, group_id, kind, io.TextIOWrapper(upload, encoding="utf-8-sig", newline=""), user_id, dry_run)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="The file must be UTF-8 encoded CSV")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Malformed CSV: {e}")
+    finally:
+        db.close()
+
+@router.post("/api/groups/{group_id}/import/{kind}")
+async def import_group_rows(group_id: str, kind: str, request: Request, user_id: Optional[str] = None, dry_run: bool = False):
+    """Import expenses, meals or funds from a CSV request body.
+
+    The body is spooled to a temporary file as it arrives (to disk past a few MB), then imported off the event loop.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        return await run_in_threadpool(import_upload, group_id, kind, upload, user_id, dry_run)
+
+@router.put("/api/groups/{group_id}/roles")
 def update_role(group_id: str, data: RoleUpdate, db: Session = Depends(get_db)):
+    get_live_group(db, group_id)
     role = db.query(DBGroupRole).filter(DBGroupRole.group_id == group_id, DBGroupRole.user_id == data.user_id).first()
     if not role:
         # Create it if it doesn't exist (e.g., from old database)
@@ -470,74 +1966,168 @@ def update_role(group_id: str, data: RoleUpdate, db: Session = Depends(get_db)):
     else:
         role.is_manager = data.is_manager
         role.title = data.title
+    role.change_seq = bump_group_version(db, group_id)
     db.commit()
     return {"message": "Role updated successfully"}
 
-@app.post("/api/groups/{group_id}/expenses")
+@router.post("/api/groups/{group_id}/expenses")
 def add_expense(group_id: str, expense: ExpenseCreate, db: Session = Depends(get_db)):
-    import datetime
+    check_period_open(db, group_id, expense.date)
+    get_live_group(db, group_id)
+    seq = apply_ledger_delta(db, group_id, expense.user_id, expense=to_money(expense.amount), category=expense.category)
+    apply_rollup_deltas(db, group_id, add_rollup({}, expense.user_id, expense.date, expense_rollup(to_money(expense.amount), expense.category)))
+
     new_expense = DBExpense(
         id=str(uuid.uuid4()), group_id=group_id, user_id=expense.user_id,
-        amount=expense.amount, category=expense.category, date=expense.date, items=expense.items
+        amount=to_money(expense.amount), category=expense.category, date=expense.date, items=expense.items, change_seq=seq
     )
     db.add(new_expense)
     
-    group = db.query(DBGroup).filter(DBGroup.id == group_id).first()
     user = db.query(DBUser).filter(DBUser.id == expense.user_id).first()
-    if group and user:
-        for m in group.members:
-            if m.id != user.id:
-                n = DBNotification(id=str(uuid.uuid4()), user_id=m.id, message=f"New expense of {expense.amount} BDT added by {user.username}: {expense.category}", created_at=datetime.datetime.now().isoformat())
-                db.add(n)
-                
     db.commit()
+
+    if user:
+        notify_group(group_id, f"New expense of {expense.amount} BDT added by {user.username}: {expense.category}", exclude_user_id=user.id)
     return {"message": "Expense added successfully"}
 
-@app.post("/api/groups/{group_id}/funds")
+@router.post("/api/groups/{group_id}/funds")
 def add_fund(group_id: str, fund: FundCreate, db: Session = Depends(get_db)):
-    import datetime
+    check_period_open(db, group_id, fund.date)
+    get_live_group(db, group_id)
+    seq = apply_ledger_delta(db, group_id, fund.user_id, funds=to_money(fund.amount))
+    apply_rollup_deltas(db, group_id, add_rollup({}, fund.user_id, fund.date, fund_rollup(to_money(fund.amount))))
+
     new_fund = DBFund(
         id=str(uuid.uuid4()), group_id=group_id, user_id=fund.user_id,
-        amount=fund.amount, date=fund.date
+        amount=to_money(fund.amount), date=fund.date, change_seq=seq
     )
     db.add(new_fund)
     
-    group = db.query(DBGroup).filter(DBGroup.id == group_id).first()
     user = db.query(DBUser).filter(DBUser.id == fund.user_id).first()
-    if group and user:
-        for m in group.members:
-            if m.id != user.id:
-                n = DBNotification(id=str(uuid.uuid4()), user_id=m.id, message=f"{user.username} deposited {fund.amount} BDT to fund.", created_at=datetime.datetime.now().isoformat())
-                db.add(n)
-                
     db.commit()
+
+    if user:
+        notify_group(group_id, f"{user.username} deposited {fund.amount} BDT to fund.", exclude_user_id=user.id)
     return {"message": "Fund added successfully"}
 
-@app.put("/api/groups/{group_id}/funds/{fund_id}")
+@router.put("/api/groups/{group_id}/funds/{fund_id}")
 def update_fund(group_id: str, fund_id: str, fund: FundUpdate, db: Session = Depends(get_db)):
-    db_fund = db.query(DBFund).filter(DBFund.id == fund_id, DBFund.group_id == group_id).first()
+    get_live_group(db, group_id)
+    # Lock the ledger before reading the old amount, so a concurrent update's delta is computed from this one's result
+    bump_group_version(db, group_id)
+    db_fund = db.query(DBFund).populate_existing().filter(DBFund.id == fund_id, DBFund.group_id == group_id).first()
     if not db_fund:
         raise HTTPException(status_code=404, detail="Fund not found")
-    db_fund.amount = fund.amount
+    check_period_open(db, group_id, db_fund.date, fund.date)
+    seq = apply_ledger_delta(db, group_id, db_fund.user_id, funds=to_money(fund.amount) - db_fund.amount)
+    rollups = add_rollup({}, db_fund.user_id, db_fund.date, fund_rollup(-db_fund.amount))
+    apply_rollup_deltas(db, group_id, add_rollup(rollups, db_fund.user_id, fund.date, fund_rollup(to_money(fund.amount))))
+    db_fund.amount = to_money(fund.amount)
     db_fund.date = fund.date
+    db_fund.change_seq = seq
     db.commit()
     return {"message": "Fund updated successfully"}
 
-@app.post("/api/groups/{group_id}/meals")
+@router.post("/api/groups/{group_id}/meals")
 def add_meal(group_id: str, meal: MealCreate, db: Session = Depends(get_db)):
+    check_period_open(db, group_id, meal.date)
+    get_live_group(db, group_id)
+    seq = apply_ledger_delta(db, group_id, meal.user_id, meals=meal.breakfast + meal.lunch + meal.dinner + meal.guest_meal_count)
+    apply_rollup_deltas(db, group_id, add_rollup({}, meal.user_id, meal.date, meal_rollup(meal.breakfast, meal.lunch, meal.dinner, meal.guest_meal_count)))
     new_meal = DBMeal(
         id=str(uuid.uuid4()), group_id=group_id, user_id=meal.user_id,
-        date=meal.date, breakfast=meal.breakfast, lunch=meal.lunch, dinner=meal.dinner, guest_meal_count=meal.guest_meal_count
+        date=meal.date, breakfast=meal.breakfast, lunch=meal.lunch, dinner=meal.dinner, guest_meal_count=meal.guest_meal_count, change_seq=seq
     )
     db.add(new_meal)
     db.commit()
     return {"message": "Meal added successfully"}
 
-@app.put("/api/groups/{group_id}/meals/{meal_id}")
+@router.post("/api/groups/{group_id}/meals/batch")
+def add_meals_batch(group_id: str, batch: MealBatch, db: Session = Depends(get_db)):
+    get_live_group(db, group_id)
+    # Locks the ledger before looking for existing meals, so an overlapping batch waits and then sees this one's rows
+    seq = bump_group_version(db, group_id)
+
+    member_ids = {uid for (uid,) in db.query(user_groups.c.user_id).filter(user_groups.c.group_id == group_id)}
+    closed_through = db.query(func.max(DBPeriodClose.end_date)).filter(DBPeriodClose.group_id == group_id).scalar()
+    existing = {}
+    user_ids = {e.user_id for e in batch.entries}
+    dates = {e.date for e in batch.entries}
+    if user_ids and dates:
+        rows = db.query(DBMeal).filter(DBMeal.group_id == group_id, DBMeal.user_id.in_(user_ids), DBMeal.date.in_(dates))
+        for m in rows:
+            existing.setdefault((m.user_id, m.date), m)
+
+    results = []
+    inserts = {}
+    updates = {}
+    meal_deltas = defaultdict(float)
+    rollups = {}
+    for index, entry in enumerate(batch.entries):
+        if entry.group_id != group_id:
+            results.append({"index": index, "status": "error", "detail": "Entry belongs to another group"})
+            continue
+        if entry.user_id not in member_ids:
+            results.append({"index": index, "status": "error", "detail": "User is not a member of this group"})
+            continue
+        if closed_through and entry.date <= closed_through:
+            results.append({"index": index, "status": "error", "detail": f"Entries up to {closed_through} are in a closed period"})
+            continue
+
+        key = (entry.user_id, entry.date)
+        values = {"breakfast": entry.breakfast, "lunch": entry.lunch, "dinner": entry.dinner, "guest_meal_count": entry.guest_meal_count}
+        count = entry.breakfast + entry.lunch + entry.dinner + entry.guest_meal_count
+        if key in inserts and batch.upsert:
+            # Repeated within the batch: the later entry wins
+            row = inserts[key]
+            meal_deltas[entry.user_id] += count - (row["breakfast"] + row["lunch"] + row["dinner"] + row["guest_meal_count"])
+            add_rollup(rollups, entry.user_id, entry.date, meal_rollup(row["breakfast"], row["lunch"], row["dinner"], row["guest_meal_count"], -1))
+            add_rollup(rollups, entry.user_id, entry.date, meal_rollup(**values))
+            row.update(values)
+            results.append({"index": index, "status": "updated", "id": row["id"]})
+        elif key in existing and batch.upsert:
+            meal = existing[key]
+            previous = updates.get(meal.id)
+            meal_deltas[entry.user_id] += count - (sum(previous[k] for k in values) if previous else meal_count(meal))
+            old = previous or {k: getattr(meal, k) for k in values}
+            add_rollup(rollups, entry.user_id, entry.date, meal_rollup(old["breakfast"], old["lunch"], old["dinner"], old["guest_meal_count"], -1))
+            add_rollup(rollups, entry.user_id, entry.date, meal_rollup(**values))
+            updates[meal.id] = {"id": meal.id, **values}
+            results.append({"index": index, "status": "updated", "id": meal.id})
+        elif key in existing or key in inserts:
+            results.append({"index": index, "status": "error", "detail": f"Meals for {entry.date} already logged"})
+        else:
+            inserts[key] = {"id": str(uuid.uuid4()), "group_id": group_id, "user_id": entry.user_id, "date": entry.date, **values}
+            meal_deltas[entry.user_id] += count
+            add_rollup(rollups, entry.user_id, entry.date, meal_rollup(**values))
+            results.append({"index": index, "status": "created", "id": inserts[key]["id"]})
+
+    seq = apply_ledger_deltas(db, group_id, {uid: {"meals": delta} for uid, delta in meal_deltas.items()}, {"total_meals": sum(meal_deltas.values())}) or seq
+    if inserts:
+        db.execute(insert(DBMeal), [{**row, "change_seq": seq} for row in inserts.values()])
+    if updates:
+        db.execute(update(DBMeal), [{**row, "change_seq": seq} for row in updates.values()])
+    apply_rollup_deltas(db, group_id, rollups)
+    db.commit()
+
+    return {
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "updated": sum(1 for r in results if r["status"] == "updated"),
+        "errors": sum(1 for r in results if r["status"] == "error"),
+        "results": results,
+    }
+
+@router.put("/api/groups/{group_id}/meals/{meal_id}")
 def update_meal(group_id: str, meal_id: str, payload: MealUpdate, db: Session = Depends(get_db)):
-    meal_record = db.query(DBMeal).filter(DBMeal.id == meal_id, DBMeal.group_id == group_id).first()
+    get_live_group(db, group_id)
+    # As in update_fund: the old counts are read under the ledger lock
+    bump_group_version(db, group_id)
+    meal_record = db.query(DBMeal).populate_existing().filter(DBMeal.id == meal_id, DBMeal.group_id == group_id).first()
     if not meal_record:
         raise HTTPException(status_code=404, detail="Meal not found")
+    check_period_open(db, group_id, meal_record.date)
+    old_count = meal_count(meal_record)
+    rollups = add_rollup({}, meal_record.user_id, meal_record.date, meal_rollup(meal_record.breakfast, meal_record.lunch, meal_record.dinner, meal_record.guest_meal_count, -1))
     
     if payload.breakfast is not None:
         meal_record.breakfast = payload.breakfast
@@ -547,11 +2137,13 @@ def update_meal(group_id: str, meal_id: str, payload: MealUpdate, db: Session =
         meal_record.dinner = payload.dinner
     if payload.guest_meal_count is not None:
         meal_record.guest_meal_count = payload.guest_meal_count
+    meal_record.change_seq = apply_ledger_delta(db, group_id, meal_record.user_id, meals=meal_count(meal_record) - old_count)
+    apply_rollup_deltas(db, group_id, add_rollup(rollups, meal_record.user_id, meal_record.date, meal_rollup(meal_record.breakfast, meal_record.lunch, meal_record.dinner, meal_record.guest_meal_count)))
         
     db.commit()
     return {"message": "Meal updated successfully"}
 
-@app.get("/api/users/{user_id}/cash")
+@router.get("/api/users/{user_id}/cash")
 def get_personal_cash(user_id: str, db: Session = Depends(get_db)):
     cash_records = db.query(DBPersonalCash).filter(DBPersonalCash.user_id == user_id).all()
     return [
@@ -559,7 +2151,7 @@ def get_personal_cash(user_id: str, db: Session = Depends(get_db)):
         for c in cash_records
     ]
 
-@app.post("/api/users/{user_id}/cash")
+@router.post("/api/users/{user_id}/cash")
 def add_personal_cash(user_id: str, payload: PersonalCashCreate, db: Session = Depends(get_db)):
     new_cash = DBPersonalCash(
         id=str(uuid.uuid4()), user_id=user_id, name=payload.name,
@@ -569,7 +2161,7 @@ def add_personal_cash(user_id: str, payload: PersonalCashCreate, db: Session = D
     db.commit()
     return {"message": "Cash added successfully"}
 
-@app.put("/api/users/{user_id}/cash/{cash_id}")
+@router.put("/api/users/{user_id}/cash/{cash_id}")
 def update_personal_cash(user_id: str, cash_id: str, payload: PersonalCashUpdate, db: Session = Depends(get_db)):
     cash_record = db.query(DBPersonalCash).filter(DBPersonalCash.id == cash_id, DBPersonalCash.user_id == user_id).first()
     if not cash_record:
@@ -585,12 +2177,101 @@ def update_personal_cash(user_id: str, cash_id: str, payload: PersonalCashUpdate
     db.commit()
     return {"message": "Cash updated successfully", "id": cash_record.id, "name": cash_record.name, "ami_pai": cash_record.ami_pai, "se_pay": cash_record.se_pay}
 
-@app.get("/api/users/{user_id}/notifications")
+@router.get("/api/users/{user_id}/notifications")
 def get_notifications(user_id: str, db: Session = Depends(get_db)):
     notifs = db.query(DBNotification).filter(DBNotification.user_id == user_id).order_by(DBNotification.created_at.desc()).all()
-    return [{"id": n.id, "message": n.message, "is_read": n.is_read, "created_at": n.created_at} for n in notifs]
+    return [serialize_notification(n) for n in notifs]
+
+@router.get("/api/users/{user_id}/inbox")
+def get_inbox(user_id: str, cursor: Optional[str] = None, limit: int = Query(30, ge=1, le=200), unread_only: bool = False, db: Session = Depends(get_db)):
+    """One page of the user's notifications, newest first."""
+    query = db.query(DBNotification).filter(DBNotification.user_id == user_id)
+    if unread_only:
+        query = query.filter(DBNotification.is_read == False)
+    if cursor:
+        created_at, notif_id = decode_cursor(cursor)
+        query = query.filter(or_(DBNotification.created_at < created_at, and_(DBNotification.created_at == created_at, DBNotification.id < notif_id)))
+    notifs = query.order_by(DBNotification.created_at.desc(), DBNotification.id.desc()).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(notifs[limit - 1].created_at, notifs[limit - 1].id) if len(notifs) > limit else None
+    return {"items": [serialize_notification(n) for n in notifs[:limit]], "next_cursor": next_cursor}
+
+@router.get("/api/users/{user_id}/notifications/unread_count")
+def get_unread_count(user_id: str, db: Session = Depends(get_db)):
+    count = db.query(func.count(DBNotification.id)).filter(DBNotification.user_id == user_id, DBNotification.is_read == False).scalar()
+    return {"unread": count}
+
+@router.put("/api/users/{user_id}/notifications/read")
+def read_notifications(user_id: str, payload: NotificationsRead, db: Session = Depends(get_db)):
+    query = db.query(DBNotification).filter(DBNotification.user_id == user_id, DBNotification.is_read == False)
+    if not payload.all:
+        if not payload.ids:
+            return {"message": "marked read", "updated": 0}
+        query = query.filter(DBNotification.id.in_(payload.ids))
+    updated = query.update({DBNotification.is_read: True}, synchronize_session=False)
+    db.commit()
+    return {"message": "marked read", "updated": updated}
 
-@app.put("/api/notifications/{notif_id}/read")
+def notifications_after(user_id: str, cursor: str, limit: int = 500):
+    """Notifications created after a (created_at, id) cursor, oldest first."""
+    created_at, notif_id = decode_cursor(cursor)
+    db = SessionLocal()
+    try:
+        notifs = db.query(DBNotification).filter(
+            DBNotification.user_id == user_id,
+            or_(DBNotification.created_at > created_at, and_(DBNotification.created_at == created_at, DBNotification.id > notif_id)),
+        ).order_by(DBNotification.created_at, DBNotification.id).limit(limit).all()
+        return [serialize_notification(n) for n in notifs]
+    finally:
+        db.close()
+
+def sse_event(notif):
+    return f"id: {encode_cursor(notif['created_at'], notif['id'])}\nevent: notification\ndata: {json.dumps(notif)}\n\n"
+
+@router.get("/api/users/{user_id}/notifications/stream")
+async def stream_notifications(user_id: str, request: Request, since: Optional[str] = None):
+    """Server-Sent Events feed of the user's new notifications.
+
+    `since` (or Last-Event-ID when EventSource reconnects) first replays what was created after that cursor.
+    """
+    cursor = since or request.headers.get("last-event-id")
+    resync = bool(cursor)
+    if cursor:
+        decode_cursor(cursor)
+    else:
+        cursor = encode_cursor(datetime.datetime.now().isoformat(), "")
+    subscription = notification_broker.subscribe(user_id)
+
+    async def events():
+        nonlocal cursor, resync
+        # (created_at, id) of the last notification replayed from the database; queued ones up to it are copies
+        replayed_through = None
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                if resync or subscription.overflowed:
+                    # Catch up from the database, then drop queued copies of what was replayed
+                    subscription.overflowed = False
+                    resync = False
+                    for notif in await run_in_threadpool(notifications_after, user_id, cursor):
+                        replayed_through = (notif["created_at"], notif["id"])
+                        cursor = encode_cursor(notif["created_at"], notif["id"])
+                        yield sse_event(notif)
+                try:
+                    notif = await asyncio.wait_for(subscription.queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if replayed_through and (notif["created_at"], notif["id"]) <= replayed_through:
+                    continue
+                cursor = encode_cursor(notif["created_at"], notif["id"])
+                yield sse_event(notif)
+        finally:
+            notification_broker.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.put("/api/notifications/{notif_id}/read")
 def read_notification(notif_id: str, db: Session = Depends(get_db)):
     notif = db.query(DBNotification).filter(DBNotification.id == notif_id).first()
     if notif:
@@ -598,51 +2279,72 @@ def read_notification(notif_id: str, db: Session = Depends(get_db)):
         db.commit()
     return {"message": "marked read"}
 
-@app.post("/api/groups/{group_id}/remind/{debtor_id}")
+@router.post("/api/groups/{group_id}/remind/{debtor_id}")
 def send_reminder(group_id: str, debtor_id: str, db: Session = Depends(get_db)):
-    import datetime
-    group = db.query(DBGroup).filter(DBGroup.id == group_id).first()
-    if not group: raise HTTPException(404, "Group not found")
-    
-    n = DBNotification(id=str(uuid.uuid4()), user_id=debtor_id, message=f"Reminder: You have pending dues in {group.display_name}. Please settle soon.", created_at=datetime.datetime.now().isoformat())
-    db.add(n)
-    db.commit()
+    group = get_live_group(db, group_id)
+    notify_users([debtor_id], f"Reminder: You have pending dues in {group.display_name}. Please settle soon.", group_id)
     return {"message": "Reminder sent"}
 
-@app.post("/api/groups/{group_id}/meal_requests")
+@router.post("/api/groups/{group_id}/meal_requests")
 def add_meal_request(group_id: str, req: MealRequestCreate, db: Session = Depends(get_db)):
-    import datetime
+    group = get_live_group(db, group_id)
     new_req = DBMealRequest(id=str(uuid.uuid4()), group_id=group_id, user_id=req.user_id, date=req.date, message=req.message, status="pending")
     db.add(new_req)
     
-    group = db.query(DBGroup).filter(DBGroup.id == group_id).first()
     user = db.query(DBUser).filter(DBUser.id == req.user_id).first()
-    if group and group.manager_id and user:
-        n = DBNotification(id=str(uuid.uuid4()), user_id=group.manager_id, message=f"{user.username} requested a meal change for {req.date}: {req.message}", created_at=datetime.datetime.now().isoformat())
-        db.add(n)
-        
+    new_req.change_seq = bump_group_version(db, group_id)
     db.commit()
+
+    if group.manager_id and user:
+        notify_users([group.manager_id], f"{user.username} requested a meal change for {req.date}: {req.message}", group_id)
     return {"message": "Meal request sent"}
 
-@app.get("/api/groups/{group_id}/meal_requests")
+@router.get("/api/groups/{group_id}/meal_requests")
 def get_meal_requests(group_id: str, db: Session = Depends(get_db)):
-    reqs = db.query(DBMealRequest).filter(DBMealRequest.group_id == group_id).all()
-    return [{"id": r.id, "user_id": r.user_id, "user_name": r.user.username if r.user else "Unknown", "date": r.date, "status": r.status, "message": r.message} for r in reqs]
+    reqs = db.query(DBMealRequest).options(joinedload(DBMealRequest.user)).filter(DBMealRequest.group_id == group_id).all()
+    return [serialize_meal_request(r, r.user.username if r.user else None) for r in reqs]
 
-@app.put("/api/groups/{group_id}/meal_requests/{req_id}/approve")
+@router.put("/api/groups/{group_id}/meal_requests/{req_id}/approve")
 def approve_meal_request(group_id: str, req_id: str, payload: MealRequestUpdate, db: Session = Depends(get_db)):
-    import datetime
-    req = db.query(DBMealRequest).filter(DBMealRequest.id == req_id).first()
+    get_live_group(db, group_id)
+    req = db.query(DBMealRequest).filter(DBMealRequest.id == req_id, DBMealRequest.group_id == group_id).first()
     if not req: raise HTTPException(404, "Request not found")
     req.status = payload.status
+    req.change_seq = bump_group_version(db, group_id)
     db.commit()
     
-    n = DBNotification(id=str(uuid.uuid4()), user_id=req.user_id, message=f"Your meal request for {req.date} was {payload.status}.", created_at=datetime.datetime.now().isoformat())
-    db.add(n)
-    db.commit()
-    
+    notify_users([req.user_id], f"Your meal request for {req.date} was {payload.status}.", group_id)
     return {"message": f"Request {payload.status}"}
 
+# ----- APP -----
+def create_app():
+    """Build the ASGI app over the routes above; e.g. "uvicorn --factory main:create_app".
+
+    One app per process is assumed. The engines, caches, notification broker, dispatchers and metrics are module
+    state shared by every app built here, so two apps in one process (say, side by side in tests) serve the same
+    data and caches; the background dispatchers run until the last of them shuts down.
+    """
+    # The routes were built at import; passing them in reuses them instead of building a copy
+    app = FastAPI(title="Mess Management API", lifespan=lifespan, routes=router.routes)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(
+        observability.MetricsMiddleware,
+        registry=metrics,
+        n_plus_one_threshold=int(os.environ.get("N_PLUS_ONE_THRESHOLD", "10")),
+        profile_sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),  # e.g. 0.01 profiles 1% of requests
+        profile_slow_ms=float(os.environ.get("PROFILE_SLOW_MS", "500")),
+        profile_dir=os.environ.get("PROFILE_DIR", "profiles"),
+    )
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,191 @@
+"""Maintenance commands for the Hisab backend.
+
+Usage:
+    python manage.py migrate [--status]
+    python manage.py ledger verify [--group GROUP_ID]
+    python manage.py ledger rebuild [--group GROUP_ID]
+    python manage.py rollups backfill [--group GROUP_ID]
+    python manage.py notifications compact [--days N] [--mode purge|archive] [--chunk-size N]
+    python manage.py groups purge [--chunk-size N]
+    python manage.py tombstones prune [--days N] [--chunk-size N]
+    python manage.py import GROUP_ID expenses|meals|funds FILE.csv [--user USER_ID] [--dry-run]
+"""
+import argparse
+import sys
+
+# Importing the app does not touch the database; only the migrate command changes the schema
+import migrations
+from fastapi import HTTPException
+
+from main import (
+    engine, Base, SessionLocal, DBGroup, rebuild_ledger, verify_ledger, rebuild_rollups,
+    compact_notifications, NOTIFICATION_RETENTION_DAYS, NOTIFICATION_RETENTION_MODE,
+    IMPORT_COLUMNS, IMPORT_CHUNK_ROWS, import_rows, notification_dispatcher,
+    PURGE_CHUNK_ROWS, purge_group, unfinished_purge_jobs,
+    prune_tombstones, TOMBSTONE_RETENTION_DAYS,
+)
+
+
+def migrate(args):
+    if args.status:
+        current = migrations.current_version(engine)
+        for version, name, _ in migrations.MIGRATIONS:
+            state = "applied" if version <= current else "pending"
+            print(f"{version:04d}_{name}: {state}")
+        return 0
+    applied = migrations.migrate(engine, Base.metadata, batch_size=args.batch_size)
+    for name in applied:
+        print(f"Applied {name}")
+    print("Database is up to date")
+    return 0
+
+
+def _group_ids(db, group_id):
+    if group_id:
+        return [group_id]
+    return [gid for (gid,) in db.query(DBGroup.id).order_by(DBGroup.id)]
+
+
+def ledger_verify(args):
+    db = SessionLocal()
+    drifted = 0
+    try:
+        for gid in _group_ids(db, args.group):
+            drift = verify_ledger(db, gid)
+            if drift:
+                drifted += 1
+                print(f"{gid}: {len(drift)} drifted value(s)")
+                for line in drift:
+                    print(f"    {line}")
+    finally:
+        db.close()
+    print(f"{drifted} group(s) with drift")
+    return 1 if drifted else 0
+
+
+def ledger_rebuild(args):
+    db = SessionLocal()
+    try:
+        gids = _group_ids(db, args.group)
+        for gid in gids:
+            rebuild_ledger(db, gid)
+            db.commit()
+    finally:
+        db.close()
+    print(f"Rebuilt ledger for {len(gids)} group(s)")
+    return 0
+
+
+def rollups_backfill(args):
+    db = SessionLocal()
+    try:
+        gids = _group_ids(db, args.group)
+        for gid in gids:
+            rebuild_rollups(db, gid)
+            db.commit()
+    finally:
+        db.close()
+    print(f"Built daily rollups for {len(gids)} group(s)")
+    return 0
+
+
+def notifications_compact(args):
+    removed = compact_notifications(days=args.days, mode=args.mode, chunk_size=args.chunk_size)
+    verb = "Archived" if args.mode == "archive" else "Purged"
+    print(f"{verb} {removed} read notification(s) older than {args.days} day(s)")
+    return 0
+
+
+def groups_purge(args):
+    job_ids = unfinished_purge_jobs()
+    for job_id in job_ids:
+        purge_group(job_id, chunk_size=args.chunk_size)
+    print(f"Purged {len(job_ids)} deleted group(s)")
+    return 0
+
+
+def tombstones_prune(args):
+    removed = prune_tombstones(days=args.days, chunk_size=args.chunk_size)
+    print(f"Pruned {removed} tombstone(s) older than {args.days} day(s)")
+    return 0
+
+
+def import_file(args):
+    db = SessionLocal()
+    try:
+        with open(args.file, encoding="utf-8-sig", newline="") as f:
+            report = import_rows(db, args.group, args.kind, f, args.user, args.dry_run, args.chunk_size)
+    except HTTPException as e:
+        print(f"Import failed: {e.detail}")
+        return 1
+    finally:
+        db.close()
+        # Deliver the summary notification before the process exits
+        notification_dispatcher.stop()
+    for error in report["error_rows"]:
+        print(f"line {error['line']}: {error['detail']}")
+    verb = "Would import" if args.dry_run else "Imported"
+    print(f"{verb} {report['imported']} {args.kind}; {report['errors']} row(s) with errors")
+    return 1 if report["errors"] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="manage.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="Apply pending schema migrations")
+    migrate_parser.add_argument("--status", action="store_true", help="List migrations without applying them")
+    migrate_parser.add_argument("--batch-size", type=int, default=migrations.BATCH_SIZE)
+    migrate_parser.set_defaults(func=migrate)
+
+    ledger = commands.add_parser("ledger", help="Materialized group ledger")
+    ledger_commands = ledger.add_subparsers(dest="action", required=True)
+    verify = ledger_commands.add_parser("verify", help="Recompute totals from raw rows and report drift")
+    verify.add_argument("--group", help="Only check this group id")
+    verify.set_defaults(func=ledger_verify)
+    rebuild = ledger_commands.add_parser("rebuild", help="Recompute totals from raw rows and store them")
+    rebuild.add_argument("--group", help="Only rebuild this group id")
+    rebuild.set_defaults(func=ledger_rebuild)
+
+    rollups = commands.add_parser("rollups", help="Daily rollups behind the time series")
+    rollup_commands = rollups.add_subparsers(dest="action", required=True)
+    backfill = rollup_commands.add_parser("backfill", help="Rebuild the daily rollups from raw rows")
+    backfill.add_argument("--group", help="Only rebuild this group id")
+    backfill.set_defaults(func=rollups_backfill)
+
+    notifications = commands.add_parser("notifications", help="Notification retention")
+    notification_commands = notifications.add_subparsers(dest="action", required=True)
+    compact = notification_commands.add_parser("compact", help="Purge or archive old read notifications in chunks")
+    compact.add_argument("--days", type=int, default=NOTIFICATION_RETENTION_DAYS)
+    compact.add_argument("--mode", choices=["purge", "archive"], default=NOTIFICATION_RETENTION_MODE)
+    compact.add_argument("--chunk-size", type=int, default=1000)
+    compact.set_defaults(func=notifications_compact)
+
+    groups = commands.add_parser("groups", help="Deleted groups")
+    group_commands = groups.add_subparsers(dest="action", required=True)
+    purge = group_commands.add_parser("purge", help="Finish purging deleted groups now instead of in the app's background job")
+    purge.add_argument("--chunk-size", type=int, default=PURGE_CHUNK_ROWS)
+    purge.set_defaults(func=groups_purge)
+
+    tombstones = commands.add_parser("tombstones", help="Deleted-row markers behind delta sync")
+    tombstone_commands = tombstones.add_subparsers(dest="action", required=True)
+    prune = tombstone_commands.add_parser("prune", help="Delete old tombstones; clients syncing from before them get a full sync")
+    prune.add_argument("--days", type=int, default=TOMBSTONE_RETENTION_DAYS)
+    prune.add_argument("--chunk-size", type=int, default=1000)
+    prune.set_defaults(func=tombstones_prune)
+
+    importer = commands.add_parser("import", help="Bulk import expenses, meals or funds from a CSV file")
+    importer.add_argument("group", help="Group id")
+    importer.add_argument("kind", choices=sorted(IMPORT_COLUMNS))
+    importer.add_argument("file")
+    importer.add_argument("--user", help="Member credited with the import in the group notification")
+    importer.add_argument("--dry-run", action="store_true", help="Validate the file without writing anything")
+    importer.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_ROWS)
+    importer.set_defaults(func=import_file)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
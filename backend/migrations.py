@@ -0,0 +1,260 @@
+"""Schema migrations.
+
+Migrations are applied in order and recorded in the schema_migrations table. A brand-new
+database gets the current schema straight from the models and is stamped as fully
+migrated; an existing database is brought forward one migration at a time.
+
+Data conversions run in batches with a commit per batch, so large tables never sit in one
+long transaction and an interrupted run can simply be started again.
+"""
+import datetime
+import logging
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, inspect, select, text, types
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+_PG_LOCK_ID = 46151  # arbitrary key for pg_advisory_lock
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", String),
+)
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def migrate(engine, metadata, batch_size=BATCH_SIZE):
+    """Bring the database up to date. Returns the names of the migrations applied."""
+    if is_current(engine, metadata):
+        return []
+    if engine.dialect.name != "postgresql":
+        # No lock connection held across the migration: a tuned SQLite engine has a single writer connection
+        return _migrate(engine, metadata, batch_size)
+    with engine.connect() as lock_conn:
+        # Several workers may boot at once; only one of them migrates
+        lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _PG_LOCK_ID})
+        try:
+            return _migrate(engine, metadata, batch_size)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _PG_LOCK_ID})
+            lock_conn.commit()
+
+
+def is_current(engine, metadata):
+    """Whether every table exists and every migration is recorded; two queries instead of a check per table."""
+    tables = set(inspect(engine).get_table_names())
+    if not tables >= set(metadata.tables) | {"schema_migrations"}:
+        return False
+    with engine.connect() as conn:
+        applied = {v for (v,) in conn.execute(select(schema_migrations.c.version))}
+    return applied >= {version for version, _, _ in MIGRATIONS}
+
+
+def _migrate(engine, metadata, batch_size):
+    fresh = not inspect(engine).has_table("users")
+    _meta.create_all(engine)
+    # Tables added since the database was created start out in their current shape
+    metadata.create_all(engine)
+
+    with engine.connect() as conn:
+        applied = {v for (v,) in conn.execute(select(schema_migrations.c.version))}
+
+    done = []
+    for version, name, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        if not fresh:
+            logger.info("Applying migration %s_%s", version, name)
+            fn(engine, metadata, batch_size)
+        with engine.begin() as conn:
+            conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.datetime.now().isoformat()))
+        done.append(f"{version:04d}_{name}")
+    return done
+
+
+def current_version(engine):
+    if not inspect(engine).has_table("schema_migrations"):
+        return 0
+    with engine.connect() as conn:
+        return conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc())).scalar() or 0
+
+
+# ----- HELPERS -----
+def convert_column(engine, table, column, ddl_type, is_converted, parse=None, key="id", batch_size=BATCH_SIZE):
+    """Retype a column in place: add a shadow column, backfill it, then swap it in.
+
+    With `parse` the backfill runs in keyset batches over `key`, converting values in Python
+    so unparseable legacy values become NULL instead of failing the migration. Without it the
+    whole column is copied with a single CAST, which is meant for small derived tables.
+    """
+    shadow = f"{column}__new"
+    columns = {c["name"]: c for c in inspect(engine).get_columns(table)}
+    if column in columns and shadow not in columns and is_converted(columns[column]["type"]):
+        return
+    if column not in columns:
+        # An earlier run stopped between dropping the old column and renaming the new one
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {shadow} TO {column}"))
+        return
+
+    if shadow not in columns:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {shadow} {ddl_type}"))
+
+    if parse is None:
+        with engine.begin() as conn:
+            conn.execute(text(f"UPDATE {table} SET {shadow} = CAST({column} AS {ddl_type})"))
+    else:
+        last = None
+        while True:
+            with engine.begin() as conn:
+                query = f"SELECT {key}, {column} FROM {table}"
+                if last is not None:
+                    query += f" WHERE {key} > :last"
+                rows = conn.execute(text(query + f" ORDER BY {key} LIMIT {int(batch_size)}"), {"last": last}).all()
+                if not rows:
+                    break
+                conn.execute(text(f"UPDATE {table} SET {shadow} = :value WHERE {key} = :key"), [{"value": parse(value), "key": row_key} for row_key, value in rows])
+            last = rows[-1][0]
+            logger.info("%s.%s: converted up to %s", table, column, last)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {shadow} TO {column}"))
+
+
+def add_column(engine, table, column, ddl_type):
+    if column not in {c["name"] for c in inspect(engine).get_columns(table)}:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def parse_date(value):
+    if value is None:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()[:10]
+    try:
+        return datetime.date.fromisoformat(str(value).strip()[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_money(value):
+    if value is None:
+        return None
+    try:
+        return str(Decimal(str(value)).quantize(Decimal("0.01")))
+    except InvalidOperation:
+        return None
+
+
+def is_date(column_type):
+    return isinstance(column_type, types.Date) and not isinstance(column_type, types.DateTime)
+
+
+def is_numeric(column_type):
+    return isinstance(column_type, types.Numeric) and not isinstance(column_type, types.Float)
+
+
+def create_indexes(engine, metadata, unique=False):
+    """Create the models' missing indexes. Those on columns a later migration adds are left for it to create.
+
+    Unique indexes are only created with `unique`, by the migration that first removes the duplicates.
+    """
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if {c.name for c in index.columns} <= columns and (unique or not index.unique):
+                index.create(bind=engine, checkfirst=True)
+
+
+# ----- MIGRATIONS -----
+@migration(1, "typed_ledger_columns")
+def typed_ledger_columns(engine, metadata, batch_size):
+    for table in ["expenses", "meals", "funds", "meal_requests"]:
+        convert_column(engine, table, "date", "DATE", is_date, parse_date, batch_size=batch_size)
+    for table in ["expenses", "funds"]:
+        convert_column(engine, table, "amount", "NUMERIC(12, 2)", is_numeric, parse_money, batch_size=batch_size)
+
+    # The ledgers are one row per group/member, small enough to cast in one statement
+    for column in ["total_bazar", "total_fixed", "total_expenses", "total_funds"]:
+        convert_column(engine, "group_ledgers", column, "NUMERIC(14, 2)", is_numeric)
+    for column in ["expense_credit", "funds"]:
+        convert_column(engine, "member_ledgers", column, "NUMERIC(14, 2)", is_numeric)
+
+
+@migration(2, "ledger_indexes")
+def ledger_indexes(engine, metadata, batch_size):
+    create_indexes(engine, metadata)
+
+
+@migration(3, "change_sequences")
+def change_sequences(engine, metadata, batch_size):
+    # Existing rows keep a NULL sequence: clients get them in their first, full sync
+    for table in ["expenses", "meals", "funds", "meal_requests", "group_roles"]:
+        add_column(engine, table, "change_seq", "INTEGER")
+    create_indexes(engine, metadata)
+
+
+@migration(4, "group_deletion")
+def group_deletion(engine, metadata, batch_size):
+    # purge_jobs, being new, is created from the models before migrations run
+    add_column(engine, "groups", "deleted_at", "VARCHAR")
+    # Notifications written before this have no group and stay when theirs is deleted
+    add_column(engine, "notifications", "group_id", "VARCHAR")
+    create_indexes(engine, metadata)
+
+
+@migration(5, "tombstone_retention")
+def tombstone_retention(engine, metadata, batch_size):
+    add_column(engine, "tombstones", "created_at", "VARCHAR")
+    add_column(engine, "group_ledgers", "pruned_seq", "INTEGER")
+    # Existing tombstones are as old as this migration as far as retention goes
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE tombstones SET created_at = :now WHERE created_at IS NULL"), {"now": datetime.datetime.now().isoformat()})
+    create_indexes(engine, metadata)
+
+
+@migration(6, "unique_memberships")
+def unique_memberships(engine, metadata, batch_size):
+    with engine.begin() as conn:
+        duplicates = conn.execute(text("SELECT user_id, group_id FROM user_groups GROUP BY user_id, group_id HAVING COUNT(*) > 1")).all()
+        for user_id, group_id in duplicates:
+            params = {"user_id": user_id, "group_id": group_id}
+            conn.execute(text("DELETE FROM user_groups WHERE user_id = :user_id AND group_id = :group_id"), params)
+            conn.execute(text("INSERT INTO user_groups (user_id, group_id) VALUES (:user_id, :group_id)"), params)
+            # The ledger counted the duplicate as a member
+            conn.execute(text("UPDATE group_ledgers SET member_count = (SELECT COUNT(*) FROM user_groups WHERE group_id = :group_id) WHERE group_id = :group_id"), params)
+        if duplicates:
+            logger.info("user_groups: removed duplicates of %s membership(s)", len(duplicates))
+        # Replaced by the unique index on the same columns
+        conn.execute(text("DROP INDEX IF EXISTS ix_user_groups_user_group"))
+    create_indexes(engine, metadata, unique=True)
+
+
+@migration(7, "money_cents")
+def money_cents(engine, metadata, batch_size):
+    # SQLite kept sub-cent digits the app used to write; PostgreSQL already rounded them to the column scale
+    groups = set()
+    with engine.begin() as conn:
+        for table in ["expenses", "funds"]:
+            groups |= {g for (g,) in conn.execute(text(f"SELECT DISTINCT group_id FROM {table} WHERE amount <> ROUND(amount, 2)"))}
+            conn.execute(text(f"UPDATE {table} SET amount = ROUND(amount, 2) WHERE amount <> ROUND(amount, 2)"))
+    if groups:
+        logger.warning("Rounded amounts to cents in %s group(s); run \"python manage.py ledger rebuild\" to bring their ledgers in line", len(groups))
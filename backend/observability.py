@@ -0,0 +1,262 @@
+"""Request metrics: per-route latency histograms, SQL statement counters and sampled profiling.
+
+MetricsMiddleware times every HTTP request and attributes the SQL statements it issued (counted
+through SQLAlchemy engine events) to its route. MetricsRegistry renders everything in the
+Prometheus text format.
+"""
+import contextvars
+import cProfile
+import datetime
+import functools
+import inspect
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.commit_seconds = 0.0
+        self.by_statement = Counter()
+        self.profiler = None
+
+    def repeated(self):
+        """The statement issued most often and how often, the usual sign of an N+1 pattern."""
+        return self.by_statement.most_common(1)[0] if self.by_statement else (None, 0)
+
+
+def instrument(engine, session_factory=None):
+    """Count statements and DB time of the request in progress; optionally commit time as well."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += time.perf_counter() - started
+            stats.by_statement[statement] += 1
+
+    if session_factory is not None:
+        # Spans the final flush and the COMMIT itself
+        @event.listens_for(session_factory, "before_commit")
+        def before_commit(session):
+            session.info["commit_started"] = time.perf_counter()
+
+        @event.listens_for(session_factory, "after_commit")
+        def after_commit(session):
+            started = session.info.pop("commit_started", None)
+            stats = _current.get()
+            if stats is not None and started is not None:
+                stats.commit_seconds += time.perf_counter() - started
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+def _labels(**labels):
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value):
+    return f"{value:.6f}" if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="hisab"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._requests = Counter()  # (method, route, status)
+        self._latency = defaultdict(lambda: _Histogram(LATENCY_BUCKETS))  # (method, route)
+        self._statements = defaultdict(lambda: _Histogram(STATEMENT_BUCKETS))
+        self._db_seconds = Counter()
+        self._commit_seconds = Counter()
+        self._n_plus_one = Counter()
+        self._gauges = []
+
+    def add_gauge(self, name, help_text, collect):
+        """Register a gauge read at scrape time; `collect` returns a number or [(labels dict, value), ...]."""
+        self._gauges.append((name, help_text, collect))
+
+    def observe(self, method, route, status, seconds, stats, n_plus_one):
+        key = (method, route)
+        with self._lock:
+            self._requests[(method, route, status)] += 1
+            self._latency[key].observe(seconds)
+            self._statements[key].observe(stats.statements)
+            self._db_seconds[key] += stats.db_seconds
+            self._commit_seconds[key] += stats.commit_seconds
+            if n_plus_one:
+                self._n_plus_one[key] += 1
+
+    def render(self):
+        p = self.prefix
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, help_text, histograms):
+            header(name, "histogram", help_text)
+            for (method, route), h in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {h.count}")
+                lines.append(f"{name}_sum{_labels(method=method, route=route)} {_number(h.total)}")
+                lines.append(f"{name}_count{_labels(method=method, route=route)} {h.count}")
+
+        def counter(name, help_text, values):
+            header(name, "counter", help_text)
+            for (method, route), value in sorted(values.items()):
+                lines.append(f"{name}{_labels(method=method, route=route)} {_number(value)}")
+
+        with self._lock:
+            header(f"{p}_http_requests_total", "counter", "HTTP requests by route and status.")
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(f"{p}_http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+            histogram(f"{p}_http_request_duration_seconds", "Request latency by route.", self._latency)
+            histogram(f"{p}_db_statements_per_request", "SQL statements issued per request.", self._statements)
+            counter(f"{p}_db_duration_seconds_total", "Time spent executing SQL statements.", self._db_seconds)
+            counter(f"{p}_db_commit_duration_seconds_total", "Time spent in session commits, final flush included.", self._commit_seconds)
+            counter(f"{p}_n_plus_one_requests_total", "Requests that repeated one SQL statement past the N+1 threshold.", self._n_plus_one)
+
+        for name, help_text, collect in self._gauges:
+            header(f"{p}_{name}", "gauge", help_text)
+            value = collect()
+            if isinstance(value, list):
+                for labels, v in value:
+                    lines.append(f"{p}_{name}{_labels(**labels)} {_number(v)}")
+            else:
+                lines.append(f"{p}_{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class ProfiledRoute(APIRoute):
+    """Runs sync endpoints under the request's profiler when the request was sampled.
+
+    cProfile only sees the thread it is enabled in, and sync endpoints run in the threadpool,
+    so the endpoint call itself is what gets profiled.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def profiled(endpoint):
+    @functools.wraps(endpoint)
+    def run(*args, **kwargs):
+        stats = _current.get()
+        if stats is None or stats.profiler is None:
+            return endpoint(*args, **kwargs)
+        return stats.profiler.runcall(endpoint, *args, **kwargs)
+    return run
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording every HTTP request in a MetricsRegistry.
+
+    Requests sent with `X-Debug-Timing: 1` get a Server-Timing header with the breakdown.
+    A `profile_sample_rate` share of requests runs under cProfile; profiles of those slower
+    than `profile_slow_ms` are written to `profile_dir`.
+    """
+
+    def __init__(self, app, registry, n_plus_one_threshold=10, profile_sample_rate=0.0, profile_slow_ms=500.0, profile_dir="profiles"):
+        self.app = app
+        self.registry = registry
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_slow_ms = profile_slow_ms
+        self.profile_dir = profile_dir
+        # cProfile can't run twice at once, so at most one request is profiled at a time
+        self._profiling = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        wants_timing = (b"x-debug-timing", b"1") in scope.get("headers", [])
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate and self._profiling.acquire(blocking=False):
+            stats.profiler = cProfile.Profile()
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if wants_timing:
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", self._server_timing(stats, time.perf_counter() - started).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            route = scope["route"].path if scope.get("route") is not None else "unmatched"
+            statement, repeats = stats.repeated()
+            n_plus_one = repeats >= self.n_plus_one_threshold
+            if n_plus_one:
+                logger.warning("Possible N+1 on %s %s: %s statements, one repeated %s times: %s", scope["method"], route, stats.statements, repeats, " ".join(statement.split())[:200])
+            self.registry.observe(scope["method"], route, str(status), elapsed, stats, n_plus_one)
+            if stats.profiler is not None:
+                self._finish_profile(stats.profiler, scope["method"], route, elapsed)
+
+    @staticmethod
+    def _server_timing(stats, elapsed):
+        app_seconds = max(elapsed - stats.db_seconds, 0.0)
+        return (f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.statements} statements", '
+                f"commit;dur={stats.commit_seconds * 1000:.2f}, app;dur={app_seconds * 1000:.2f}, total;dur={elapsed * 1000:.2f}")
+
+    def _finish_profile(self, profiler, method, route, elapsed):
+        try:
+            if elapsed * 1000 < self.profile_slow_ms:
+                return
+            os.makedirs(self.profile_dir, exist_ok=True)
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+            path = os.path.join(self.profile_dir, f"{datetime.datetime.now():%Y%m%dT%H%M%S%f}-{method}-{slug}.prof")
+            profiler.dump_stats(path)
+            logger.info("Slow request %s %s took %.0f ms; profile written to %s", method, route, elapsed * 1000, path)
+        finally:
+            self._profiling.release()
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+
+class Subscription:
+    def __init__(self, key, loop, maxsize):
+        self.key = key
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        # Set when messages had to be dropped; the consumer should resync from its cursor
+        self.overflowed = False
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broker:
+    """In-process pub/sub keyed by an id (e.g. user_id).
+
+    publish() may be called from any thread; messages are handed to each subscriber's event loop.
+    Only subscribers in this process are reached.
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, key):
+        subscription = Subscription(key, asyncio.get_running_loop(), self.maxsize)
+        with self._lock:
+            self._subscriptions[key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.key)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.key]
+
+    def publish(self, key, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(key, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, message)
+            except RuntimeError:
+                # The subscriber's loop is closed; it will be unsubscribed when its stream ends
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscriptions.values())
@@ -0,0 +1,75 @@
+"""Debt settlement in integer minor units (cents).
+
+Balances map a member id to what they get back (positive) or owe (negative), in cents.
+settle() returns the transfers that clear them, always paying the largest remaining debt
+to the largest remaining credit, so a group of n members needs at most n - 1 transfers.
+"""
+import heapq
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+
+def to_cents(amount):
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return cents / 100
+
+
+def settle(balances, cancel_exact=False):
+    """Return [(debtor, creditor, cents), ...] clearing `balances`.
+
+    With cancel_exact, a debtor and a creditor whose balances cancel exactly are paired first.
+    That usually saves transfers but can also break chains the plain pass would have closed, so
+    the plain result is kept whenever it is shorter. If the balances don't sum to zero the
+    difference stays unsettled on whichever side is larger; see unsettled().
+    """
+    transfers = _settle(balances, cancel_exact)
+    if cancel_exact:
+        plain = _settle(balances, False)
+        if len(plain) < len(transfers):
+            return plain
+    return transfers
+
+
+def _settle(balances, cancel_exact):
+    transfers = []
+    # Heap entries are (-remaining, id): largest amount first, ties broken by id
+    debtors = [(amount, uid) for uid, amount in balances.items() if amount < 0]
+    creditors = [(-amount, uid) for uid, amount in balances.items() if amount > 0]
+    if cancel_exact:
+        debtors, creditors = _cancel_exact(debtors, creditors, transfers)
+
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+    while debtors and creditors:
+        debt, debtor = heapq.heappop(debtors)
+        credit, creditor = heapq.heappop(creditors)
+        amount = min(debt, credit, key=abs)
+        transfers.append((debtor, creditor, -amount))
+        if debt != amount:
+            heapq.heappush(debtors, (debt - amount, debtor))
+        if credit != amount:
+            heapq.heappush(creditors, (credit - amount, creditor))
+    return transfers
+
+
+def unsettled(balances):
+    """Cents left over after settle(): positive if creditors are short, negative if debtors overpay."""
+    return sum(balances.values())
+
+
+def _cancel_exact(debtors, creditors, transfers):
+    by_amount = defaultdict(list)
+    for amount, uid in sorted(creditors, reverse=True):
+        by_amount[amount].append(uid)
+
+    remaining = []
+    for amount, uid in sorted(debtors):
+        matches = by_amount.get(amount)
+        if matches:
+            transfers.append((uid, matches.pop(), -amount))
+        else:
+            remaining.append((amount, uid))
+    return remaining, [(amount, uid) for amount, uids in by_amount.items() for uid in uids]
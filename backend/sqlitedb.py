@@ -0,0 +1,81 @@
+"""SQLite production profile: WAL, tuned pragmas and separate reader and writer connection pools.
+
+In WAL mode readers see the last committed state without waiting for a writer, but SQLite still allows
+only one writer at a time. Every write therefore goes through a pool of exactly one connection, where
+concurrent write transactions queue in order instead of failing with "database is locked". Reads come
+from their own pool of query_only connections.
+
+RoutingSession sends a session's reads to the reader pool until its transaction writes something. From
+then on, until commit or rollback, everything goes to the writer, so the transaction reads its own writes.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+
+def pragmas(busy_timeout_ms=5000, cache_mb=64):
+    """The pragmas every connection is opened with."""
+    return {
+        "busy_timeout": int(busy_timeout_ms),  # covers writers in other processes, e.g. manage.py
+        "synchronous": "NORMAL",  # in WAL mode, fsync at checkpoints instead of at every commit
+        "cache_size": -int(cache_mb) * 1024,  # negative means KiB rather than pages
+        "temp_store": "MEMORY",
+    }
+
+
+def is_file_database(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:") and url.query.get("mode") != "memory"
+
+
+def tune(engine, settings, readonly=False):
+    """Apply `settings` to each new connection of `engine` (sync or async). Writer connections also switch the file to WAL."""
+
+    @event.listens_for(getattr(engine, "sync_engine", engine), "connect")
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not readonly:
+            # Persistent in the database file; it takes effect for every connection
+            cursor.execute("PRAGMA journal_mode=WAL")
+        for name, value in settings.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            # A write routed to a reader fails loudly instead of bypassing the writer queue
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def create_engines(create, url, settings, **engine_options):
+    """Return (writer, reader) engines over one SQLite file, built with `create` (create_engine or create_async_engine).
+
+    The writer pool holds a single connection; the reader pool takes `engine_options` as they are.
+    """
+    writer = create(url, **{**engine_options, "pool_size": 1, "max_overflow": 0})
+    reader = create(url, **engine_options)
+    tune(writer, settings)
+    tune(reader, settings, readonly=True)
+    return writer, reader
+
+
+class RoutingSession(Session):
+    """A Session whose reads go to `reader` until its transaction writes; without a reader it is a plain Session."""
+
+    def __init__(self, *args, reader=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reader = reader
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.reader is None:
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["writing"] = True
+        if self.info.get("writing"):
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        return self.reader
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _end_writing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("writing", None)
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import { Home, Receipt, Utensils, Wallet, Users, User, Landmark, Archive, Bell } from 'lucide-react'
 import { PieChart, Pie, Cell, ResponsiveContainer, Tooltip } from 'recharts'
 import './index.css'
@@ -8,6 +8,9 @@ const API_BASE_URL = import.meta.env.VITE_API_URL ||
   (window.location.hostname === "localhost" || window.location.hostname === "127.0.0.1"
     ? "http://localhost:8000"
     : "https://vara-bhagabhagi-api.onrender.com");
+
+// Dashboard lists kept as a local copy of the group's rows, updated from /changes diffs
+const SYNCED_LISTS = { raw_expenses: 'expenses', meals: 'meals', funds: 'funds' };
 const ManagerMealBulkForm = ({ users, myGroup, existingMeals, onMealAdded, onShowToast }) => {
   const getDefaultDate = () => new Date().toISOString().split('T')[0];
 
@@ -59,14 +62,16 @@ const ManagerMealBulkForm = ({ users, myGroup, existingMeals, onMealAdded, onSho
     }
 
     try {
-      let successCount = 0;
-      for (const meal of toSave) {
-        const res = await fetch(`${API_BASE_URL}/api/groups/${myGroup.id}/meals`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify(meal)
-        });
-        if (res.ok) successCount++;
+      // One request and one transaction for the whole form
+      const res = await fetch(`${API_BASE_URL}/api/groups/${myGroup.id}/meals/batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ entries: toSave })
+      });
+      const result = res.ok ? await res.json() : null;
+      const successCount = result ? result.created + result.updated : 0;
+      if (result && result.errors > 0) {
+        onShowToast(`${result.errors} meal row(s) could not be saved.`, 'error');
       }
 
       if (successCount > 0) {
@@ -121,6 +126,7 @@ function App() {
   const [myGroup, setMyGroup] = useState(null);
   const [data, setData] = useState(null);
   const [loading, setLoading] = useState(false);
+  const syncRef = useRef({ groupId: null, seq: null, rows: {} });
   const [errorMsg, setErrorMsg] = useState('');
 
   // Toast System
@@ -176,9 +182,11 @@ function App() {
   // Report Form
   const [reportMonth, setReportMonth] = useState(new Date().getMonth());
   const [reportYear, setReportYear] = useState(new Date().getFullYear());
+  const [reportSettlements, setReportSettlements] = useState([]);
 
   // Notifications
   const [notifications, setNotifications] = useState([]);
+  const [unreadTotal, setUnreadTotal] = useState(0);
   const [showNotifications, setShowNotifications] = useState(false);
 
   // Meal Requests
@@ -207,9 +215,32 @@ function App() {
   const fetchDashboard = () => {
     if (!myGroup) return;
     setLoading(true);
-    fetch(`${API_BASE_URL}/api/groups/${myGroup.id}/dashboard`)
-      .then(res => res.json())
-      .then(d => {
+    const groupId = myGroup.id;
+    const sync = syncRef.current.groupId === groupId ? syncRef.current : { groupId, seq: null, rows: {} };
+    const since = sync.seq === null ? '' : `?since=${sync.seq}`;
+    // Totals come from the summary dashboard; only rows changed since the last refresh are downloaded
+    Promise.all([
+      fetch(`${API_BASE_URL}/api/groups/${groupId}/dashboard?details=false`).then(res => res.json()),
+      fetch(`${API_BASE_URL}/api/groups/${groupId}/changes${since}`).then(res => res.json()),
+    ])
+      .then(([d, changes]) => {
+        if (changes.full) sync.rows = {};
+        Object.values(SYNCED_LISTS).forEach(kind => {
+          const rows = sync.rows[kind] || (sync.rows[kind] = {});
+          changes[kind].forEach(row => { rows[row.id] = row; });
+          (changes.deleted[kind] || []).forEach(id => { delete rows[id]; });
+        });
+        sync.seq = changes.seq;
+        syncRef.current = sync;
+
+        // The dashboard lists the open period: rows dated after the last close
+        const openFrom = d.last_close ? d.last_close.end_date : null;
+        const names = Object.fromEntries(d.users.map(u => [u.user_id, u.name]));
+        Object.entries(SYNCED_LISTS).forEach(([key, kind]) => {
+          d[key] = Object.values(sync.rows[kind])
+            .filter(row => !openFrom || row.date > openFrom)
+            .map(row => ({ ...row, user: names[row.user_id] ?? row.user }));
+        });
         setData(d);
         setLoading(false);
       })
@@ -220,19 +251,39 @@ function App() {
   };
 
   const fetchNotifications = (userId) => {
-    fetch(`${API_BASE_URL}/api/users/${userId}/notifications`)
+    fetch(`${API_BASE_URL}/api/users/${userId}/inbox?limit=30`)
       .then(res => res.json())
-      .then(data => setNotifications(data))
+      .then(page => setNotifications(page.items))
       .catch(err => console.error("Error fetching notifications:", err));
+    fetch(`${API_BASE_URL}/api/users/${userId}/notifications/unread_count`)
+      .then(res => res.json())
+      .then(data => setUnreadTotal(data.unread))
+      .catch(err => console.error("Error fetching unread count:", err));
   };
 
   const markNotificationRead = (id) => {
     fetch(`${API_BASE_URL}/api/notifications/${id}/read`, { method: 'PUT' })
       .then(res => {
-        if (res.ok) setNotifications(prev => prev.map(n => n.id === id ? { ...n, is_read: true } : n));
+        if (res.ok) {
+          setNotifications(prev => prev.map(n => n.id === id ? { ...n, is_read: true } : n));
+          setUnreadTotal(prev => Math.max(prev - 1, 0));
+        }
       });
   };
 
+  const markAllNotificationsRead = () => {
+    fetch(`${API_BASE_URL}/api/users/${user.id}/notifications/read`, {
+      method: 'PUT',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ all: true })
+    }).then(res => {
+      if (res.ok) {
+        setNotifications(prev => prev.map(n => ({ ...n, is_read: true })));
+        setUnreadTotal(0);
+      }
+    });
+  };
+
   const fetchMealRequests = () => {
     if (myGroup) {
       fetch(`${API_BASE_URL}/api/groups/${myGroup.id}/meal_requests`)
@@ -247,15 +298,31 @@ function App() {
       fetchUserGroups(user.id);
       fetchPersonalCash(user.id);
     }
+  }, [user, currentView]);
+
+  useEffect(() => {
     if (user) {
       fetchNotifications(user.id);
-      // Auto-poll notifications every 10 seconds to solve "user can't got notification properly"
-      const intervalId = setInterval(() => {
-        fetchNotifications(user.id);
-      }, 10000);
-      return () => clearInterval(intervalId);
+      if (typeof EventSource === 'undefined') {
+        // Auto-poll notifications every 10 seconds to solve "user can't got notification properly"
+        const intervalId = setInterval(() => {
+          fetchNotifications(user.id);
+        }, 10000);
+        return () => clearInterval(intervalId);
+      }
+      // Server push; EventSource resumes from the last event id after a reconnect
+      const source = new EventSource(`${API_BASE_URL}/api/users/${user.id}/notifications/stream`);
+      source.addEventListener('notification', (e) => {
+        const notif = JSON.parse(e.data);
+        setNotifications(prev => {
+          if (prev.some(n => n.id === notif.id)) return prev;
+          if (!notif.is_read) setUnreadTotal(count => count + 1);
+          return [notif, ...prev];
+        });
+      });
+      return () => source.close();
     }
-  }, [user, currentView]);
+  }, [user]);
 
   useEffect(() => {
     if (myGroup && (currentView === 'dashboard' || currentView === 'expenses')) {
@@ -266,6 +333,17 @@ function App() {
     }
   }, [currentView, myGroup]);
 
+  useEffect(() => {
+    if (myGroup && currentView === 'archive') {
+      // The month's settlement plan is the server's, settled in whole cents like the dashboard's
+      const period = `${reportYear}-${String(Number(reportMonth) + 1).padStart(2, '0')}`;
+      fetch(`${API_BASE_URL}/api/groups/${myGroup.id}/dashboard?details=false&period=${period}`)
+        .then(res => res.json())
+        .then(d => setReportSettlements(d.settlements || []))
+        .catch(err => console.error("Error fetching report:", err));
+    }
+  }, [currentView, myGroup, reportMonth, reportYear, data]);
+
   const handleAuthSubmit = async (e) => {
     e.preventDefault();
     setErrorMsg('');
@@ -587,7 +665,7 @@ function App() {
   };
 
   const renderTopBar = () => {
-    const unreadCount = notifications.filter(n => !n.is_read).length;
+    const unreadCount = unreadTotal;
     return (
       <nav className="topbar glass">
         <div className="nav-brand" style={{ display: 'flex', alignItems: 'center', gap: '8px' }}>
@@ -612,7 +690,10 @@ function App() {
             </button>
             {showNotifications && (
               <div className="notifications-dropdown">
-                <h4 style={{ marginBottom: '1rem', borderBottom: '1px solid var(--glass-border)', paddingBottom: '0.5rem' }}>Notifications</h4>
+                <h4 style={{ marginBottom: '1rem', borderBottom: '1px solid var(--glass-border)', paddingBottom: '0.5rem', display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
+                  Notifications
+                  {unreadCount > 0 && <button className="btn-secondary" style={{ padding: '0.2rem 0.6rem', fontSize: '0.7rem' }} onClick={markAllNotificationsRead}>Mark All Read</button>}
+                </h4>
                 {notifications.length === 0 ? <p style={{ fontSize: '0.9rem', color: 'var(--text-muted)' }}>No new notifications.</p> : notifications.map(n => (
                   <div key={n.id} style={{ padding: '0.8rem', background: n.is_read ? 'rgba(255,255,255,0.05)' : 'rgba(139, 92, 246, 0.2)', borderLeft: n.is_read ? 'none' : '3px solid var(--primary)', borderRadius: '8px', marginBottom: '0.5rem', fontSize: '0.85rem' }}>
                     <p style={{ margin: 0, color: 'var(--text-main)' }}>{n.message}</p>
@@ -708,77 +789,8 @@ function App() {
     const tFunds = mFunds.reduce((sum, f) => sum + f.amount, 0);
     const tOverallCost = tBazar + tFixed;
 
-    // Build user balances for THIS month ONLY
-    let memberBalances = {};
-    data.users.forEach(u => memberBalances[u.user_id] = 0);
-
-    // Credits (Expenses paid directly by user this month)
-    mExpenses.forEach(e => {
-      if (memberBalances[e.user_id] !== undefined) memberBalances[e.user_id] += e.amount;
-    });
-
-    // Add direct fund deposits to user (they paid money to manager)
-    mFunds.forEach(f => {
-      if (memberBalances[f.user_id] !== undefined) memberBalances[f.user_id] += f.amount;
-      if (data.manager_id && memberBalances[data.manager_id] !== undefined) memberBalances[data.manager_id] -= f.amount;
-    });
-
-    if (data.group_type === 'smart_meal') {
-      // Debit for meals consumed
-      mMeals.forEach(m => {
-        const consumed = m.breakfast + m.lunch + m.dinner + m.guest_meal_count;
-        if (memberBalances[m.user_id] !== undefined) {
-          memberBalances[m.user_id] -= (consumed * mealRate);
-        }
-      });
-
-      // Debit for fixed expenses
-      if (data.users.length > 0) {
-        const ppFixed = tFixed / data.users.length;
-        data.users.forEach(u => {
-          memberBalances[u.user_id] -= ppFixed;
-        });
-      }
-    } else {
-      // Average cost subtraction
-      const totalCost = mExpenses.reduce((sum, e) => sum + e.amount, 0);
-      if (data.users.length > 0) {
-        const ppCost = totalCost / data.users.length;
-        data.users.forEach(u => {
-          memberBalances[u.user_id] -= ppCost;
-        });
-      }
-    }
-
     // Settlements specifically for this isolated month
-    let debtors = [];
-    let creditors = [];
-    Object.keys(memberBalances).forEach(uid => {
-      const bal = memberBalances[uid];
-      if (bal < -0.01) debtors.push({ user: uid, amount: Math.abs(bal) });
-      else if (bal > 0.01) creditors.push({ user: uid, amount: bal });
-    });
-
-    debtors.sort((a, b) => b.amount - a.amount);
-    creditors.sort((a, b) => b.amount - a.amount);
-
-    const mSettlements = [];
-    let i = 0, j = 0;
-    while (i < debtors.length && j < creditors.length) {
-      const debtor = debtors[i];
-      const creditor = creditors[j];
-      const settleAmt = Math.min(debtor.amount, creditor.amount);
-
-      const fromName = data.users.find(u => u.user_id === debtor.user)?.name || 'Unknown';
-      const toName = data.users.find(u => u.user_id === creditor.user)?.name || 'Unknown';
-
-      mSettlements.push({ from_name: fromName, to_name: toName, amount: settleAmt.toFixed(2) });
-
-      debtor.amount -= settleAmt;
-      creditor.amount -= settleAmt;
-      if (debtor.amount < 0.01) i++;
-      if (creditor.amount < 0.01) j++;
-    }
+    const mSettlements = reportSettlements;
 
     return (
       <div className="page-container glass" style={{ maxWidth: '900px' }}>
@@ -879,7 +891,7 @@ function App() {
           <p style={{ marginBottom: '1.5rem', color: 'var(--text-muted)' }}>শুধুমাত্র এই মাসের খরচের উপর ভিত্তি করে কে কাকে কত টাকা দিবে:</p>
           <div className="settlement-list">
             {mSettlements.length === 0 ? <p className="all-clear">All clear for this month! 🎉</p> : mSettlements.map((s, idx) => (
-              <div key={idx} className="settlement-item glow-on-hover"><span className="from">{s.from_name}</span><span className="arrow">💸 pays ➔</span><span className="to">{s.to_name}</span><span className="settlement-amount">{s.amount} BDT</span></div>
+              <div key={idx} className="settlement-item glow-on-hover"><span className="from">{s.from_name}</span><span className="arrow">💸 pays ➔</span><span className="to">{s.to_name}</span><span className="settlement-amount">{s.amount.toFixed(2)} BDT</span></div>
             ))}
           </div>
         </section>